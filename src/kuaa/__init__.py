@@ -28,6 +28,8 @@
 
 __version__ = '2.3'
 
+import os, json, threading
+from collections import OrderedDict
 from flask import Flask, url_for, render_template
 from flask_sqlalchemy import SQLAlchemy
 
@@ -40,6 +42,30 @@ app.config['SQLALCHEMY_BINDS'] = {
     'text':   'sqlite:///text.db'
 }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Signs the session cookie that identifies each browser's GUI instance.
+# Set MAINUMBY_SECRET_KEY so that cookies survive a restart.
+app.config['SECRET_KEY'] = os.environ.get('MAINUMBY_SECRET_KEY') or os.urandom(24)
+# Processes for translating whole documents ("Traducir todo"); 0 or 1 to
+# translate them in the request's process.
+app.config['DOC_TRANS_PROCS'] = int(os.environ.get('MAINUMBY_DOC_TRANS_PROCS', 0))
+# Process the sentences of documents entered by users only when they're
+# selected (set MAINUMBY_LAZY_DOCUMENTS=0 to process them all at once).
+app.config['LAZY_DOCUMENTS'] = os.environ.get('MAINUMBY_LAZY_DOCUMENTS', '1') != '0'
+# Most sentences in one request to /api/translate/batch
+app.config['API_BATCH_MAX'] = int(os.environ.get('MAINUMBY_API_BATCH_MAX', 1000))
+# Processes translating the sentences of queued jobs (/api/jobs)
+app.config['JOB_WORKERS'] = int(os.environ.get('MAINUMBY_JOB_WORKERS', 1))
+# /metrics answers only requests from this machine unless this is set.
+# Set MAINUMBY_METRICS_DIR so that the metrics of all processes are added up.
+app.config['METRICS_PUBLIC'] = os.environ.get('MAINUMBY_METRICS_PUBLIC') == '1'
+# Profile 1 in every PROFILE_SAMPLE /tra requests and any that take longer
+# than PROFILE_THRESHOLD seconds (0 for neither), keeping the newest
+# PROFILE_KEEP profiles in PROFILE_DIR.
+app.config['PROFILE_SAMPLE'] = int(os.environ.get('MAINUMBY_PROFILE_SAMPLE', 0))
+app.config['PROFILE_THRESHOLD'] = float(os.environ.get('MAINUMBY_PROFILE_THRESHOLD', 0))
+app.config['PROFILE_DIR'] = os.environ.get('MAINUMBY_PROFILE_DIR') or \
+    os.path.join(os.path.dirname(__file__), 'profiles')
+app.config['PROFILE_KEEP'] = int(os.environ.get('MAINUMBY_PROFILE_KEEP', 200))
 db = SQLAlchemy(app)
 
 import mbojereha
@@ -70,6 +96,24 @@ from .record import *
 from .text import *
 db.create_all()
 from .database import *
+TextDB.migrate()
+# Catalog, menu HTML, and document HTML of stored Texts.
+text_cache = TextCache()
+
+# Sentence translations shared by all users and processes.
+from .cache import TransCache, CACHE_PATH, lexicon_version
+trans_cache = TransCache(os.environ.get('MAINUMBY_TRANS_CACHE', CACHE_PATH))
+
+# Timers and counters for /metrics.
+from .metrics import METRICS
+
+# Human translations recorded in Memory files, read when first needed.
+from .tm import TMIndex, language_pair, match_case
+tm_index = TMIndex()
+
+# Users and the current Memory, read once and refreshed when their files change.
+session_manager = SessionManager()
+os.register_at_fork(after_in_child=session_manager.reset)
 
 ## Whether to create a session for the anonymous user when user doesn't log in.
 # USE_ANON = True
@@ -123,18 +167,30 @@ def doc_sentences(doc=None, textobj=None, text='', textid=-1,
 
 def doc_trans(doc=None, textobj=None, text='', textid=-1, docpath='',
               gui=None, src=None, targ=None, session=None, user=None,
-              terse=True):
+              terse=True, nprocs=0, use_tm=False):
     """
     Traducir todas las oraciones en un documento sin ofrecer opciones
     al usuario. O doc es una instancia de Documento o textobj es una instancia
-    de Text o un Documento es creado con text como contenido."""
+    de Text o un Documento es creado con text como contenido.
+    Si nprocs > 1, las oraciones se traducen en paralelo en nprocs procesos.
+    """
+    return list(doc_trans_iter(doc=doc, textobj=textobj, text=text,
+                               textid=textid, docpath=docpath, gui=gui,
+                               src=src, targ=targ, session=session, user=user,
+                               terse=terse, nprocs=nprocs, use_tm=use_tm))
+
+def doc_trans_iter(doc=None, textobj=None, text='', textid=-1, docpath='',
+                   gui=None, src=None, targ=None, session=None, user=None,
+                   terse=True, nprocs=0, use_tm=False):
+    """
+    Como doc_trans, pero genera la traducción de cada oración en cuanto esté
+    disponible.
+    """
     if not src and not targ:
         if gui:
             src = gui.source; targ = gui.target
         else:
             src, targ = mbojereha.Language.load_trans('spa', 'grn', bidir=False)
-    if not session:
-        session = make_session(src, targ, user, create_memory=True)
     if not doc:
         if docpath:
             doc = mbojereha.Document(src, targ, path=docpath)
@@ -147,22 +203,77 @@ def doc_trans(doc=None, textobj=None, text='', textid=-1, docpath='',
 #    sentences = doc if doc else sentences_from_text(textobj, textid, src, targ)
     if sentences:
 #        print("Traduciendo oraciones en documento...")
-        translations = []
+        if nprocs > 1:
+            # Each worker has its own session
+            yield from imap_trans(sentences, src, targ, nprocs, terse=terse,
+                                  use_tm=use_tm)
+            return
+        if not session:
+            session = make_session(src, targ, user, create_memory=True)
 #        doc = make_document(gui, text, html=False)
         for sentence in sentences:
-            translation = oración(src=src, targ=targ, sentence=sentence, session=session,
-                                  html=False, choose=True, return_string=True,
-                                  verbosity=0, terse=terse)
-            translations.append(translation)
-#        print("  traducciones {}".format(translations[:2]))
-        return translations
+            with METRICS.context(kind='doc'):
+                trans = oración(src=src, targ=targ, sentence=sentence,
+                                session=session, html=False, choose=True,
+                                return_string=True, use_tm=use_tm,
+                                verbosity=0, terse=terse)
+            yield trans
 #        return [s.final for s in seg_sentences]
-    return []
+
+## Traducción para otros programas (/api/translate), sin GUI
+
+def api_trans(texts, src=None, targ=None, segments=False, terse=True,
+              use_tm=False, nprocs=0):
+    """
+    Traducir oraciones (cadenas) sin GUI ni HTML, devolviendo para cada una
+    un dict con la traducción final ('final') y, si segments es True, sus
+    segmentos ('segments'). Todas usan la Memory de session_manager. Si
+    nprocs > 1 y no se piden segmentos, se traducen en paralelo.
+    """
+    if not src and not targ:
+        src, targ = load()
+    if nprocs > 1 and not segments:
+        return [{'final': final}
+                for final in imap_trans_texts(texts, src, targ, nprocs,
+                                              terse=terse, use_tm=use_tm)]
+    session = make_session(src, targ, None, create_memory=True)
+    results = []
+    with METRICS.context(kind='api'):
+        for text in texts:
+            results.append(api_sentence(text, src, targ, session, segments,
+                                        terse, use_tm))
+    return results
+
+def api_sentence(text, src, targ, session, segments, terse, use_tm):
+    """The dict for one sentence string returned by api_trans()."""
+    if not text.strip():
+        return {'final': '', 'segments': []} if segments else {'final': ''}
+    if not segments:
+        final = oración(text=text, src=src, targ=targ, session=session,
+                        html=False, choose=True, return_string=True,
+                        use_tm=use_tm, terse=terse)
+        return {'final': final}
+    solution = oración(text=text, src=src, targ=targ, session=session,
+                       html=False, choose=True, terse=terse)
+    # A Segmentation, or the Sentence if there isn't one
+    segs = getattr(solution, 'segments', None)
+    if segs is None:
+        return {'final': solution.original, 'segments': []}
+    return {'final': solution.final,
+            'segments': [segment_dict(seg) for seg in segs]}
+
+def segment_dict(segment):
+    """The parts of a Segment that are of use outside the GUI."""
+    return {'src': segment.token_str,
+            'tra': segment.translation,
+            'indices': list(segment.indices) if segment.indices else [],
+            'gname': segment.gname}
 
 ## Creación y traducción de oración, dentro o fuera de la aplicación web
 
 def gui_trans(gui, session=None, choose=False, return_string=False,
-              sentence=None, terse=True, verbosity=0):
+              sentence=None, terse=True, use_cache=True, use_tm=False,
+              verbosity=0):
     """
     Traducir oración (accesible en gui) y devuelve la oración marcada (HTML) con
     segmentos coloreados.
@@ -170,37 +281,89 @@ def gui_trans(gui, session=None, choose=False, return_string=False,
     return oración(sentence=sentence or gui.sentence, src=gui.source,
                    targ=gui.target, session=gui.session,
                    html=True, return_string=return_string, choose=choose,
-                   verbosity=verbosity, terse=terse)
+                   use_cache=use_cache, use_tm=use_tm, verbosity=verbosity,
+                   terse=terse)
+
+def tm_matches(sentence, src, targ, fuzzy=True, n=3):
+    """
+    Traducciones humanas registradas en la memoria para la oración (cadena)
+    de src a targ, como pares (similitud, TMEntry), las exactas primero.
+    """
+    pair = language_pair(src, targ)
+    exact = [(1.0, e) for e in tm_index.lookup(sentence, pair=pair)]
+    if not fuzzy or len(exact) >= n:
+        return exact[:n]
+    sources = {e.source for s, e in exact}
+    similar = [(s, e) for s, e in tm_index.fuzzy(sentence, n=n, pair=pair)
+               if e.source not in sources]
+    return (exact + similar)[:n]
 
 def oración(text='', src=None, targ=None, user=None, session=None,
             sentence=None, finalize=False,
             max_sols=3, translate=True, connect=True, generate=True,
             html=False, choose=False,
-            return_string=False, verbosity=0, terse=False):
+            return_string=False, use_cache=True, use_tm=False, verbosity=0,
+            terse=False):
     """
     Analizar y talvez también traducir una oración.
+    Si use_cache es True, las traducciones finales (choose y return_string)
+    y el HTML de los segmentos (html sin choose) se buscan primero en
+    trans_cache y se guardan allí.
+    Si use_tm es True y se pide la traducción final, se devuelve la
+    traducción humana más reciente de la misma oración entre las mismas
+    lenguas, si existe, con la mayúscula inicial de la oración.
+    El tiempo de cada etapa se registra en METRICS.
     """
     if not src and not targ:
         src, targ = Language.load_trans('spa', 'grn', bidir=False)
+    mode = 'choose' if choose else 'options'
+    if use_tm and translate and targ and choose and return_string:
+        original = sentence.original if sentence else text
+        matches = tm_index.lookup(original, pair=language_pair(src, targ))
+        if matches:
+            METRICS.inc('mainumby_cache_total', result='tm', mode=mode)
+            return match_case(matches[0].target, original)
+    cache_key = None
+    if use_cache and translate and targ and \
+       ((choose and return_string) or (html and not choose)):
+        cache_key = TransCache.key(sentence.original if sentence else text,
+                                   src, targ, choose=choose,
+                                   html=html and not choose,
+                                   terse=terse, max_sols=max_sols,
+                                   connect=connect, generate=generate,
+                                   finalize=finalize)
+        cached = trans_cache.get(cache_key)
+        METRICS.inc('mainumby_cache_total', mode=mode,
+                    result='miss' if cached is None else 'hit')
+        if cached is not None:
+            if choose:
+                return cached
+            # The Segment objects aren't cached, only their HTML.
+            return [], cached
     if not session:
         session = make_session(src, targ, user, create_memory=True)
-    s = mbojereha.Sentence.solve_sentence(src, targ, text=text, session=session,
-                                sentence=sentence,
-                                max_sols=max_sols, choose=choose,
-                                translate=translate,
-                                verbosity=verbosity, terse=terse)
-    segmentations = s.get_all_segmentations(translate=translate,
-                                            generate=generate,
-                                            agree_dflt=False, choose=choose,
-                                            finalize=finalize,
-                                            connect=connect, html=html,
-                                            terse=terse)
+    METRICS.inc('mainumby_sentences_total', mode=mode)
+    with METRICS.timer('mainumby_stage_seconds', stage='solve', mode=mode):
+        s = mbojereha.Sentence.solve_sentence(src, targ, text=text, session=session,
+                                    sentence=sentence,
+                                    max_sols=max_sols, choose=choose,
+                                    translate=translate,
+                                    verbosity=verbosity, terse=terse)
+    with METRICS.timer('mainumby_stage_seconds', stage='segment', mode=mode):
+        segmentations = s.get_all_segmentations(translate=translate,
+                                                generate=generate,
+                                                agree_dflt=False, choose=choose,
+                                                finalize=finalize,
+                                                connect=connect, html=html,
+                                                terse=terse)
     if choose:
         if segmentations:
             # there's already only one of these anyway
             segmentation = segmentations[0]
             # return the Segmentation
             if return_string:
+                if cache_key:
+                    trans_cache.put(cache_key, segmentation.final, src, targ)
                 return segmentation.final
             else:
                 return segmentation
@@ -213,22 +376,36 @@ def oración(text='', src=None, targ=None, user=None, session=None,
     elif html:
         if segmentations:
             segmentation = segmentations[0]
-            return segmentation.segments, segmentation.get_segment_html()
+            with METRICS.timer('mainumby_stage_seconds', stage='html', mode=mode):
+                seg_html = segmentation.get_segment_html()
+            if cache_key:
+                try:
+                    trans_cache.put(cache_key, seg_html, src, targ)
+                except (TypeError, ValueError):
+                    print("No se puede guardar HTML de {} en el caché".format(s))
+            return segmentation.segments, seg_html
         return [], s.get_html()
     elif segmentations:
         return segmentations
     return s
 
-def make_document(gui, text, html=False):
+def make_document(gui, text, html=False, lazy=None):
     """
     Create a Mainumby Document object with the source text, which
-    could be a word, sentence, or document.
+    could be a word, sentence, or document. If lazy is True (by default,
+    app.config['LAZY_DOCUMENTS']), it is a LazyDocument, whose sentences are
+    processed only when they are selected.
     """
     print("CREATING NEW Document INSTANCE.")
     session = gui.session
-    d = kuaa.Document(gui.source, gui.target, text, proc=True, session=session)
-    if html:
-        d.set_html()
+    if lazy is None:
+        lazy = app.config.get('LAZY_DOCUMENTS', True)
+    if lazy:
+        d = LazyDocument(gui.source, gui.target, text, session=session)
+    else:
+        d = kuaa.Document(gui.source, gui.target, text, proc=True, session=session)
+        if html:
+            d.set_html()
     gui.doc = d
     gui.init_doc()
 #    return d
@@ -243,26 +420,23 @@ def quit(session=None):
 #        session.quit()
     print("New items in session {} before committing: {}".format(db.session, db.session.new))
     db.session.commit()
+    # Make sure records queued for writing are on disk.
+    WRITER.flush()
 
 def make_session(source, target, user, create_memory=False, use_anon=True):
-    """Create an instance of the Session or Memory class for the given user."""
-    User.read_all()
-    if isinstance(user, str):
-        # Get the user from their username
-        user = mbojereha.User.users.get(user)
-    if use_anon and not user:
-        user = User.get_anon()
-    username = ''
-    if user:
-        username = user.username
-    if create_memory:
-        session = kuaa.Memory.recreate(user=username)
-    elif user:
-        session = kuaa.Session(source=source, target=target, user=user)
-    return session
+    """Get an instance of the Session or Memory class for the given user.
+    Users and the current Memory are kept by session_manager."""
+    return session_manager.session(source, target, user,
+                                   create_memory=create_memory,
+                                   use_anon=use_anon)
 
 ## DB functions
 
+# Human DB objects, detached, with usernames as keys; most recently used last
+HUMANS = OrderedDict()
+HUMANS_SIZE = 1000
+HUMANS_LOCK = threading.Lock()
+
 def make_dbtext(content, language,
                 name='', domain='Miscelánea', title='',
                 description='', segment=False):
@@ -279,33 +453,35 @@ def make_dbtext(content, language,
 
 def make_text(gui, textid):
     """Initialize with the Text object specified by textid."""
-    textobj = get_text(textid)
-    nsent = len(textobj.segments)
-    html, html_list = get_doc_text_html(textobj)
-    gui.init_text(textid, nsent, html, html_list)
+    html, html_list = get_text_html(textid)
+    gui.init_text(textid, len(html_list), html, html_list)
+
+def get_text_html(textid):
+    """The document HTML and list of sentence HTML for the Text with textid,
+    from text_cache if it's there."""
+    def make():
+        with METRICS.timer('mainumby_db_seconds', op='text_html'):
+            seghtml = [h for (h,) in db.session.query(TextSeg.html).\
+                       filter_by(text_id=textid).order_by(TextSeg.index)]
+        return doc_html(seghtml), seghtml
+    return text_cache.get(('doc', textid), make)
+
+def doc_html(seghtml):
+    return "<div id='doc'>" + ''.join(seghtml) + "</div>"
 
 def get_doc_text_html(text):
     if not text.segments:
         return
-    html = "<div id='doc'>"
     seghtml = [s.html for s in text.segments]
-    html += ''.join(seghtml)
-    html += "</div>"
-    return html, seghtml
+    return doc_html(seghtml), seghtml
 
 def sentences_from_text(text=None, textid=-1, source=None, target=None):
     """Get a list of sentences from the Text object."""
     if not text and textid == -1:
         return
-    text = text or get_text(textid)
-    sentences = []
-    for textseg in text.segments:
-        original = textseg.content
-        tokens = [tt.string for tt in textseg.tokens]
-        sentence = mbojereha.Sentence(original=original, tokens=tokens,
-                            language=source, target=target)
-        sentences.append(sentence)
-    return sentences
+    textid = text.id if text else textid
+    return [sentence_from_textseg(textseg, source, target)
+            for textseg in TextDB.get_segments(textid)]
 
 def sentence_from_textseg(textseg=None, source=None, target=None, textid=None,
                           oindex=-1):
@@ -316,12 +492,73 @@ def sentence_from_textseg(textseg=None, source=None, target=None, textid=None,
     CREATED WHEN THE Text OBJECT WAS CREATED IN THE DB.
     """
 #    print("Creating sentence from textseg, source={}".format(source))
-    textseg = textseg or get_text(textid).segments[oindex]
+    if not textseg:
+        with METRICS.timer('mainumby_db_seconds', op='textseg'):
+            textseg = TextDB.get_textseg(textid, oindex)
     original = textseg.content
-    tokens = [tt.string for tt in textseg.tokens]
+    tokens = textseg.tokens
     return mbojereha.Sentence(original=original, tokens=tokens, language=source,
                     target=target)
 
+def pretranslate(textids=None, src=None, targ=None, force=False):
+    """
+    Translate every TextSeg of the Texts with textids (all Texts by default),
+    storing the final translation and the segment HTML as TextSegTras for the
+    current lexicon version. TextSegs that already have one are skipped unless
+    force is True. Must be run within the app context.
+    """
+    if not src:
+        src, targ = load()
+    version = lexicon_version(src, targ)
+    session = make_session(src, targ, None, create_memory=True)
+    if textids is None:
+        textids = [id for (id,) in db.session.query(Text.id).all()]
+    ntrans = 0
+    for textid in textids:
+        print("Pretraduciendo texto {}".format(textid))
+        for textseg in TextDB.get_segments(textid, TextSeg.tras):
+            if not force and any(t.version == version for t in textseg.tras):
+                continue
+            # The options and no-options translations start from separate Sentences.
+            final = oración(sentence=sentence_from_textseg(textseg, src, targ),
+                            src=src, targ=targ, session=session, html=True,
+                            choose=True, return_string=True, use_tm=False,
+                            terse=True)
+            segs, seg_html = oración(sentence=sentence_from_textseg(textseg, src, targ),
+                                     src=src, targ=targ, session=session,
+                                     html=True, choose=False, terse=True)
+            try:
+                seg_html = json.dumps(seg_html, ensure_ascii=False)
+            except TypeError:
+                seg_html = None
+            # Translations for other versions are no longer any use.
+            textseg.tras.clear()
+            TextSegTra(textseg=textseg, version=version, final=final,
+                       seg_html=seg_html)
+            ntrans += 1
+        db.session.commit()
+    print("{} oraciones pretraducidas".format(ntrans))
+    return ntrans
+
+def start_pretranslation(**kwargs):
+    """Run pretranslate() in a background thread."""
+    def run():
+        with app.app_context():
+            pretranslate(**kwargs)
+    thread = threading.Thread(target=run, name='pretranslate', daemon=True)
+    thread.start()
+    return thread
+
+def get_pretranslation(textid, index, src, targ):
+    """
+    The TextSegTra for the TextSeg at index in the Text with textid and the
+    current lexicon version, or None.
+    """
+    with METRICS.timer('mainumby_db_seconds', op='pretranslation'):
+        return db.session.query(TextSegTra).join(TextSeg).\
+            filter(TextSeg.text_id == textid, TextSeg.index == index,
+                   TextSegTra.version == lexicon_version(src, targ)).first()
+
 def make_translation(text=None, textid=-1, accepted=None,
                      translation='', user=None):
     """
@@ -355,6 +592,7 @@ def create_human(form):
                   level=level)
     db.session.add(human)
     db.session.commit()
+    forget_human(human.username)
     return human
 
 def get_humans():
@@ -362,20 +600,42 @@ def get_humans():
     return db.session.query(Human).all()
 
 def get_human(username):
-    """Get the Human DB object with the given username."""
-    humans = db.session.query(Human).filter_by(username=username).all()
-    if humans:
-        if len(humans) > 1:
-            print("Advertencia: ¡{} usuarios con el nombre de usuario {}!".format(len(humans), username))
-        return humans[0]
+    """Get the Human DB object with the given username, from HUMANS if
+    it's there."""
+    with HUMANS_LOCK:
+        human = HUMANS.get(username)
+        if human:
+            HUMANS.move_to_end(username)
+    if not human:
+        human = db.session.query(Human).filter_by(username=username).first()
+        if not human:
+            return
+        # The cached copy belongs to no session; each caller gets its own.
+        db.session.expunge(human)
+        with HUMANS_LOCK:
+            HUMANS[username] = human
+            while len(HUMANS) > HUMANS_SIZE:
+                HUMANS.popitem(last=False)
+    return db.session.merge(human, load=False)
+
+def forget_human(username):
+    """Remove the Human with username from HUMANS."""
+    with HUMANS_LOCK:
+        HUMANS.pop(username, None)
 
 def get_domains_texts():
-    """Return a list of domains and associated texts and a dict of texts by id."""
+    """Return a list of domains and associated texts, from text_cache if
+    it's there."""
+    return text_cache.get('domains', make_domains_texts)
+
+def make_domains_texts():
+    """Return a list of domains and associated texts."""
     dom = dict([(d, []) for d in DOMAINS])
-    for text in db.session.query(Text).all():
-        d1 = text.domain
-        id = text.id
-        dom[d1].append((id, text.title))
+    # Only the columns needed, not the contents of the Texts
+    with METRICS.timer('mainumby_db_seconds', op='domains_texts'):
+        rows = db.session.query(Text.id, Text.domain, Text.title).all()
+    for id, d1, title in rows:
+        dom[d1].append((id, title))
     # Alphabetize text titles
     for texts in dom.values():
         texts.sort(key=lambda x: x[1])
@@ -388,6 +648,12 @@ def get_text(id):
     """Get the Text object with the given id."""
     return db.session.query(Text).get(id)
 
+# Documents entered in the GUI, processed a sentence at a time.
+from .document import LazyDocument
+
+# Translation of documents in parallel; imports functions above.
+from .parallel import imap_trans, imap_trans_texts
+
 ## Import views. This has to appear after the app is created.
 # views imports gui and various functions from .
 import kuaa.views
@@ -0,0 +1,204 @@
+#
+#   Mainumby: translation benchmarks.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Translates the texts in texts/ as oración() does, without the
+#    translation cache or memory, timing each stage separately: splitting
+#    the document into sentences, Sentence.solve_sentence(),
+#    get_all_segmentations(), and (with options) the segment HTML. Results
+#    are written as JSON, and compared with an earlier run to find
+#    regressions. Replaces the hand-made table in notes/speed.txt.
+
+import datetime, json, os, platform, resource, sys, time
+import mbojereha
+
+from . import __version__, load, make_session, lexicon_version
+from .text import TEXT_DIR, TEXT_EXT, DOCX_EXT
+from .utils import iter_paragraphs, PARA_SEP
+
+# The texts in notes/speed.txt
+TEXTS = ['pajarito', 'abejas', 'chaco']
+# Stages timed for each sentence
+STAGES = ['document', 'solve', 'segment', 'html']
+# Modes: translation without options, as in doc_trans(), or with options,
+# as for a sentence selected in the GUI
+MODES = ['doc', 'oración']
+# Relative increase in seconds per word (for a text or a stage) reported as a regression
+THRESHOLD = 0.1
+
+def text_path(name):
+    """The .txt or .docx file for name in TEXT_DIR, preferring .txt."""
+    for ext in (TEXT_EXT, DOCX_EXT):
+        path = os.path.join(TEXT_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+
+def all_texts():
+    """Names of all the texts in TEXT_DIR, except translations (*_grn)."""
+    names = {os.path.splitext(f)[0] for f in os.listdir(TEXT_DIR)
+             if f.endswith((TEXT_EXT, DOCX_EXT))}
+    return sorted(n for n in names if not n.endswith('_grn'))
+
+def peak_rss():
+    """Peak resident memory of this process, in KB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def bench_sentence(sentence, src, targ, session, mode, times):
+    """Translate sentence as oración() would in mode, adding the time each
+    stage takes to times."""
+    choose = mode == 'doc'
+    t0 = time.perf_counter()
+    s = mbojereha.Sentence.solve_sentence(src, targ, sentence=sentence,
+                                          session=session, max_sols=3,
+                                          choose=choose, translate=True,
+                                          verbosity=0, terse=True)
+    t1 = time.perf_counter()
+    segmentations = s.get_all_segmentations(translate=True, generate=True,
+                                            agree_dflt=False, choose=choose,
+                                            finalize=False, connect=True,
+                                            html=not choose, terse=True)
+    t2 = time.perf_counter()
+    if not choose:
+        if segmentations:
+            segmentations[0].get_segment_html()
+        else:
+            s.get_html()
+    t3 = time.perf_counter()
+    times['solve'] += t1 - t0
+    times['segment'] += t2 - t1
+    times['html'] += t3 - t2
+
+def bench_text(name, src, targ, session, mode='doc'):
+    """Translate the text with name in mode, returning its results."""
+    path = text_path(name)
+    if not path:
+        raise FileNotFoundError("No hay texto {} en {}".format(name, TEXT_DIR))
+    text = PARA_SEP.join(iter_paragraphs(path))
+    words = len(text.split())
+    times = dict.fromkeys(STAGES, 0.0)
+    t0 = time.perf_counter()
+    doc = mbojereha.Document(src, targ, text, proc=True, session=session)
+    times['document'] = time.perf_counter() - t0
+    for sentence in doc:
+        bench_sentence(sentence, src, targ, session, mode, times)
+    seconds = time.perf_counter() - t0
+    return {'name': name, 'words': words, 'sentences': len(doc),
+            'seconds': round(seconds, 3),
+            's_per_word': round(seconds / words, 5) if words else 0.0,
+            'sentences_per_s': round(len(doc) / seconds, 3) if seconds else 0.0,
+            'stages': {stage: round(t, 3) for stage, t in times.items()},
+            'peak_rss_kb': peak_rss()}
+
+def run(names=None, mode='doc', source='spa', target='grn', verbosity=1):
+    """Benchmark translating the texts with names (TEXTS by default),
+    returning a dict that can be saved as JSON."""
+    names = names or TEXTS
+    t0 = time.perf_counter()
+    src, targ = load(source, target)
+    load_seconds = time.perf_counter() - t0
+    session = make_session(src, targ, None, create_memory=True)
+    results = []
+    for name in names:
+        result = bench_text(name, src, targ, session, mode=mode)
+        if verbosity:
+            print("{:<20} {:>6} palabras {:>5} oraciones {:>8.2f} s  {:.4f} s/palabra".format(
+                name, result['words'], result['sentences'], result['seconds'],
+                result['s_per_word']))
+        results.append(result)
+    words = sum(r['words'] for r in results)
+    sentences = sum(r['sentences'] for r in results)
+    seconds = sum(r['seconds'] for r in results)
+    total = {'words': words, 'sentences': sentences, 'seconds': round(seconds, 3),
+             's_per_word': round(seconds / words, 5) if words else 0.0,
+             'sentences_per_s': round(sentences / seconds, 3) if seconds else 0.0,
+             'stages': {stage: round(sum(r['stages'][stage] for r in results), 3)
+                        for stage in STAGES}}
+    if verbosity:
+        print("{:<20} {:>6} palabras {:>5} oraciones {:>8.2f} s  {:.4f} s/palabra".format(
+            'Total', words, sentences, seconds, total['s_per_word']))
+    return {'version': __version__, 'lexicon': lexicon_version(src, targ),
+            'source': source, 'target': target, 'mode': mode,
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'machine': platform.machine(),
+            'load_seconds': round(load_seconds, 3), 'peak_rss_kb': peak_rss(),
+            'texts': results, 'total': total}
+
+def save(results, path):
+    with open(path, 'w', encoding='utf8') as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+def read(path):
+    with open(path, encoding='utf8') as file:
+        return json.load(file)
+
+def change(old, new):
+    """Relative change from old to new."""
+    return (new - old) / old if old else 0.0
+
+def compare(old, new, threshold=THRESHOLD):
+    """
+    Print how seconds per word, for each text in both runs and for each stage
+    overall, changed from results old to new. Returns the list of
+    regressions (changes greater than threshold), as strings.
+    """
+    if old.get('mode') != new.get('mode'):
+        print("Advertencia: modos diferentes ({} y {})".format(old.get('mode'), new.get('mode')))
+    if old.get('lexicon') != new.get('lexicon'):
+        print("Léxico cambiado: {} -> {}".format(old.get('lexicon'), new.get('lexicon')))
+    regressions = []
+    old_texts = {r['name']: r for r in old['texts']}
+    print("{:<20} {:>10} {:>10} {:>8}".format('s/palabra', 'antes', 'ahora', 'cambio'))
+    for result in new['texts']:
+        before = old_texts.get(result['name'])
+        if not before:
+            continue
+        delta = change(before['s_per_word'], result['s_per_word'])
+        print("{:<20} {:>10.5f} {:>10.5f} {:>+8.1%}".format(
+            result['name'], before['s_per_word'], result['s_per_word'], delta))
+        if delta > threshold:
+            regressions.append("{}: {:+.1%}".format(result['name'], delta))
+    # Stages compared per word, since the texts may differ
+    old_words = sum(old_texts[r['name']]['words'] for r in new['texts'] if r['name'] in old_texts)
+    new_words = sum(r['words'] for r in new['texts'] if r['name'] in old_texts)
+    for stage in STAGES:
+        before = sum(old_texts[r['name']]['stages'][stage] for r in new['texts'] if r['name'] in old_texts)
+        after = sum(r['stages'][stage] for r in new['texts'] if r['name'] in old_texts)
+        if not old_words or not new_words:
+            break
+        before /= old_words
+        after /= new_words
+        delta = change(before, after)
+        print("{:<20} {:>10.5f} {:>10.5f} {:>+8.1%}".format(stage, before, after, delta))
+        if delta > threshold:
+            regressions.append("{}: {:+.1%}".format(stage, delta))
+    delta = change(old.get('peak_rss_kb', 0), new.get('peak_rss_kb', 0))
+    print("{:<20} {:>10} {:>10} {:>+8.1%}".format('memoria (KB)', old.get('peak_rss_kb', 0),
+                                                  new.get('peak_rss_kb', 0), delta))
+    if regressions:
+        print("Regresiones (> {:.0%}): {}".format(threshold, ', '.join(regressions)))
+    return regressions
@@ -0,0 +1,202 @@
+#
+#   Mainumby: cache of sentence translations shared by all users.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Two tiers: an LRU dict in each process and a SQLite file
+#    shared by all processes. Keys include a hash of the language data
+#    files, so changes to the lexicons make old entries unreachable.
+# -- Values are stored as JSON rather than pickled. Rows have the language
+#    pair and lexicon version, and those of other versions of a pair are
+#    deleted the first time a process stores a value for it.
+# -- The lexicon version uses the language's own directory and warns if it
+#    has no data files.
+
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), 'trans_cache.db')
+# Entries kept in memory in each process
+MEMORY_SIZE = 5000
+# Subdirectories of a language's directory whose files affect translations
+LEXICON_DIRS = ['lex', 'grp', 'syn', 'fst', 'stat']
+
+# Lexicon versions, with tuples of language abbreviations as keys
+VERSIONS = {}
+
+# Columns of the SQLite table; a table without them is from an earlier
+# version of the cache and is dropped.
+COLUMNS = ['key', 'value', 'pair', 'version', 'time']
+
+def lexicon_version(*languages, recompute=False):
+    """
+    A hash of the names, sizes, and modification times of the data files of
+    the languages. Computed once for each combination of languages unless
+    recompute is True. A language without data files gets a warning, since
+    changes to its lexicons wouldn't invalidate cached translations.
+    """
+    abbrevs = tuple(l.abbrev for l in languages)
+    if not recompute and abbrevs in VERSIONS:
+        return VERSIONS[abbrevs]
+    h = hashlib.sha1()
+    for language in languages:
+        # Set by mbojereha.Language when it's created
+        directory = language.directory
+        nfiles = 0
+        for subdir in LEXICON_DIRS:
+            path = os.path.join(directory, subdir)
+            if not os.path.isdir(path):
+                continue
+            for name in sorted(os.listdir(path)):
+                stat = os.stat(os.path.join(path, name))
+                h.update("{}/{}:{}:{};".format(subdir, name, stat.st_size,
+                                               stat.st_mtime_ns).encode('utf8'))
+                nfiles += 1
+        if not nfiles:
+            print("Advertencia: no hay archivos de datos para {} en {}".format(language.abbrev, directory))
+    version = h.hexdigest()[:16]
+    VERSIONS[abbrevs] = version
+    return version
+
+def normalize(sentence):
+    """Collapse whitespace within the sentence string."""
+    return ' '.join(sentence.split())
+
+class TransCache:
+    """
+    Sentence translations, with keys made from the normalized sentence, the
+    languages, the lexicon version, and the options that affect the result.
+    """
+
+    def __init__(self, path=CACHE_PATH, size=MEMORY_SIZE):
+        # path is None for a cache only in memory
+        self.path = path
+        self.size = size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        # Connections can't be shared by threads or processes
+        self.local = threading.local()
+        # Language pairs whose entries for other lexicon versions have been deleted
+        self.purged = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return "<TransCache({}, {}/{})>".format(self.path, len(self.memory), self.size)
+
+    @staticmethod
+    def key(sentence, source, target, **options):
+        """
+        Key for the sentence string translated from source to target with
+        options (choose, terse, max_sols, etc.).
+        """
+        version = lexicon_version(source, target)
+        data = [normalize(sentence), source.abbrev, target.abbrev, version,
+                sorted(options.items())]
+        return hashlib.sha1(json.dumps(data, ensure_ascii=False).encode('utf8')).hexdigest()
+
+    def connection(self):
+        """The SQLite connection for this thread, created if necessary."""
+        pid = os.getpid()
+        conn = getattr(self.local, 'conn', None)
+        if conn and self.local.pid == pid:
+            return conn
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(trans)")]
+        if columns and columns != COLUMNS:
+            with conn:
+                conn.execute("DROP TABLE trans")
+        conn.execute("CREATE TABLE IF NOT EXISTS trans (key TEXT PRIMARY KEY, value TEXT, "
+                     "pair TEXT, version TEXT, time REAL)")
+        self.local.conn = conn
+        self.local.pid = pid
+        return conn
+
+    def get(self, key):
+        """The cached value for key or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+        value = None
+        if self.path:
+            row = self.connection().execute("SELECT value FROM trans WHERE key = ?",
+                                            (key,)).fetchone()
+            if row:
+                value = json.loads(row[0])
+                self.remember(key, value)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value, source, target):
+        """
+        Store value for key, made with TransCache.key() for languages source
+        and target, in both tiers. value must be JSON serializable; if it
+        isn't, TypeError is raised and nothing is stored.
+        """
+        data = json.dumps(value, ensure_ascii=False)
+        self.remember(key, value)
+        if self.path:
+            pair = "{}-{}".format(source.abbrev, target.abbrev)
+            version = lexicon_version(source, target)
+            if pair not in self.purged:
+                self.purge(pair, version)
+            conn = self.connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO trans VALUES (?, ?, ?, ?, ?)",
+                             (key, data, pair, version, time.time()))
+
+    def purge(self, pair, version):
+        """Delete the entries for the language pair that aren't for version."""
+        conn = self.connection()
+        with conn:
+            n = conn.execute("DELETE FROM trans WHERE pair = ? AND version != ?",
+                             (pair, version)).rowcount
+        if n:
+            print("Borradas {} traducciones de versiones anteriores de {}".format(n, pair))
+        self.purged.add(pair)
+
+    def remember(self, key, value):
+        """Store value for key in the memory tier."""
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.size:
+                self.memory.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries from both tiers."""
+        with self.lock:
+            self.memory.clear()
+        if self.path:
+            conn = self.connection()
+            with conn:
+                conn.execute("DELETE FROM trans")
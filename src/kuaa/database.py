@@ -27,12 +27,112 @@
 
 # 2019.08.19
 # -- Created (but not used for anything)
+# 2026.10
+# -- TextDB.migrate(): schema changes to existing DBs that db.create_all()
+#    doesn't make (it only creates missing tables).
+# -- TextDB.get_textseg() and TextDB.get_segments(), which loads a Text's
+#    TextSegs in a fixed number of queries.
+# -- Migrations may be functions. TextTok rows are packed into TextSeg.toks.
+# -- TextCache: things made from the stored Texts (the catalog, menu and
+#    document HTML), kept until Texts or TextSegs are added or deleted.
 
+import json, threading, time
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from .text import *
 
+# Seconds between checks of whether Texts have changed
+TEXT_CACHE_CHECK_INTERVAL = 1.0
+
+# (name, table, SQL or function of a connection) for each migration, applied
+# in order. Each must do nothing if it has already been applied.
+MIGRATIONS = [
+    ('ix_humans_username', 'humans',
+     "CREATE UNIQUE INDEX IF NOT EXISTS ix_humans_username ON humans (username)"),
+    ('ix_textsegs_text_id_index', 'textsegs',
+     'CREATE INDEX IF NOT EXISTS ix_textsegs_text_id_index ON textsegs (text_id, "index")'),
+    ('ix_texttoks_textseg_id_index', 'texttoks',
+     'CREATE INDEX IF NOT EXISTS ix_texttoks_textseg_id_index ON texttoks (textseg_id, "index")'),
+    ('ix_trasegs_translation_id', 'trasegs',
+     "CREATE INDEX IF NOT EXISTS ix_trasegs_translation_id ON trasegs (translation_id)"),
+    ('textsegs_toks', 'textsegs',
+     "ALTER TABLE textsegs ADD COLUMN toks VARCHAR"),
+    ('pack_texttoks', 'texttoks',
+     lambda conn: TextDB.pack_texttoks(conn)),
+]
+
 class TextDB:
     """Container for text database functions."""
 
+    @staticmethod
+    def get_engine():
+        return db.get_engine(bind='text')
+
+    @staticmethod
+    def migrate():
+        """Apply the MIGRATIONS to the text DB."""
+        engine = TextDB.get_engine()
+        with engine.begin() as conn:
+            tables = {r[0] for r in conn.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+            for name, table, sql in MIGRATIONS:
+                if table not in tables:
+                    continue
+                check = getattr(TextDB, 'check_' + name, None)
+                if check and not check(conn):
+                    continue
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(db.text(sql))
+
+    @staticmethod
+    def check_ix_humans_username(conn):
+        """A unique index can't be created if usernames are repeated."""
+        repeated = conn.execute(db.text("SELECT username FROM humans GROUP BY username HAVING count(*) > 1")).fetchall()
+        if repeated:
+            print("Advertencia: nombres de usuario repetidos: {}; no se crea el índice".format(', '.join(r[0] for r in repeated)))
+            return False
+        return True
+
+    @staticmethod
+    def check_textsegs_toks(conn):
+        columns = [r[1] for r in conn.execute(db.text("PRAGMA table_info(textsegs)"))]
+        return 'toks' not in columns
+
+    @staticmethod
+    def pack_texttoks(conn):
+        """
+        Store the tokens of each TextSeg that has TextToks as a JSON list in
+        TextSeg.toks and delete the TextToks.
+        """
+        rows = conn.execute(db.text('SELECT textseg_id, string FROM texttoks ORDER BY textseg_id, "index"')).fetchall()
+        if not rows:
+            return
+        tokens = {}
+        for textseg_id, string in rows:
+            tokens.setdefault(textseg_id, []).append(string)
+        conn.execute(db.text("UPDATE textsegs SET toks = :toks WHERE id = :id"),
+                     [{'id': id, 'toks': json.dumps(toks, ensure_ascii=False)}
+                      for id, toks in tokens.items()])
+        conn.execute(db.text("DELETE FROM texttoks"))
+        print("Migración: tokens de {} segmentos ({} filas de texttoks)".format(len(tokens), len(rows)))
+
+    @staticmethod
+    def get_textseg(textid, index):
+        """The TextSeg at index in the Text with textid."""
+        return db.session.query(TextSeg).\
+            filter_by(text_id=textid, index=index).first()
+
+    @staticmethod
+    def get_segments(textid, *load):
+        """
+        The TextSegs of the Text with textid, in order, with any relationships
+        in load (like TextSeg.tras) already loaded, each in one more query.
+        """
+        options = [selectinload(rel) for rel in load]
+        return db.session.query(TextSeg).options(*options).\
+            filter_by(text_id=textid).order_by(TextSeg.index).all()
+
     @staticmethod
     def align(translation):
         """
@@ -52,6 +152,64 @@ class TextDB:
                 text_trans.append((textseg.content, traseg.content))
         return text_trans
 
+class TextCache:
+    """
+    Values computed from the Texts in the DB, with keys like 'menu' or
+    ('doc', textid). All are discarded when the DB's stamp changes: the number
+    of Texts and the highest Text and TextSeg ids, so additions and deletions
+    by any process are noticed. The stamp is checked at most every
+    check_interval seconds.
+    """
+
+    def __init__(self, check_interval=TEXT_CACHE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.stamp = None
+        self.last_check = 0.0
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return "<TextCache({}, {})>".format(self.stamp, len(self.values))
+
+    @staticmethod
+    def get_stamp():
+        ntexts, maxtext = db.session.query(func.count(Text.id), func.max(Text.id)).one()
+        maxseg = db.session.query(func.max(TextSeg.id)).scalar()
+        return ntexts, maxtext, maxseg
+
+    def check(self):
+        """Discard the values if the stamp has changed; return the stamp."""
+        now = time.time()
+        if now - self.last_check < self.check_interval:
+            return self.stamp
+        stamp = TextCache.get_stamp()
+        with self.lock:
+            self.last_check = now
+            if stamp != self.stamp:
+                self.values.clear()
+                self.stamp = stamp
+        return stamp
+
+    def get(self, key, make):
+        """The value for key, calling make() to compute it if it's not there."""
+        stamp = self.check()
+        with self.lock:
+            if key in self.values:
+                return self.values[key]
+        value = make()
+        with self.lock:
+            # Don't keep a value made from DB contents that have since changed.
+            if stamp == self.stamp:
+                self.values[key] = value
+        return value
+
+    def clear(self):
+        """Discard everything, for changes made in this process."""
+        with self.lock:
+            self.values.clear()
+            self.stamp = None
+            self.last_check = 0.0
+
 ### Various utility functions for DB classes
 
 def db_serialize_class(klass):
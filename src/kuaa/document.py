@@ -0,0 +1,93 @@
+#
+#   Mainumby: documents whose sentences are processed when first needed.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. LazyDocument stands in for a Document made with proc=True in
+#    the GUI: only sentence splitting and tokenization happen when it is
+#    created; each sentence is processed the first time it is selected.
+# -- A sentence whose text doesn't process into exactly one sentence is left
+#    as it is, with a warning.
+
+import threading
+import mbojereha
+
+from .utils import oradoc_html
+
+class LazyDocument:
+    """
+    A document split into Sentences that haven't been processed. doc[i]
+    processes sentence i (once) and returns the result; iterating gives each
+    sentence as it is, processed or not, which is enough for translating it
+    or getting its original text.
+    """
+
+    def __init__(self, source, target, text, session=None):
+        self.source = source
+        self.target = target
+        self.session = session
+        # Sentence splitting and tokenization only
+        self.sentences = list(mbojereha.Document(source, target, text, proc=False))
+        # Indices of sentences already processed
+        self.processed = set()
+        self.lock = threading.Lock()
+        self.html_list = [oradoc_html(index, sentence.original)
+                          for index, sentence in enumerate(self.sentences)]
+        self.html = "<div id='doc'>" + ''.join(self.html_list) + "</div>"
+
+    def __repr__(self):
+        return "<LazyDocument({}/{})>".format(len(self.processed), len(self.sentences))
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def __iter__(self):
+        return iter(self.sentences)
+
+    def __getitem__(self, index):
+        """The Sentence at index, processed."""
+        with self.lock:
+            if index < 0:
+                index += len(self.sentences)
+            if index not in self.processed:
+                self.sentences[index] = self.process(self.sentences[index])
+                self.processed.add(index)
+            return self.sentences[index]
+
+    def process(self, sentence):
+        """Process the sentence as Document(proc=True) would have."""
+        doc = mbojereha.Document(self.source, self.target, sentence.original,
+                                 proc=True, session=self.session)
+        if len(doc) == 1:
+            return doc[0]
+        # On its own, the sentence's text was split differently; keeping it
+        # unprocessed is better than losing part of it.
+        print("Advertencia: la oración '{}' da {} oraciones al procesarla; queda sin procesar".format(
+            sentence.original, len(doc)))
+        return sentence
+
+    def set_html(self):
+        """The HTML is made when the document is; here for compatibility with Document."""
+        pass
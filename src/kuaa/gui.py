@@ -26,24 +26,103 @@
 # Created 2019.03.23
 #
 # class for storing variables needed in views.py
+# 2026.10
+# -- GUIStore: one GUI instance per browser session, in LRU order.
+# -- The text menu HTML is made once and kept in text_cache.
+# -- The document HTML with the selected sentence is only made when a
+#    whole page needs it; /oradoc sends just the changed sentences.
+# -- AcceptedText: the accepted translations of a document's sentences,
+#    joined a paragraph at a time, so accepting a sentence only rejoins its
+#    paragraph.
+# -- GUIStore evicts idle GUI instances in a thread of its own, which also
+#    calls on_evict, so requests don't wait for evicted sessions to end.
 
-import re
+import os, re, threading, time
+from collections import OrderedDict
 
 from .utils import clean_sentence
 
 from .record import SentRecord
 
-from . import get_domains_texts
+from . import get_domains_texts, text_cache
 
 # the database class bound to the current app
 from . import db, make_translation, make_dbtext
 
+# Maximum number of live GUI instances in a GUIStore
+GUI_STORE_SIZE = 200
+# Seconds a GUI instance can go unused before it is evicted
+GUI_STORE_TIMEOUT = 3600
+# Seconds between checks for idle GUI instances
+GUI_EVICT_INTERVAL = 60
+
+# HTML for the selected sentence in a document, with its segments
+SELECTED_HTML = "<div id='ora{0}'>{1}</div>"
+# Marks the end of a paragraph in sentences and their translations
+PARA_MARK = "¶"
+# Sentences grouped together by AcceptedText when there are no paragraph marks
+ACCEPTED_BLOCK = 20
+
+class AcceptedText:
+    """
+    String concatenating the accepted translations of the sentences in a
+    document. The sentences are grouped by the paragraphs of the source
+    document; the string for a paragraph is remade only when one of its
+    sentences is accepted, and the whole string only when it's needed.
+    """
+
+    def __init__(self, para_ends):
+        """para_ends: for each sentence, whether it ends a paragraph in the source."""
+        # (paragraph, position in paragraph) for each sentence
+        self.positions = []
+        # Strings for the sentences in each paragraph
+        self.paras = [[]]
+        marked = any(para_ends)
+        for index, end in enumerate(para_ends):
+            para = self.paras[-1]
+            self.positions.append((len(self.paras) - 1, len(para)))
+            para.append('')
+            if end or (not marked and len(para) == ACCEPTED_BLOCK):
+                self.paras.append([])
+        self.para_strings = [''] * len(self.paras)
+        self.string = ''
+
+    def __repr__(self):
+        return "<AcceptedText({})>".format(len(self.positions))
+
+    def __str__(self):
+        if self.string is None:
+            self.string = ''.join(self.para_strings).strip()
+        return self.string
+
+    @staticmethod
+    def sentence_string(trans):
+        """The translation of a sentence as it appears in the document."""
+        if not trans:
+            return ''
+        if trans[-1] == PARA_MARK:
+            # New paragraph after this sentence
+            # Replace the ¶ with a newline
+            return trans.replace(PARA_MARK, "\n")
+        return trans + " "
+
+    def accept(self, index, trans):
+        """Make trans the accepted translation of the sentence at index."""
+        p, i = self.positions[index]
+        self.paras[p][i] = AcceptedText.sentence_string(trans)
+        self.para_strings[p] = ''.join(self.paras[p])
+        self.string = None
+
+
 class GUI:
 
     # Compiled regexs for sentence cleaning
     clean_n = re.compile(r"\s+([.,;:?!)”″’%¶])")
 
     def __init__(self, list_texts=False):
+        # Held while a request is using this instance, so that two requests
+        # from the same browser don't interleave
+        self.lock = threading.RLock()
         self.session = None
         self.user = None
         self.users_initialized = False
@@ -73,6 +152,8 @@ class GUI:
         self.doc_tra_acep = []
         # String concatenating accepted sentences
         self.doc_tra_acep_str = ''
+        # AcceptedText that the string is made from
+        self.doc_tra_text = None
         # Index of current sentence
         self.sindex = -1
         # SENTENCE
@@ -88,6 +169,8 @@ class GUI:
         self.tra_seg_html = None
         # Translation of the current sentence
         self.tra = None
+        # (similarity, TMEntry) pairs for human translations of similar sentences
+        self.tm_matches = []
         # TOGGLES: isdoc, nocorr, ocultar, sinopciones
         self.props = {}
         # Default
@@ -106,6 +189,7 @@ class GUI:
         self.doc_select_html = [""] * nsent
         self.doc_html = self.doc.html
         self.doc_html_list = self.doc.html_list
+        self.init_accepted()
         self.props['isdoc'] = True
         self.props['tfuente'] = "100%" if nsent > 1 else "115%"
 
@@ -126,9 +210,16 @@ class GUI:
         self.text_html = html
         # List of HTML for each source sentence
         self.doc_html_list = html_list
+        self.init_accepted()
         self.props['isdoc'] = True
         self.props['tfuente'] = "100%" if nsent > 1 else "115%"
 
+    def init_accepted(self):
+        """Start the AcceptedText for the document, with the paragraphs
+        marked in the HTML for its sentences."""
+        self.doc_tra_text = AcceptedText([PARA_MARK in html for html in self.doc_html_list])
+        self.doc_tra_acep_str = ''
+
     def doc_unselect_sent(self):
         # Revert to version of doc html with nothing segmented.
         if self.has_text:
@@ -136,17 +227,37 @@ class GUI:
         else:
             self.doc_html = self.doc.html
 
+    @property
+    def doc_html(self):
+        """HTML for the source document, with the selected sentence (if any)
+        shown with its segments."""
+        if self.doc_selection:
+            return self.select_doc_html(*self.doc_selection)
+        return self.base_doc_html
+
+    @doc_html.setter
+    def doc_html(self, html):
+        self.base_doc_html = html
+        self.doc_selection = None
+
     def update_doc(self, index, choose=False, repeat=False):
         if repeat or choose:
             current_fue = self.doc_select_html[index]
         else:
             current_fue = self.fue_seg_html
 #        print("Updating doc, current src {}".format(current_fue))
-        self.doc_html = self.select_doc_html(index, current_fue)
+        # The whole document's HTML is made only when it's needed.
+        self.doc_selection = (index, current_fue)
         if not repeat:
             self.doc_select_html[index] = current_fue
         self.sindex = index
 
+    def selected_sentence_html(self):
+        """HTML for the selected sentence, or None if there isn't one."""
+        if self.doc_selection:
+            index, shtml = self.doc_selection
+            return SELECTED_HTML.format(index, shtml)
+
     def select_doc_html(self, index, shtml):
         """
         Replace the indexed element in html_list with one for the selected
@@ -154,7 +265,7 @@ class GUI:
         """
         html = "<div id='doc'>"
         html_list = self.doc_html_list[:]
-        html_list[index] = shtml
+        html_list[index] = SELECTED_HTML.format(index, shtml)
         html += "".join(html_list) + "</div>"
         return html
 
@@ -168,31 +279,26 @@ class GUI:
         self.doc_tra_acep[index] = trans
 #        print("+++New doctrans: {}".format(self.doc_tra_acep))
         # Return a string concatenating all accepted translations
-        self.doc_tra_acep_str = self.stringify_doc_tra()
+        self.doc_tra_acep_str = self.stringify_doc_tra(index)
 #        "\n".join([t for t in self.doc_tra_acep if t]).strip()
         self.doc_unselect_sent()
         print("+++New trans string: {}".format(self.doc_tra_acep_str))
         self.props['tfuente'] = "100%"
 
-    def stringify_doc_tra(self):
+    def stringify_doc_tra(self, index=None):
         """
         Create a string representation of the currently accepted sentence translations.
-        Probably need to make the more efficient by saving series of consecutive sentences
-        that have already been stringified.
+        If index is given, only the translation of that sentence has changed,
+        so only its paragraph is joined again.
         """
-        string = ''
-        for sent_trans in self.doc_tra_acep:
-            if not sent_trans:
-                continue
-            if "¶" == sent_trans[-1]:
-#                print("Paragraph in {}".format(sent_trans))
-                # New paragraph after this sentence
-                # Replace the ¶ with a newline
-                sent_trans = sent_trans.replace("¶", "\n")
-            else:
-                sent_trans += " "
-            string += sent_trans
-        return string.strip()
+        if index is None or not self.doc_tra_text:
+            self.init_accepted()
+            for i, trans in enumerate(self.doc_tra_acep):
+                if trans:
+                    self.doc_tra_text.accept(i, trans)
+        else:
+            self.doc_tra_text.accept(index, self.doc_tra_acep[index])
+        return str(self.doc_tra_text)
 
     def init_sent(self, index, choose=False, isdoc=False, trans='', source=''):
         """What happens after a sentence has been translated."""
@@ -243,6 +349,7 @@ class GUI:
 #            sentrec = self.sentence.record
         self.tra_seg_html = None
         self.sentence = None
+        self.tm_matches = []
         if not abandonar:
             self.has_text = False
 #        if not tradtodo:
@@ -253,6 +360,7 @@ class GUI:
         self.doc_tra_html = []
         self.doc_tra = []
         self.doc_tra_acep_str = ''
+        self.doc_tra_text = None
         self.doc_select_html = []
         self.props['isdoc'] = isdoc
         self.props['tfuente'] = "100%" if isdoc else "115%"
@@ -276,17 +384,140 @@ class GUI:
     def set_domains_texts(self):
         """HTML for a menu listing Text docs available, grouped by domain.
         domain_texts is list of (domain, (id, title)) pairs."""
+        self.text_select_html = text_cache.get('menu', GUI.make_domains_texts_html)
+
+    @staticmethod
+    def make_domains_texts_html():
         domain_texts = get_domains_texts()
-        html = "<div class='desplegable-derecha' id='textos'>"
+        html = ["<div class='desplegable-derecha' id='textos'>"]
         for dindex, (domain, texts) in enumerate(domain_texts):
             if not texts:
                 # no texts for this domain
-                html += "<div id='button{}' class='despleg-derecha'>{}</div>".format(dindex, domain)
+                html.append("<div id='button{}' class='despleg-derecha'>{}</div>".format(dindex, domain))
             else:
-                html += "<div onclick=\"desplegarDerecha('despleg{}', 'button{}')\" id='button{}' class='despleg-derecha' style='cursor:context-menu'>{} ▸</div>".format(dindex, dindex, dindex, domain)
-                html += "<div id='despleg{}' class='textos-desplegable'>".format(dindex)
+                html.append("<div onclick=\"desplegarDerecha('despleg{}', 'button{}')\" id='button{}' class='despleg-derecha' style='cursor:context-menu'>{} ▸</div>".format(dindex, dindex, dindex, domain))
+                html.append("<div id='despleg{}' class='textos-desplegable'>".format(dindex))
                 for tindex, (id, title) in enumerate(texts):
-                    html += "<div class='opcion' id='opcion{}.{}' onclick='abrirSeleccionado({})'>{}</div>".format(dindex, tindex, id, title)
-                html += "</div>"
-        html += "</div>"
-        self.text_select_html = html
+                    html.append("<div class='opcion' id='opcion{}.{}' onclick='abrirSeleccionado({})'>{}</div>".format(dindex, tindex, id, title))
+                html.append("</div>")
+        html.append("</div>")
+        return ''.join(html)
+
+class GUIStore:
+    """
+    Live GUI instances, one for each browser session, with the most recently
+    used last. When there are more than size instances, or an instance has
+    been unused for more than timeout seconds, it is evicted and on_evict
+    (if any) is called on it. Idle instances are looked for every interval
+    seconds, and on_evict is called, in a thread of the store's own.
+    """
+
+    def __init__(self, size=GUI_STORE_SIZE, timeout=GUI_STORE_TIMEOUT,
+                 on_evict=None, list_texts=True, interval=GUI_EVICT_INTERVAL):
+        self.size = size
+        self.timeout = timeout
+        self.on_evict = on_evict
+        self.list_texts = list_texts
+        self.interval = interval
+        # id: [GUI, time of last access]
+        self.guis = OrderedDict()
+        # Evicted GUI instances that on_evict hasn't been called on yet
+        self.pending = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def __len__(self):
+        return len(self.guis)
+
+    def __repr__(self):
+        return "<GUIStore({}/{})>".format(len(self.guis), self.size)
+
+    def get(self, guiid, create=True):
+        """
+        Return the GUI instance for guiid, creating it if there is none and
+        create is True.
+        """
+        self.start()
+        now = time.time()
+        with self.lock:
+            entry = self.guis.get(guiid)
+            if entry:
+                entry[1] = now
+                self.guis.move_to_end(guiid)
+                return entry[0]
+        if not create:
+            return
+        # Creating a GUI may query the DB, so do it outside the lock.
+        gui = GUI(list_texts=self.list_texts)
+        with self.lock:
+            # Another request for the same id may have got here first.
+            entry = self.guis.setdefault(guiid, [gui, now])
+            self.guis.move_to_end(guiid)
+            self.pending.extend(self.expired(now))
+            if self.pending:
+                # on_evict is called in the eviction thread.
+                self.wake.set()
+        return entry[0]
+
+    def remove(self, guiid):
+        """Remove the GUI instance for guiid, returning it if there is one."""
+        with self.lock:
+            entry = self.guis.pop(guiid, None)
+        if entry:
+            return entry[0]
+
+    def expired(self, now):
+        """
+        Remove and return the GUI instances that are idle or that don't fit.
+        Must be called with the lock held.
+        """
+        evicted = []
+        while self.guis:
+            guiid, (gui, last) = next(iter(self.guis.items()))
+            if len(self.guis) <= self.size and now - last <= self.timeout:
+                break
+            del self.guis[guiid]
+            evicted.append(gui)
+        return evicted
+
+    def evict_idle(self):
+        """Evict all GUI instances that have been unused for too long, and
+        call on_evict on them and on those already evicted. Returns the
+        number of instances."""
+        with self.lock:
+            evicted = self.pending + self.expired(time.time())
+            self.pending = []
+        self.evict(evicted)
+        return len(evicted)
+
+    def start(self):
+        """Start the eviction thread, if it's not running in this process."""
+        with self.lock:
+            if self.thread and self.pid == os.getpid() and self.thread.is_alive():
+                return
+            if self.pid != os.getpid():
+                # The parent's evicted instances are the parent's to end.
+                self.pending = []
+            self.thread = threading.Thread(target=self.run, name='guistore',
+                                           daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print("Error al desalojar GUIs: {}".format(e))
+
+    def evict(self, guis):
+        if not self.on_evict:
+            return
+        for gui in guis:
+            # Wait for any request still using it
+            with gui.lock:
+                self.on_evict(gui)
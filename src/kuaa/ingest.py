@@ -0,0 +1,172 @@
+#
+#   Mainumby: bulk ingestion of texts into the Text DB.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Files are read and segmented in a pool of processes; the
+#    parent inserts the results with Core statements (one executemany for
+#    the TextSegs of each chunk of Texts) and commits each chunk, so no ORM
+#    objects are made and memory doesn't grow with the corpus.
+# -- Files are read with the streaming paragraph readers in utils and
+#    segmented a chunk at a time.
+
+import json, multiprocessing, os, time, zipfile
+
+from mbojereha.language import Language
+
+from . import db, text_cache
+from .text import Text, TextSeg, TEXT_EXT, DOCX_EXT, DOMAINS
+from .utils import get_time, iter_paragraphs, PARA_SEP
+
+# Texts inserted and committed together
+CHUNK_SIZE = 50
+# Files sent to a worker at a time
+POOL_CHUNKSIZE = 4
+
+# Source language in the workers
+LANGUAGE = None
+
+def read_manifest(path):
+    """
+    (path, domain, title) for each line of a manifest file, where lines are
+    path;domain;title, with domain and title optional. Relative paths are
+    relative to the manifest's directory.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, encoding='utf8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [f.strip() for f in line.split(';')]
+            fields += [''] * (3 - len(fields))
+            filepath, domain, title = fields[:3]
+            entries.append((os.path.join(directory, filepath), domain, title))
+    return entries
+
+def read_directory(directory, domain=''):
+    """(path, domain, '') for each .txt and .docx file in directory. When there
+    are both for a name, the .txt file is used, as in Text.read()."""
+    files = {}
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext == TEXT_EXT or (ext == DOCX_EXT and name not in files):
+            files[name] = os.path.join(directory, filename)
+    return [(path, domain, '') for path in files.values()]
+
+def init_worker(language):
+    global LANGUAGE
+    LANGUAGE = Language.load_lang(language)
+
+def segment_file(entry):
+    """
+    Read and segment the file in entry, (path, domain, title), returning a
+    dict with the Text's columns and a list of (content, html, toks) for its
+    TextSegs, or None if the file can't be read.
+    """
+    path, domain, title = entry
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        paragraphs = list(iter_paragraphs(path))
+    except (IOError, UnicodeDecodeError, zipfile.BadZipFile, KeyError) as e:
+        print("No se pudo leer {}: {}".format(path, e))
+        return
+    content = PARA_SEP.join(paragraphs)
+    if not content:
+        return
+    segs = [(original, shtml, json.dumps(tokens, ensure_ascii=False))
+            for index, original, tokens, shtml in Text.segment_paragraphs(paragraphs, LANGUAGE)]
+    return {'name': name, 'title': title or name, 'domain': domain or 'Miscelánea',
+            'content': content, 'description': '', 'creation': get_time(True),
+            'segs': segs}
+
+def insert_texts(conn, results):
+    """Insert the Texts and their TextSegs in results; returns the number of TextSegs."""
+    segrows = []
+    for result in results:
+        segs = result.pop('segs')
+        textid = conn.execute(Text.__table__.insert(), result).inserted_primary_key[0]
+        segrows.extend({'text_id': textid, 'index': index, 'content': content,
+                        'html': html, 'toks': toks}
+                       for index, (content, html, toks) in enumerate(segs))
+    if segrows:
+        conn.execute(TextSeg.__table__.insert(), segrows)
+    return len(segrows)
+
+def ingest(entries, nprocs=None, chunk_size=CHUNK_SIZE, language='spa', skip_existing=True):
+    """
+    Read, segment, and add to the Text DB the files in entries, a list of
+    (path, domain, title), using nprocs processes (all CPUs by default).
+    Files with the name of a Text already in the DB are skipped if
+    skip_existing is True. Returns (texts, segments, seconds).
+    """
+    engine = db.get_engine(bind='text')
+    if skip_existing:
+        existing = {name for (name,) in db.session.query(Text.name)}
+        entries = [e for e in entries
+                   if os.path.splitext(os.path.basename(e[0]))[0] not in existing]
+    for path, domain, title in entries:
+        if domain and domain not in DOMAINS:
+            print("Advertencia: ¡{} no pertenece a la actual lista de dominios!".format(domain))
+    nprocs = nprocs or os.cpu_count()
+    print("Ingiriendo {} archivos con {} procesos".format(len(entries), nprocs))
+    t0 = time.time()
+    ntexts = nsegs = 0
+    chunk = []
+    context = multiprocessing.get_context('fork')
+    with context.Pool(nprocs, initializer=init_worker, initargs=(language,)) as pool:
+        for result in pool.imap_unordered(segment_file, entries, chunksize=POOL_CHUNKSIZE):
+            if result:
+                chunk.append(result)
+            if len(chunk) >= chunk_size:
+                ntexts, nsegs = commit_chunk(engine, chunk, ntexts, nsegs, t0)
+                chunk = []
+        if chunk:
+            ntexts, nsegs = commit_chunk(engine, chunk, ntexts, nsegs, t0)
+    seconds = time.time() - t0
+    text_cache.clear()
+    print("{} textos, {} oraciones en {:.1f} s ({:.1f} textos/s, {:.1f} oraciones/s)".format(
+        ntexts, nsegs, seconds, ntexts / seconds if seconds else 0.0,
+        nsegs / seconds if seconds else 0.0))
+    return ntexts, nsegs, seconds
+
+def commit_chunk(engine, chunk, ntexts, nsegs, t0):
+    """Insert and commit a chunk of results, reporting progress."""
+    with engine.begin() as conn:
+        nsegs += insert_texts(conn, chunk)
+    ntexts += len(chunk)
+    seconds = time.time() - t0
+    print("  {} textos, {} oraciones ({:.1f} textos/s)".format(
+        ntexts, nsegs, ntexts / seconds if seconds else 0.0))
+    return ntexts, nsegs
+
+def ingest_path(path, domain='', nprocs=None, chunk_size=CHUNK_SIZE):
+    """Ingest the files in a directory or listed in a manifest file."""
+    if os.path.isdir(path):
+        entries = read_directory(path, domain=domain)
+    else:
+        entries = read_manifest(path)
+    return ingest(entries, nprocs=nprocs, chunk_size=chunk_size)
@@ -0,0 +1,320 @@
+#
+#   Mainumby: persistent queue of document translation jobs.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. A job is a document (or a stored Text) to translate; each of
+#    its sentences is a task. Jobs and tasks are rows in a SQLite file, so
+#    they survive the web process and restarts. Worker processes claim
+#    tasks a few at a time and write each result as soon as they have it;
+#    tasks claimed by a worker that died, or that have been running longer
+#    than LEASE seconds, are claimed again.
+# -- Translations are counted in METRICS as kind job.
+
+import json, multiprocessing, os, sqlite3, threading, time, uuid
+import mbojereha
+
+from . import app, load, oración, make_session, TextDB, TextSeg, lexicon_version, METRICS
+
+JOBS_PATH = os.path.join(os.path.dirname(__file__), 'jobs.db')
+# Tasks a worker claims at a time
+CLAIM_SIZE = 4
+# Seconds before a task claimed by a live worker can be claimed again
+LEASE = 600
+# Seconds a worker waits when there are no tasks
+POLL_INTERVAL = 1.0
+# Seconds finished jobs are kept
+JOB_MAX_AGE = 7 * 24 * 3600
+
+# States of jobs and tasks
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY, source TEXT, target TEXT, textid INTEGER,
+  status TEXT, nsent INTEGER, ndone INTEGER DEFAULT 0, nfailed INTEGER DEFAULT 0,
+  created REAL, updated REAL);
+CREATE TABLE IF NOT EXISTS tasks (
+  job_id TEXT, idx INTEGER, original TEXT, tokens TEXT, status TEXT,
+  final TEXT, error TEXT, worker INTEGER, claimed REAL,
+  PRIMARY KEY (job_id, idx));
+CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks (status, claimed);
+"""
+
+class JobQueue:
+    """Translation jobs and their sentence tasks, in a SQLite file shared by processes."""
+
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        # Connections can't be shared by threads or processes
+        self.local = threading.local()
+
+    def __repr__(self):
+        return "<JobQueue({})>".format(self.path)
+
+    def connection(self):
+        """The SQLite connection for this thread, created if necessary."""
+        pid = os.getpid()
+        conn = getattr(self.local, 'conn', None)
+        if conn and self.local.pid == pid:
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self.local.conn = conn
+        self.local.pid = pid
+        return conn
+
+    def transaction(self):
+        """A write transaction; BEGIN IMMEDIATE so that two workers can't claim
+        the same tasks."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        return Transaction(conn)
+
+    ## Clients
+
+    def submit(self, sentences, source, target, textid=-1, finals=None):
+        """
+        Add a job for sentences, (original, tokens) pairs, returning its id.
+        finals has translations already made for some sentences, with their
+        indices as keys; they're done without a worker.
+        """
+        finals = finals or {}
+        id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for index, (original, tokens) in enumerate(sentences):
+            final = finals.get(index)
+            rows.append((id, index, original, json.dumps(tokens, ensure_ascii=False),
+                         DONE if final is not None else PENDING, final))
+        ndone = len(finals)
+        status = DONE if ndone == len(rows) else PENDING
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO jobs (id, source, target, textid, status, nsent, ndone, created, updated) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (id, source.abbrev, target.abbrev, textid, status,
+                          len(rows), ndone, now, now))
+            conn.executemany("INSERT INTO tasks (job_id, idx, original, tokens, status, final) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return id
+
+    def submit_text(self, text, source, target):
+        """Add a job for the sentences in the string text."""
+        doc = mbojereha.Document(source, target, text, proc=False)
+        return self.submit([(s.original, s.tokens) for s in doc], source, target)
+
+    def submit_textid(self, textid, source, target):
+        """Add a job for the Text with textid, using its pretranslations.
+        Must be called within the app context."""
+        version = lexicon_version(source, target)
+        sentences = []
+        finals = {}
+        for textseg in TextDB.get_segments(textid, TextSeg.tras):
+            for tra in textseg.tras:
+                if tra.version == version:
+                    finals[textseg.index] = tra.final
+            sentences.append((textseg.content, textseg.tokens))
+        if not sentences:
+            return
+        return self.submit(sentences, source, target, textid=textid, finals=finals)
+
+    def status(self, id):
+        """A dict describing the job, or None if there's no such job."""
+        row = self.connection().execute(
+            "SELECT id, source, target, textid, status, nsent, ndone, nfailed, created, updated "
+            "FROM jobs WHERE id = ?", (id,)).fetchone()
+        if not row:
+            return
+        keys = ['id', 'source', 'target', 'textid', 'status', 'nsent', 'ndone',
+                'nfailed', 'created', 'updated']
+        return dict(zip(keys, row))
+
+    def results(self, id):
+        """
+        The final translations of the job's sentences, in order, None for those
+        not yet translated. The original sentence stands in for any that failed.
+        """
+        rows = self.connection().execute(
+            "SELECT status, original, final FROM tasks WHERE job_id = ? ORDER BY idx",
+            (id,)).fetchall()
+        return [final if status == DONE else original if status == FAILED else None
+                for status, original, final in rows]
+
+    def cancel(self, id):
+        """Stop the job; tasks already claimed are finished but not recorded."""
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+                                  (CANCELLED, time.time(), id, PENDING, RUNNING))
+            conn.execute("UPDATE tasks SET status = ? WHERE job_id = ? AND status IN (?, ?)",
+                         (CANCELLED, id, PENDING, RUNNING))
+            return cursor.rowcount > 0
+
+    ## Workers
+
+    def claim(self, worker, n=CLAIM_SIZE):
+        """
+        Claim up to n pending tasks for worker (a pid), oldest jobs first.
+        Returns a list of (job_id, index, original, tokens, source, target).
+        """
+        with self.transaction() as conn:
+            rows = conn.execute(
+                "SELECT t.job_id, t.idx, t.original, t.tokens, j.source, j.target "
+                "FROM tasks t JOIN jobs j ON t.job_id = j.id "
+                "WHERE t.status = ? ORDER BY j.created, t.idx LIMIT ?",
+                (PENDING, n)).fetchall()
+            now = time.time()
+            conn.executemany("UPDATE tasks SET status = ?, worker = ?, claimed = ? WHERE job_id = ? AND idx = ?",
+                             [(RUNNING, worker, now, row[0], row[1]) for row in rows])
+            conn.executemany("UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?",
+                             [(RUNNING, now, job_id, PENDING) for job_id in {row[0] for row in rows}])
+        return [(job_id, index, original, json.loads(tokens), source, target)
+                for job_id, index, original, tokens, source, target in rows]
+
+    def finish(self, job_id, index, final=None, error=None):
+        """Record the result of a task (its translation or an error)."""
+        status = FAILED if error else DONE
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET status = ?, final = ?, error = ? "
+                                  "WHERE job_id = ? AND idx = ? AND status = ?",
+                                  (status, final, error, job_id, index, RUNNING))
+            if not cursor.rowcount:
+                # Cancelled, or claimed again by another worker
+                return
+            column = 'nfailed' if error else 'ndone'
+            conn.execute("UPDATE jobs SET {0} = {0} + 1, updated = ?, "
+                         "status = CASE WHEN ndone + nfailed + 1 >= nsent THEN ? ELSE status END "
+                         "WHERE id = ?".format(column), (time.time(), DONE, job_id))
+
+    def requeue(self, lease=LEASE):
+        """
+        Make running tasks pending again if their worker is no longer alive or
+        they were claimed more than lease seconds ago. Returns the number.
+        """
+        with self.transaction() as conn:
+            rows = conn.execute("SELECT job_id, idx, worker, claimed FROM tasks WHERE status = ?",
+                                (RUNNING,)).fetchall()
+            now = time.time()
+            stale = [(PENDING, job_id, index) for job_id, index, worker, claimed in rows
+                     if now - (claimed or 0) > lease or not pid_alive(worker)]
+            conn.executemany("UPDATE tasks SET status = ?, worker = NULL, claimed = NULL "
+                             "WHERE job_id = ? AND idx = ?", stale)
+        return len(stale)
+
+    def purge(self, max_age=JOB_MAX_AGE):
+        """Remove jobs that were finished or cancelled more than max_age seconds ago."""
+        cutoff = time.time() - max_age
+        with self.transaction() as conn:
+            ids = [(id,) for (id,) in conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, CANCELLED, cutoff))]
+            conn.executemany("DELETE FROM tasks WHERE job_id = ?", ids)
+            conn.executemany("DELETE FROM jobs WHERE id = ?", ids)
+        return len(ids)
+
+class Transaction:
+    """Commits the connection's transaction on success and rolls it back otherwise."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def run_worker(queue=None, poll_interval=POLL_INTERVAL):
+    """Translate the tasks of queued jobs; runs until killed."""
+    queue = queue or JOBS
+    worker = os.getpid()
+    # (source, target, session) for each language pair
+    languages = {}
+    queue.requeue()
+    queue.purge()
+    last_check = time.time()
+    while True:
+        tasks = queue.claim(worker)
+        if not tasks:
+            time.sleep(poll_interval)
+            if time.time() - last_check > LEASE:
+                queue.requeue()
+                queue.purge()
+                last_check = time.time()
+            continue
+        for job_id, index, original, tokens, source, target in tasks:
+            if (source, target) not in languages:
+                src, targ = load(source, target)
+                languages[(source, target)] = src, targ, make_session(src, targ, None, create_memory=True)
+            src, targ, session = languages[(source, target)]
+            try:
+                sentence = mbojereha.Sentence(original=original, tokens=tokens,
+                                              language=src, target=targ)
+                with METRICS.context(kind='job'):
+                    final = oración(src=src, targ=targ, sentence=sentence,
+                                    session=session, html=False, choose=True,
+                                    return_string=True,
+                                    verbosity=0, terse=True)
+            except Exception as e:
+                print("Error al traducir oración {} de trabajo {}: {}".format(index, job_id, e))
+                queue.finish(job_id, index, error=str(e) or e.__class__.__name__)
+            else:
+                queue.finish(job_id, index, final=final)
+
+def start_workers(n=1):
+    """
+    Fork n processes running run_worker() in the app context, for when the
+    app isn't run by server.serve(), which forks its own. Returns the
+    processes.
+    """
+    def run():
+        with app.app_context():
+            run_worker()
+    # Forked, so that they start with the languages loaded
+    context = multiprocessing.get_context('fork')
+    processes = []
+    for i in range(n):
+        process = context.Process(target=run, name='trabajos', daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+# The queue used by the views and the workers
+JOBS = JobQueue(os.environ.get('MAINUMBY_JOBS', JOBS_PATH))
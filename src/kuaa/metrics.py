@@ -0,0 +1,236 @@
+#
+#   Mainumby: timers and counters, exposed in the Prometheus text format.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Histograms of the seconds spent in each stage of translation,
+#    in DB calls, in template rendering, and in whole requests, and
+#    counters, labeled by kind (sentence, doc, api, job) and mode (choose or
+#    options). An observation is a dict update under a lock. With a metrics
+#    directory, each process writes its metrics there every few seconds and
+#    /metrics adds up those of all processes, so the preforking server's
+#    workers are counted together.
+# -- Newlines in label values are escaped too.
+
+import bisect, glob, json, os, threading, time
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds between writes of a process's metrics to the metrics directory
+DUMP_INTERVAL = 5.0
+
+HELP = {
+    'mainumby_stage_seconds': "Seconds in each stage of translating a sentence",
+    'mainumby_db_seconds': "Seconds in Text DB calls",
+    'mainumby_template_seconds': "Seconds rendering templates",
+    'mainumby_request_seconds': "Seconds handling requests",
+    'mainumby_sentences_total': "Sentences translated",
+    'mainumby_cache_total': "Lookups in the translation cache and memory",
+}
+
+class Timer:
+    """Context manager that observes the seconds it was open."""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.metrics.observe(self.name, self.seconds, **self.labels)
+
+class Context:
+    """Context manager that adds labels to the observations in this thread."""
+
+    def __init__(self, local, labels):
+        self.local = local
+        self.labels = labels
+
+    def __enter__(self):
+        self.previous = getattr(self.local, 'labels', {})
+        self.local.labels = dict(self.previous, **self.labels)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.labels = self.previous
+
+class Metrics:
+    """Histograms and counters, with (name, labels) keys."""
+
+    def __init__(self, directory=None, buckets=BUCKETS):
+        # Where each process writes its metrics, if anywhere
+        self.directory = directory
+        self.buckets = buckets
+        # (name, labels): [counts for each bucket, sum, count]
+        self.histograms = {}
+        # (name, labels): value
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.last_dump = time.time()
+
+    def __repr__(self):
+        return "<Metrics({}, {})>".format(len(self.histograms), len(self.counters))
+
+    def reset(self):
+        """Forget everything observed; called in forked children, whose
+        inherited metrics are their parent's."""
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.last_dump = time.time()
+
+    def key(self, name, labels):
+        context = getattr(self.local, 'labels', None)
+        if context:
+            labels = dict(context, **labels)
+        return name, tuple(sorted(labels.items()))
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def context(self, **labels):
+        return Context(self.local, labels)
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if not histogram:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+        self.maybe_dump()
+
+    def inc(self, name, n=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+        self.maybe_dump()
+
+    ## Several processes
+
+    def maybe_dump(self):
+        if self.directory and time.time() - self.last_dump >= DUMP_INTERVAL:
+            self.dump()
+
+    def snapshot(self):
+        """The metrics as lists that can be written as JSON."""
+        with self.lock:
+            return {'histograms': [[n, l, h[0][:], h[1], h[2]]
+                                   for (n, l), h in self.histograms.items()],
+                    'counters': [[n, l, v] for (n, l), v in self.counters.items()]}
+
+    def dump(self):
+        """Write this process's metrics to the metrics directory."""
+        self.last_dump = time.time()
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "{}.json".format(os.getpid()))
+        try:
+            with open(path + '.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print("No se pudieron escribir las métricas: {}".format(e))
+
+    def merged(self):
+        """
+        (histograms, counters) for this process added to those written by
+        other processes (including ones no longer running, since counts are
+        cumulative).
+        """
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = os.path.join(self.directory, "{}.json".format(os.getpid()))
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        histograms = {}
+        counters = {}
+        for snapshot in snapshots:
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = name, tuple(tuple(l) for l in labels)
+                h = histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                h[0] = [a + b for a, b in zip(h[0], counts)]
+                h[1] += total
+                h[2] += count
+            for name, labels, value in snapshot['counters']:
+                key = name, tuple(tuple(l) for l in labels)
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        histograms, counters = self.merged()
+        lines = []
+        for name in sorted({n for n, l in histograms}):
+            lines.append("# HELP {} {}".format(name, HELP.get(name, name)))
+            lines.append("# TYPE {} histogram".format(name))
+            for (n, labels), (counts, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append("{}_bucket{} {}".format(name, format_labels(labels, le=repr(bound)), cumulative))
+                lines.append("{}_bucket{} {}".format(name, format_labels(labels, le='+Inf'), count))
+                lines.append("{}_sum{} {:.6f}".format(name, format_labels(labels), total))
+                lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+        for name in sorted({n for n, l in counters}):
+            lines.append("# HELP {} {}".format(name, HELP.get(name, name)))
+            lines.append("# TYPE {} counter".format(name))
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append("{}{} {}".format(name, format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in labels) + '}'
+
+def escape(value):
+    """The label value with backslashes, quotes, and newlines escaped."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# The metrics of this process
+METRICS = Metrics(os.environ.get('MAINUMBY_METRICS_DIR') or None)
+os.register_at_fork(after_in_child=METRICS.reset)
@@ -0,0 +1,137 @@
+#
+#   Mainumby: translation of documents by a pool of processes.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Pools are forked from a process that has already loaded the
+#    languages, so the workers start with them loaded. Sentences are passed
+#    to the workers as (original, tokens) pairs, as they are stored in the
+#    Text DB, and rebuilt there.
+# -- imap_trans_texts() for sentences given as strings, as in /api/translate.
+# -- Translations in the workers are counted in METRICS as kind doc or api.
+# -- start_pools() creates the pools when a process starts serving, rather
+#    than when a request first needs one, since forking from a thread
+#    handling a request can copy locks held by other threads. Pools are
+#    closed at exit.
+
+import atexit, multiprocessing, os, threading
+import mbojereha
+
+from . import load, oración, make_session, METRICS
+
+# Sentences sent to a worker at a time
+CHUNKSIZE = 2
+
+# Pools, with (source, target, nprocs) as keys
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+# The process that created POOLS; pools inherited through a fork don't work.
+POOLS_PID = None
+
+# Per-process state in the workers
+SOURCE = None
+TARGET = None
+SESSION = None
+
+def get_pool(source, target, nprocs):
+    """A pool of nprocs processes for translating from source to target, created
+    the first time it's needed."""
+    global POOLS_PID
+    key = source.abbrev, target.abbrev, nprocs
+    with POOLS_LOCK:
+        if POOLS_PID != os.getpid():
+            # The parent's pools are the parent's to close.
+            POOLS.clear()
+            POOLS_PID = os.getpid()
+        pool = POOLS.get(key)
+        if not pool:
+            context = multiprocessing.get_context('fork')
+            pool = context.Pool(nprocs, initializer=init_worker,
+                                initargs=(source.abbrev, target.abbrev))
+            POOLS[key] = pool
+        return pool
+
+def start_pools(source, target, nprocs):
+    """Create the pool for translating from source to target with nprocs
+    processes, if nprocs > 1. Called before the process handles requests."""
+    if nprocs > 1:
+        get_pool(source, target, nprocs)
+
+def close_pools(terminate=False):
+    """Stop all worker processes, after they finish their work unless
+    terminate is True."""
+    with POOLS_LOCK:
+        if POOLS_PID == os.getpid():
+            for pool in POOLS.values():
+                if terminate:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+        POOLS.clear()
+
+atexit.register(close_pools, True)
+
+def init_worker(source, target):
+    """Run in each worker when it starts. The languages are normally already
+    there, inherited from the parent."""
+    global SOURCE, TARGET, SESSION
+    SOURCE, TARGET = load(source, target)
+    SESSION = make_session(SOURCE, TARGET, None, create_memory=True)
+
+def trans_sentence(args):
+    """Translate one sentence in a worker, returning the final string."""
+    original, tokens, terse, use_tm = args
+    sentence = mbojereha.Sentence(original=original, tokens=tokens,
+                                  language=SOURCE, target=TARGET)
+    with METRICS.context(kind='doc'):
+        return oración(src=SOURCE, targ=TARGET, sentence=sentence, session=SESSION,
+                       html=False, choose=True, return_string=True,
+                       use_tm=use_tm, verbosity=0, terse=terse)
+
+def trans_text(args):
+    """Translate a sentence string in a worker, returning the final string."""
+    text, terse, use_tm = args
+    if not text.strip():
+        return ''
+    with METRICS.context(kind='api'):
+        return oración(text=text, src=SOURCE, targ=TARGET, session=SESSION,
+                       html=False, choose=True, return_string=True,
+                       use_tm=use_tm, verbosity=0, terse=terse)
+
+def imap_trans_texts(texts, source, target, nprocs, terse=True, use_tm=False):
+    """Like imap_trans, for sentences that are strings."""
+    pool = get_pool(source, target, nprocs)
+    args = [(text, terse, use_tm) for text in texts]
+    return pool.imap(trans_text, args, chunksize=CHUNKSIZE)
+
+def imap_trans(sentences, source, target, nprocs, terse=True, use_tm=False):
+    """
+    Translate the Sentences in a pool of nprocs processes, returning an
+    iterator over their final strings, in the order of the sentences.
+    """
+    pool = get_pool(source, target, nprocs)
+    args = [(s.original, s.tokens, terse, use_tm) for s in sentences]
+    return pool.imap(trans_sentence, args, chunksize=CHUNKSIZE)
@@ -0,0 +1,210 @@
+#
+#   Mainumby: sampled profiles of requests.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. One thread in each process samples the stacks of the threads
+#    handling profiled requests every SAMPLE_INTERVAL seconds, so the
+#    requests themselves run at full speed. A profile is kept for 1 in
+#    every n requests, or for any request slower than a threshold, and
+#    written in the "folded" format (one line per stack: frames separated
+#    by ';', then the number of samples), which flamegraph.pl and
+#    speedscope read. The first frame is the branch the request took, so
+#    a flame graph of many profiles groups them by branch. Only the newest
+#    files in the directory are kept.
+
+import collections, json, os, sys, threading, time
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+# Frames kept from the top of each stack
+MAX_DEPTH = 200
+# Profiles kept in the directory
+KEEP = 200
+PROFILE_EXT = '.folded'
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+def folded_stack(frame):
+    """The stack ending in frame, outermost frame first, separated by ';'."""
+    names = []
+    while frame and len(names) < MAX_DEPTH:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class Sampler:
+    """Samples the stacks of registered threads in a thread of its own."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        # Thread ident: Counter of folded stacks
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def __repr__(self):
+        return "<Sampler({})>".format(len(self.profiles))
+
+    def start(self):
+        """Start the thread, if it's not running in this process."""
+        with self.lock:
+            if self.thread and self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.profiles = {}
+            self.thread = threading.Thread(target=self.run, name='sampler', daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def add(self, ident):
+        """Start sampling the thread with ident."""
+        self.start()
+        with self.lock:
+            self.profiles[ident] = collections.Counter()
+        self.wake.set()
+
+    def remove(self, ident):
+        """Stop sampling the thread with ident, returning its Counter of stacks."""
+        with self.lock:
+            return self.profiles.pop(ident, None)
+
+    def run(self):
+        while True:
+            with self.lock:
+                idents = list(self.profiles)
+                if not idents:
+                    self.wake.clear()
+            if not idents:
+                self.wake.wait()
+                continue
+            frames = sys._current_frames()
+            stacks = [(ident, folded_stack(frames[ident])) for ident in idents
+                      if ident in frames]
+            with self.lock:
+                for ident, stack in stacks:
+                    counter = self.profiles.get(ident)
+                    if counter is not None:
+                        counter[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+class RequestProfiler:
+    """
+    Profiles 1 in every sample requests (none if sample is 0) and any
+    request taking longer than threshold seconds (none if threshold is 0),
+    writing their profiles to directory.
+    """
+
+    def __init__(self, directory, sample=0, threshold=0.0, keep=KEEP,
+                 sampler=None):
+        self.directory = directory
+        self.sample = sample
+        self.threshold = threshold
+        self.keep = keep
+        self.sampler = sampler or SAMPLER
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return "<RequestProfiler({}, 1/{}, >{}s)>".format(self.directory, self.sample,
+                                                       self.threshold)
+
+    @property
+    def enabled(self):
+        return bool(self.sample or self.threshold)
+
+    def begin(self):
+        """
+        Called at the start of a request. Returns a (start time, whether the
+        request is one of the 1 in n, request number) token for end(), or
+        None if it's not profiled.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.count += 1
+            number = self.count
+        sampled = bool(self.sample) and number % self.sample == 0
+        if not sampled and not self.threshold:
+            return
+        self.sampler.add(threading.get_ident())
+        return time.perf_counter(), sampled, number
+
+    def end(self, token, branch='', words=0, **info):
+        """
+        Called at the end of a profiled request with the branch it took and
+        the length of its sentence or document in words. Writes the profile
+        if the request was sampled or slow; returns its path or None.
+        """
+        start, sampled, number = token
+        seconds = time.perf_counter() - start
+        stacks = self.sampler.remove(threading.get_ident())
+        slow = bool(self.threshold) and seconds >= self.threshold
+        if not stacks or not (sampled or slow):
+            return
+        return self.write(stacks, number, branch=branch or 'otro', words=words,
+                          seconds=seconds, reason='lento' if slow else 'muestra',
+                          **info)
+
+    def write(self, stacks, number, branch, words, seconds, reason, **info):
+        os.makedirs(self.directory, exist_ok=True)
+        name = "{}_{}-{}_{}_{}ms_{}p_{}".format(time.strftime('%Y%m%d-%H%M%S'), os.getpid(),
+                                               number, branch, int(seconds * 1000),
+                                               words, reason)
+        path = os.path.join(self.directory, name + PROFILE_EXT)
+        root = "tra:{}".format(branch)
+        with open(path, 'w', encoding='utf8') as file:
+            for stack, n in stacks.most_common():
+                file.write("{};{} {}\n".format(root, stack, n))
+        with open(path + '.json', 'w', encoding='utf8') as file:
+            json.dump(dict(branch=branch, words=words, seconds=round(seconds, 4),
+                           reason=reason, samples=sum(stacks.values()),
+                           interval=self.sampler.interval, pid=os.getpid(), **info),
+                      file, ensure_ascii=False)
+        self.rotate()
+        return path
+
+    def rotate(self):
+        """Remove all but the newest keep profiles."""
+        try:
+            paths = [os.path.join(self.directory, f) for f in os.listdir(self.directory)
+                     if f.endswith(PROFILE_EXT)]
+            paths.sort(key=os.path.getmtime)
+        except OSError:
+            return
+        for path in paths[:max(0, len(paths) - self.keep)]:
+            for p in (path, path + '.json'):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+# The sampler of this process
+SAMPLER = Sampler()
@@ -0,0 +1,378 @@
+#
+#   Mainumby: append-only logs of translation records.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. A log is a file with one JSON record per line and a sidecar
+#    index file (<log>.idx) with a fixed-size entry for each record: the
+#    offset of its line and its time (UTC seconds since the epoch). Records
+#    are appended in time order, so the last n records or those in a time
+#    range are found by seeking in the index, without reading the log.
+# -- RecordWriter: a thread that does the appending, fed by a queue, in
+#    batches. Appends hold an flock on the log, so several processes can
+#    write to the same one.
+# -- repair() truncates a partly written last record, so the next append
+#    doesn't run into it, and index entries past the end of the log; a line
+#    that can't be read is skipped rather than making the log unreadable.
+# -- read_from(): the complete records after a byte offset, for readers
+#    following a log that is being appended to.
+# -- Text written with mode 'w' replaces the file by renaming a new one.
+
+import calendar, datetime, fcntl, json, os, queue, struct, threading, time
+
+INDEX_EXT = '.idx'
+# Offset of record line, time of record
+INDEX_ENTRY = struct.Struct('<Qd')
+# Most records written by a RecordWriter at a time
+BATCH_SIZE = 200
+# Seconds between fsyncs of the files a RecordWriter has written to
+FSYNC_INTERVAL = 2.0
+
+def time2epoch(time):
+    """Seconds since the epoch for a naive UTC datetime."""
+    return calendar.timegm(time.utctimetuple()) + time.microsecond / 1e6
+
+class RecordLog:
+    """A log of JSON records with an index by position and time."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_EXT
+
+    def __repr__(self):
+        return "<RecordLog({})>".format(self.path)
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.index_path) // INDEX_ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self):
+        """Create the log and its index, empty, if they don't exist."""
+        for path in (self.path, self.index_path):
+            open(path, 'ab').close()
+
+    @staticmethod
+    def encode(record):
+        return (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf8')
+
+    def append(self, records, times=None, fsync=False):
+        """
+        Append records (dicts) to the log, with times (naive UTC datetimes,
+        now if not given).
+        """
+        if not records:
+            return
+        if times is None:
+            now = datetime.datetime.utcnow()
+            times = [now] * len(records)
+        with open(self.path, 'ab') as log:
+            # Other processes may be appending too.
+            fcntl.flock(log, fcntl.LOCK_EX)
+            self.repair(locked=True)
+            with open(self.index_path, 'ab') as index:
+                offset = log.seek(0, os.SEEK_END)
+                lines = []
+                entries = []
+                for record, stamp in zip(records, times):
+                    line = RecordLog.encode(record)
+                    lines.append(line)
+                    entries.append(INDEX_ENTRY.pack(offset, time2epoch(stamp)))
+                    offset += len(line)
+                # The log is written first, so the index never points past its end.
+                log.write(b''.join(lines))
+                log.flush()
+                if fsync:
+                    os.fsync(log.fileno())
+                index.write(b''.join(entries))
+                index.flush()
+                if fsync:
+                    os.fsync(index.fileno())
+
+    def repair(self, timefunc=None, locked=False):
+        """
+        If the process died while appending, make the log and its index
+        consistent again: a partly written last record is truncated, index
+        entries for records that aren't in the log are dropped, and records
+        that were written but not indexed are indexed. timefunc gives the
+        time of a record (now if it's not given). locked is True if the
+        caller already holds the flock on the log.
+        """
+        if not self.exists():
+            return
+        if not locked:
+            with open(self.path, 'ab') as log:
+                fcntl.flock(log, fcntl.LOCK_EX)
+                return self.repair(timefunc=timefunc, locked=True)
+        if not os.path.exists(self.index_path):
+            open(self.index_path, 'ab').close()
+        size = os.path.getsize(self.path)
+        # A partly written index entry is dropped
+        n = len(self)
+        end = 0
+        with open(self.path, 'rb') as log, open(self.index_path, 'rb') as index:
+            while n:
+                offset, t = self.entry(n - 1, index)
+                if offset < size:
+                    log.seek(offset)
+                    line = log.readline()
+                    if line.endswith(b'\n'):
+                        end = offset + len(line)
+                        break
+                # The record isn't all there
+                n -= 1
+        if os.path.getsize(self.index_path) != n * INDEX_ENTRY.size:
+            os.truncate(self.index_path, n * INDEX_ENTRY.size)
+        if end >= size:
+            return
+        with open(self.path, 'rb') as log, open(self.index_path, 'ab') as index:
+            log.seek(end)
+            offset = end
+            for line in log:
+                if not line.endswith(b'\n'):
+                    break
+                stamp = None
+                if timefunc:
+                    try:
+                        stamp = timefunc(json.loads(line))
+                    except ValueError:
+                        pass
+                stamp = stamp or datetime.datetime.utcnow()
+                index.write(INDEX_ENTRY.pack(offset, time2epoch(stamp)))
+                offset += len(line)
+        if offset < size:
+            # Partly written record; it's dropped
+            print("Truncando registro incompleto en {} ({} bytes)".format(self.path, size - offset))
+            os.truncate(self.path, offset)
+
+    def entry(self, position, index=None):
+        """The (offset, time) index entry for the record at position."""
+        if index:
+            index.seek(position * INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+        with open(self.index_path, 'rb') as index:
+            return self.entry(position, index)
+
+    def iter_records(self, start=0, stop=None):
+        """Generate the records from position start up to stop."""
+        n = len(self)
+        stop = n if stop is None else min(stop, n)
+        if start < 0:
+            start = max(0, n + start)
+        if start >= stop:
+            return
+        offset, t = self.entry(start)
+        with open(self.path, 'rb') as log:
+            log.seek(offset)
+            for position in range(start, stop):
+                line = log.readline()
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print("Registro ilegible en {}, posición {}".format(self.path, position))
+
+    def read_from(self, offset=0):
+        """
+        The records after byte offset and the offset following the last of
+        them. A last line that is still being written isn't read, so the
+        returned offset is where the next call should start.
+        """
+        records = []
+        with open(self.path, 'rb') as log:
+            log.seek(offset)
+            for line in log:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print("Registro ilegible en {}, byte {}".format(self.path, offset))
+                offset += len(line)
+        return records, offset
+
+    def last(self, n):
+        """The last n records, oldest first."""
+        return list(self.iter_records(start=-n)) if n else []
+
+    def position(self, time):
+        """Position of the first record at or after time (a naive UTC datetime)."""
+        target = time2epoch(time)
+        lo, hi = 0, len(self)
+        with open(self.index_path, 'rb') as index:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.entry(mid, index)[1] < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return lo
+
+    def between(self, start=None, end=None):
+        """Generate the records with times at or after start and before end."""
+        if not self.exists():
+            return iter(())
+        first = self.position(start) if start else 0
+        stop = self.position(end) if end else None
+        return self.iter_records(start=first, stop=stop)
+
+class RecordWriter:
+    """
+    Appends records to RecordLogs and text to other files in a thread of its
+    own, so that callers don't wait for the disk. Writes are queued, done in
+    batches in the order they were queued, and fsynced every fsync_interval
+    seconds and when flush() is called.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, fsync_interval=FSYNC_INTERVAL):
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        # Paths written to but not yet fsynced
+        self.dirty = set()
+        self.last_fsync = time.time()
+
+    def __repr__(self):
+        return "<RecordWriter({})>".format(self.queue.qsize())
+
+    def reset(self):
+        """A new lock for a forked child, whose copy of the parent's may be
+        held by a thread that wasn't copied."""
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the thread, if it's not running in this process."""
+        with self.lock:
+            # A thread started before a fork doesn't exist in the child.
+            if self.thread and self.pid == os.getpid() and self.thread.is_alive():
+                return
+            if self.pid != os.getpid():
+                # Items queued in the parent are the parent's to write.
+                self.queue = queue.Queue()
+                self.dirty = set()
+            self.thread = threading.Thread(target=self.run, name='recordwriter',
+                                           daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def append(self, path, record, time=None):
+        """Queue record (with time, a naive UTC datetime) for the log at path."""
+        self.start()
+        self.queue.put(('log', path, record, time or datetime.datetime.utcnow()))
+
+    def write_text(self, path, text, mode='a'):
+        """Queue text to be written to the file at path, in mode 'a' or 'w'."""
+        self.start()
+        self.queue.put(('text', path, text, mode))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written and fsynced."""
+        if not self.thread or self.pid != os.getpid():
+            return True
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self.fsync()
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                print("Error al escribir registros: {}".format(e))
+            if time.time() - self.last_fsync >= self.fsync_interval:
+                self.fsync()
+
+    def write(self, batch):
+        """Write a batch of queued items, grouping consecutive records for the same log."""
+        records = []
+        for item in batch + [None]:
+            if item and item[0] == 'log' and (not records or records[-1][1] == item[1]):
+                records.append(item)
+                continue
+            if records:
+                path = records[0][1]
+                RecordLog(path).append([r[2] for r in records], [r[3] for r in records])
+                self.dirty.update((path, path + INDEX_EXT))
+                records = []
+            if not item:
+                break
+            if item[0] == 'log':
+                records.append(item)
+            elif item[0] == 'text':
+                kind, path, text, mode = item
+                if mode == 'w':
+                    RecordWriter.replace(path, text)
+                else:
+                    with open(path, mode, encoding='utf8') as file:
+                        fcntl.flock(file, fcntl.LOCK_EX)
+                        file.write(text)
+                self.dirty.add(path)
+            elif item[0] == 'flush':
+                self.fsync()
+                item[1].set()
+
+    @staticmethod
+    def replace(path, text):
+        """Replace the contents of the file at path with text. The new file is
+        written beside it and renamed, so readers never see it half written."""
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+    def fsync(self):
+        for path in self.dirty:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.dirty.clear()
+        self.last_fsync = time.time()
@@ -46,12 +46,54 @@
 # -- Record interface for Memory and Session. More in Memory.
 # 2019.08.15
 # -- Moved User to Human, a SQLAlchemy class
-
-import datetime, sys, os, yaml
+# 2026.10
+# -- Memory.listeners: functions called on each record written to a Memory.
+# -- Memories and Sessions are written to RecordLogs (<id>.mlog and
+#    <username>.slog), with one JSON record per line and an offset index,
+#    instead of YAML files, which are still read if there is no log.
+# -- Memory logs are rotated by size and age; closed ones are compacted into
+#    gzipped archives. MemoryManifest keeps track of the current one.
+# -- Records, sessions, and new users are written by WRITER, a RecordWriter,
+#    outside the request; quit() flushes it.
+# -- SessionManager: users and the current Memory kept for the process,
+#    refreshed when their files change.
+# -- Memory logs are rotated under the manifest lock, and only if they're
+#    still current; other handles switch to the new log when the manifest
+#    changes.
+# -- SentRecord dicts have the language pair ('lang').
+# -- SessionManager checks the .usr files even when the users file hasn't
+#    changed.
+
+import atexit, datetime, sys, os, yaml, json, gzip, fcntl, threading, time
 from werkzeug.security import generate_password_hash, check_password_hash
+from .reclog import RecordLog, RecordWriter
 
 SESSIONS_DIR = os.path.join(os.path.dirname(__file__), 'sessions')
 USERS_FILE = "users"
+# Old YAML files and the logs that replace them
+MEM_EXT = ".mem"
+MEMLOG_EXT = ".mlog"
+# Compressed closed memories
+MEMGZ_EXT = ".mlog.gz"
+SESS_EXT = ".sess"
+SESSLOG_EXT = ".slog"
+# Ids of current, closed, and archived memories
+MANIFEST_FILE = "memories.json"
+# Memory logs are rotated when they reach this size or age
+MEM_MAX_BYTES = 4 * 1024 * 1024
+MEM_MAX_AGE = datetime.timedelta(days=30)
+# Seconds between compactions of closed memories
+COMPACT_INTERVAL = 3600
+# Closed memory logs modified more recently than this (seconds) aren't
+# compacted yet; other processes may still be writing to them.
+COMPACT_GRACE = 600
+# Seconds between checks of users and manifest files by a SessionManager
+SESSION_CHECK_INTERVAL = 1.0
+
+# Does all writing of records, users, and sessions, in a separate thread.
+WRITER = RecordWriter()
+atexit.register(WRITER.flush, 10)
+os.register_at_fork(after_in_child=WRITER.reset)
 
 SESSION_PRE = '{$}'
 TIME_PRE = '{t}'
@@ -121,11 +163,110 @@ class Record:
     def quit(self):
         print("quit() not implemented...")
 
+class MemoryManifest:
+    """
+    The ids of the current, closed, and archived Memories, kept in a small
+    JSON file in the Sessions directory so that the current Memory can be
+    found without listing the directory. Changes are made under a file
+    lock, since several processes may share the directory.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or SESSIONS_DIR
+        self.path = os.path.join(self.directory, MANIFEST_FILE)
+        self.lock_path = self.path + '.lock'
+        self.mtime = None
+
+    def __repr__(self):
+        return "<MemoryManifest({})>".format(self.path)
+
+    def read(self):
+        """The manifest dict; if there is no manifest file, create it."""
+        try:
+            with open(self.path, encoding='utf8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return self.update(lambda d: d)
+
+    def scan(self):
+        """Create the manifest dict from the files in the Sessions directory."""
+        ids = sorted({Memory.file2id(f) for f in Memory.get_memory_files()})
+        archived = [i for i in ids if os.path.exists(Memory.archive_path(i))]
+        live = [i for i in ids if i not in archived]
+        current = live[-1] if live and os.path.exists(Memory.log_path(live[-1])) else None
+        closed = [i for i in live if i != current]
+        return {'current': current, 'closed': closed, 'archived': archived}
+
+    def update(self, func):
+        """Call func on the manifest dict and save the result if func changed
+        it, under the lock. func must not update the manifest itself. The
+        modification time of the file when the lock is released is saved in
+        self.mtime."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, encoding='utf8') as file:
+                    d = json.load(file)
+                before = json.dumps(d)
+            except FileNotFoundError:
+                d = self.scan()
+                before = None
+            func(d)
+            # Unchanged manifests aren't written, so that their modification
+            # time tells Memory handles when to look at them again.
+            if json.dumps(d) != before:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf8') as file:
+                    json.dump(d, file)
+                os.replace(tmp, self.path)
+            self.mtime = os.stat(self.path).st_mtime_ns
+            return d
+
+    def current(self):
+        return self.read().get('current')
+
+    def set_current(self, id):
+        """Make id the current Memory, closing the previous one."""
+        def func(d):
+            old = d.get('current')
+            if old and old != id and old not in d['closed']:
+                d['closed'].append(old)
+            d['current'] = id
+        self.update(func)
+
+    def close(self, id):
+        def func(d):
+            if d.get('current') == id:
+                d['current'] = None
+            if id not in d['closed']:
+                d['closed'].append(id)
+        self.update(func)
+
+    def archive(self, id):
+        def func(d):
+            if id in d['closed']:
+                d['closed'].remove(id)
+            if id not in d['archived']:
+                d['archived'].append(id)
+        self.update(func)
+
+    def ids(self):
+        """All Memory ids, oldest first."""
+        d = self.read()
+        ids = d['archived'] + d['closed'] + ([d['current']] if d.get('current') else [])
+        return sorted(set(ids))
+
 class Memory(Record):
     """A record of all translations made during a particular period."""
 
+    # Functions called with the Memory and each SentRecord dict written to it
+    listeners = []
+
     def __init__(self, source=None, target=None, id=None, user=None):
         Record.__init__(self, source=source, target=target, id=id, user=user)
+        # Modification time of the manifest when this handle last looked at it
+        self.manifest_mtime = None
         if not id:
             # A new Memory (not a recreated one).
             self.create_file()
@@ -137,56 +278,206 @@ class Memory(Record):
 
     def make_id(self):
         self.id = "{}".format(Memory.time2shortstr(self.start))
+        # A Memory rotated in the same second needs a later id
+        while os.path.exists(Memory.log_path(self.id)) or \
+              os.path.exists(Memory.archive_path(self.id)):
+            self.start += datetime.timedelta(seconds=1)
+            self.id = "{}".format(Memory.time2shortstr(self.start))
 
     def __repr__(self):
         return "M::" + self.id
 
     @staticmethod
     def get_memory_files():
-        """All memory files in Sessions directory."""
-        return [f for f in os.listdir(SESSIONS_DIR) if f.endswith(".mem")]
+        """All memory files (logs, archives, and old YAML files) in Sessions directory."""
+        return [f for f in os.listdir(SESSIONS_DIR)
+                if f.endswith(MEMLOG_EXT) or f.endswith(MEMGZ_EXT) or f.endswith(MEM_EXT)]
+
+    @staticmethod
+    def file2id(filename):
+        return filename.split('.')[0]
 
     @staticmethod
     def get_current_memory_file():
-        """Filename for current memory file (the one most recently changed)."""
-        files = Memory.get_memory_files()
-        if files:
-            files.sort()
-            return files[-1]
+        """Filename for current memory file, from the manifest."""
+        current = MemoryManifest().current()
+        if current:
+            return current + MEMLOG_EXT
+
+    @staticmethod
+    def memory_ids():
+        """Ids of all Memories, oldest first."""
+        return MemoryManifest().ids()
 
     @staticmethod
     def recreate(user=None):
-        """Recreate a Memory for the current memory file; if there's no memory file, make one."""
-        file = Memory.get_current_memory_file()
-        if file:
-            id = file.split(".mem")[0]
-            return Memory(id=id, user=user)
+        """Recreate a Memory for the current memory file; if there's no memory file,
+        or it's due to be rotated, make one."""
+        current = MemoryManifest().current()
+        if current and os.path.exists(Memory.log_path(current)):
+            memory = Memory(id=current, user=user)
+            # Rotated if it's due, unless another process has got there first
+            memory.sync()
+            return memory
         else:
+            # Old YAML memories aren't added to.
             return Memory(user=user)
 
+    def id_time(self):
+        """The time the Memory was started, from its id."""
+        return datetime.datetime.strptime(self.id, MEM_SHORT_TIME_FORMAT)
+
+    def needs_rotation(self):
+        """Is the Memory's log too big or too old to add to?"""
+        try:
+            size = os.path.getsize(self.get_log_path())
+        except FileNotFoundError:
+            return False
+        return size >= MEM_MAX_BYTES or get_time() - self.id_time() >= MEM_MAX_AGE
+
+    def manifest_changed(self):
+        """Has the manifest changed since this handle last looked at it?"""
+        try:
+            mtime = os.stat(MemoryManifest().path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        return mtime != self.manifest_mtime
+
+    def sync(self, rotate=False):
+        """
+        Make sure this handle writes to the current log. Under the manifest
+        lock, if another process or handle has made a different log current,
+        switch to it; otherwise, if this log needs rotation (or rotate is
+        True), close it and start a new one. So however many handles find
+        the log due for rotation, only one writes its end record and starts
+        the next log.
+        """
+        def func(d):
+            current = d.get('current')
+            if current and current != self.id and os.path.exists(Memory.log_path(current)):
+                self.switch(current)
+            elif current != self.id or not os.path.exists(self.get_log_path()):
+                # There's no current log to switch to.
+                self.start_log(d)
+            elif rotate or self.needs_rotation():
+                print("Rotando memoria {}".format(self))
+                self.end_log()
+                if self.id not in d['closed']:
+                    d['closed'].append(self.id)
+                d['current'] = None
+                self.start_log(d)
+        manifest = MemoryManifest()
+        manifest.update(func)
+        self.manifest_mtime = manifest.mtime
+
+    def rotate(self):
+        """Close this Memory's log and continue in a new one, unless another
+        process has already rotated it, in which case continue in its new one."""
+        self.sync(rotate=True)
+
+    def switch(self, id):
+        """Continue in the log of the Memory with id."""
+        self.id = id
+        self.start = self.id_time()
+        self.end = None
+        self.running = True
+
+    def start_log(self, d):
+        """Start a new log, making it the current one in the manifest dict d,
+        which is being updated under the lock."""
+        self.start = get_time()
+        self.end = None
+        self.running = True
+        self.make_id()
+        self.get_log().create()
+        old = d.get('current')
+        if old and old != self.id and old not in d['closed']:
+            d['closed'].append(old)
+        d['current'] = self.id
+
+    def end_log(self):
+        """Put the end time in the last line of the log."""
+        self.end = get_time()
+        WRITER.append(self.get_log_path(), {'end': time2str(self.end)}, self.end)
+        # Everything must be in the log before it can be compacted.
+        WRITER.flush()
+
     def read(self):
-        file = open(self.get_path(), encoding='utf8')
-        return yaml.load(file)
+        """All records in the Memory, as a list."""
+        return list(self.iter_records())
+
+    def iter_records(self, start=0):
+        """Generate the records in the Memory from position start."""
+        log = self.get_log()
+        if log.exists():
+            return log.iter_records(start=start)
+        archive = Memory.archive_path(self.id)
+        if os.path.exists(archive):
+            return Memory.iter_archive(archive, start)
+        # An old YAML memory
+        with open(self.get_path(), encoding='utf8') as file:
+            records = yaml.load(file, Loader=yaml.FullLoader) or []
+        return iter(records[start:])
+
+    @staticmethod
+    def iter_archive(path, start=0):
+        with gzip.open(path, 'rt', encoding='utf8') as file:
+            for position, line in enumerate(file):
+                if position >= start:
+                    yield json.loads(line)
+
+    def last(self, n):
+        """The last n records in the Memory."""
+        return self.get_log().last(n)
+
+    def between(self, start=None, end=None):
+        """Generate the records made at or after start and before end (datetimes)."""
+        return self.get_log().between(start, end)
+
+    @staticmethod
+    def record_time(record):
+        """The time a record in a Memory log was made."""
+        time = record.get('time') or record.get('end')
+        return str2time(time) if time else None
 
     def get_path(self):
-        memoryfilename = self.id + ".mem"
+        """Path of an old YAML memory file."""
+        memoryfilename = self.id + MEM_EXT
         return os.path.join(SESSIONS_DIR, memoryfilename)
 
+    @staticmethod
+    def log_path(id):
+        return os.path.join(SESSIONS_DIR, id + MEMLOG_EXT)
+
+    @staticmethod
+    def archive_path(id):
+        return os.path.join(SESSIONS_DIR, id + MEMGZ_EXT)
+
+    def get_log_path(self):
+        return Memory.log_path(self.id)
+
+    def get_log(self):
+        return RecordLog(self.get_log_path())
+
     def create_file(self):
-        """Create file for the Memory, putting start time in first line.
-        File contains a YAML list."""
-        with open(self.get_path(), 'w', encoding='utf8') as file:
-            print("- {}".format(time2str(self.start)), file=file)
+        """Create the log for the Memory and make it the current one.
+        The start time is in its id."""
+        manifest = MemoryManifest()
+        manifest.update(self.start_log)
+        self.manifest_mtime = manifest.mtime
 
     def record(self, sentrecord, translation=None, segtrans=None, comments=None):
         """Record the translation for sentrecord in this Memory."""
         print("Registrando traducción para {}: {}".format(sentrecord.raw, translation))
         if translation:
+            if self.needs_rotation() or self.manifest_changed():
+                self.sync()
             sentrecord.record(translation, comments=comments)
             d = sentrecord.to_dict(user=self.user)
             print(" Dicc del registro: {}".format(d))
-            with open(self.get_path(), 'a', encoding='utf8') as file:
-                yaml.dump([d], file, default_flow_style=False)
+            WRITER.append(self.get_log_path(), d, sentrecord.time)
+            for listener in Memory.listeners:
+                listener(self, d)
         # Eventually handles Segment records too?
 #        with open(self.get_path(), 'a', encoding='utf8') as file:
 #            print(self.trans2string(translation), file=file)
@@ -201,9 +492,8 @@ class Memory(Record):
         """Close this memory, puting the end time in the last line.
         Further translations are recorded in another memory.
         If create_new is True, create the next one."""
-        self.end = get_time()
-        with open(self.get_path(), 'a', encoding='utf8') as file:
-            print("- {}".format(time2str(self.end)), file=file)
+        self.end_log()
+        MemoryManifest().close(self.id)
         self.running = False
         if create_new:
             return Memory()
@@ -216,6 +506,69 @@ class Memory(Record):
         User.write_new()
         User.new_users.clear()
         self.running = False
+        WRITER.flush()
+
+    @staticmethod
+    def compact(id):
+        """
+        Compress the closed Memory with id into an archive, leaving out
+        records with the same source, translation, and user as an earlier one.
+        Returns the number of records kept.
+        """
+        memory = Memory(id=id)
+        log = memory.get_log()
+        if not log.exists():
+            return 0
+        seen = set()
+        kept = 0
+        tmp = Memory.archive_path(id) + '.tmp'
+        with gzip.open(tmp, 'wb') as archive:
+            for record in log:
+                if 'src' in record:
+                    key = (record['src'].get('raw'), record.get('trg'), record.get('user'))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                archive.write(RecordLog.encode(record))
+                kept += 1
+        os.replace(tmp, Memory.archive_path(id))
+        MemoryManifest().archive(id)
+        os.remove(log.path)
+        os.remove(log.index_path)
+        print("Memoria {} comprimida: {} registros".format(id, kept))
+        return kept
+
+    @staticmethod
+    def compact_all():
+        """Compact all closed Memories. Returns the number compacted."""
+        manifest = MemoryManifest()
+        now = time.time()
+        closed = [id for id in manifest.read()['closed']
+                  if os.path.exists(Memory.log_path(id)) and \
+                  now - os.path.getmtime(Memory.log_path(id)) > COMPACT_GRACE]
+        with open(manifest.lock_path + '.compact', 'a') as lock:
+            try:
+                # Only one process compacts at a time
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            for id in closed:
+                Memory.compact(id)
+        return len(closed)
+
+    @staticmethod
+    def start_compaction(interval=COMPACT_INTERVAL):
+        """Compact closed Memories every interval seconds in a background thread."""
+        def run():
+            while True:
+                try:
+                    Memory.compact_all()
+                except Exception as e:
+                    print("Error al comprimir memorias: {}".format(e))
+                time.sleep(interval)
+        thread = threading.Thread(target=run, name='compact', daemon=True)
+        thread.start()
+        return thread
 
 class Session(Record):
     """A record of a single user's responses to a set of sentences."""
@@ -285,6 +638,7 @@ class Session(Record):
         self.running = False
         self.end = get_time()
         self.save()
+        WRITER.flush()
 
 #    def record_translation(self, sentrecord, translation):
 #        """Only record a verbatim translation of the sentence."""
@@ -343,10 +697,10 @@ class Session(Record):
 #            segrecord.record(choices=tra_choices)
 
     def save(self):
-        """Write the session feedback to the user's file."""
-        path = self.user.get_session_path()
-        with open(path, 'a', encoding='utf8') as file:
-            self.write(file=file)
+        """Append the session feedback to the user's session log."""
+        d = self.to_dict()
+        if d:
+            WRITER.append(session_log_path(self.user.username), d, self.start)
 
     def write(self, file=sys.stdout):
         """Write the Session's information and contents to a file our stdout.
@@ -386,6 +740,11 @@ class SentRecord:
         self.raw = sentence.original
         self.tokens = sentence.tokens
         self.analyses = sentence.analyses
+        # Source and target languages, as in the cache and the translation memory
+        if sentence.language and sentence.target:
+            self.pair = "{}-{}".format(sentence.language.abbrev, sentence.target.abbrev)
+        else:
+            self.pair = ''
         self.time = get_time()
         self.user = user
         # Add to parent Session (but not to Memory)
@@ -457,6 +816,8 @@ class SentRecord:
             d['src'] = s
             d['trg'] = self.translation
             d['time'] = time2str(self.time)
+            if self.pair:
+                d['lang'] = self.pair
             if self.comments:
                 d['cmt'] = self.comments
             if segs:
@@ -648,8 +1009,10 @@ class User:
         path = User.get_path(username)
         with open(path, encoding='utf8') as file:
             d = yaml.load(file, Loader=yaml.FullLoader)
-            u = User.dict2user(d, new=False)
-        return u
+        if not isinstance(d, dict):
+            print("Archivo de usuario {} vacío o ilegible".format(path))
+            return
+        return User.dict2user(d, new=False)
 
     def user2dict(self):
         """Create a dictionary of user properties."""
@@ -689,21 +1052,43 @@ class User:
        return User.users.get(username)
 
     def write(self, file=sys.stdout):
-        print("{};{};{};{};{}".format(self.username, self.pw_hash, self.email, self.name, self.level), file=file)
+        print(self.users_line(), file=file)
+
+    def users_line(self):
+        """The user's line in the users file."""
+        return "{};{};{};{};{}".format(self.username, self.pw_hash, self.email, self.name, self.level)
 
     @staticmethod
     def get_users_path():
         return os.path.join(SESSIONS_DIR, USERS_FILE)
 
     def get_session_path(self):
-        name = self.username + '.sess'
+        """Path of the user's old YAML sessions file."""
+        name = self.username + SESS_EXT
         return os.path.join(SESSIONS_DIR, name)
 
     def read_sessions(self):
-        """Read in the sessions file for this user, returning a list of session dicts."""
-        path = self.get_session_path()
-        # catch?
-        return yaml.load(open(path, encoding="utf8"))
+        """Read in the sessions for this user, returning a list of session dicts."""
+        return list(self.iter_sessions())
+
+    def iter_sessions(self, start=None, end=None):
+        """
+        Generate the session dicts for this user, only those starting at or
+        after start and before end (datetimes) if these are given.
+        """
+        log = RecordLog(session_log_path(self.username))
+        if log.exists():
+            return log.between(start, end)
+        # Old YAML sessions file
+        with open(self.get_session_path(), encoding="utf8") as file:
+            sessions = yaml.load(file, Loader=yaml.FullLoader) or []
+        return iter(s for s in sessions
+                    if (not start or shortstr2time(s['start']) >= start) and \
+                    (not end or shortstr2time(s['start']) < end))
+
+    def last_sessions(self, n):
+        """The user's last n session dicts."""
+        return RecordLog(session_log_path(self.username)).last(n)
 
     @staticmethod
     def get_path(username):
@@ -719,6 +1104,8 @@ class User:
                 username, pw_hash, email, name, level = line.strip().split(';')
                 level = int(level)
                 user = User.from_file(username)
+                if not user:
+                    continue
 #                userfile = User.get_path()
 #                user = User(username=username, pw_hash=pw_hash, email=email, name=name, level=level,
 #                            new=False)
@@ -731,17 +1118,17 @@ class User:
         """
         if User.new_users:
             print("Creando nuevos usuarios {}".format(User.new_users))
-            with open(User.get_users_path(), 'a', encoding='utf8') as file:
-                for username, user in User.new_users.items():
-                    print("  Usuario {}".format(user))
-                    user.create_user_file()
-                    user.write(file=file)
+            for username, user in User.new_users.items():
+                print("  Usuario {}".format(user))
+                user.create_user_file()
+                WRITER.write_text(User.get_users_path(), user.users_line() + '\n')
 
     def create_user_file(self):
         """Create user file with basic data about the user (to be changed later)."""
         d = self.user2dict()
-        with open(User.get_path(self.username), 'w', encoding='utf8') as file:
-            yaml.dump(d, file, default_flow_style=False)
+        # Replaced as a whole, so SessionManager never reads it half written
+        WRITER.write_text(User.get_path(self.username),
+                          yaml.dump(d, default_flow_style=False), mode='w')
 
     @staticmethod
     def get_user(username):
@@ -754,3 +1141,159 @@ class User:
         if not anon:
             anon = User(username=User.anon_user, email=User.anon_email, password=User.anon_pw, name=User.anon_name, new=True)
         return anon
+
+def session_log_path(username):
+    return os.path.join(SESSIONS_DIR, username + SESSLOG_EXT)
+
+def migrate_records(directory=SESSIONS_DIR):
+    """
+    Convert the old YAML .mem and .sess files in directory to logs, leaving
+    the old files where they are. Files that already have logs are skipped.
+    Returns the number of files converted.
+    """
+    nconverted = 0
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.endswith(MEM_EXT):
+            log = RecordLog(path[:-len(MEM_EXT)] + MEMLOG_EXT)
+        elif filename.endswith(SESS_EXT):
+            log = RecordLog(path[:-len(SESS_EXT)] + SESSLOG_EXT)
+        else:
+            continue
+        if log.exists():
+            continue
+        with open(path, encoding='utf8') as file:
+            items = yaml.load(file, Loader=yaml.FullLoader) or []
+        records = []
+        times = []
+        if filename.endswith(MEM_EXT):
+            # The first item is the start time, which is also the Memory's id
+            for item in items[1:]:
+                if not isinstance(item, dict):
+                    # End time
+                    item = {'end': item}
+                records.append(item)
+                times.append(Memory.record_time(item))
+        else:
+            for item in items:
+                records.append(item)
+                times.append(shortstr2time(item['start']))
+        log.create()
+        log.append(records, times)
+        print("{} -> {}: {} registros".format(filename, os.path.basename(log.path), len(records)))
+        nconverted += 1
+    return nconverted
+
+class SessionManager:
+    """
+    Users and the current Memory for a process, kept between calls. The
+    users file and the .usr files are read again only when their modification
+    times change, and the manifest only when it changes, so that getting a
+    Session or Memory normally doesn't read anything. Files are checked at
+    most every check_interval seconds.
+    """
+
+    def __init__(self, check_interval=SESSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        # Modification times of the users file and the .usr files, with paths as keys
+        self.mtimes = {}
+        # Usernames in the users file when it was last read
+        self.usernames = []
+        self.last_check = 0.0
+        # Id of the current Memory and Memory handles for it, with usernames as keys
+        self.memory_id = None
+        self.memories = {}
+        self.manifest_mtime = None
+        self.pid = None
+
+    def __repr__(self):
+        return "<SessionManager({} usuarios, {})>".format(len(User.users), self.memory_id)
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reset(self):
+        """Called in forked children: the lock may have been held by another
+        thread of the parent when it forked, and would never be released."""
+        self.lock = threading.RLock()
+
+    def refresh(self, force=False):
+        """Read users and the manifest again if their files have changed."""
+        now = time.time()
+        with self.lock:
+            if self.pid != os.getpid():
+                # Memory handles aren't shared with a parent process.
+                self.memories.clear()
+                self.memory_id = None
+                self.manifest_mtime = None
+                self.pid = os.getpid()
+                force = True
+            if not force and now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+            self.refresh_users()
+            manifest_mtime = SessionManager.mtime(MemoryManifest().path)
+            if manifest_mtime != self.manifest_mtime:
+                self.manifest_mtime = manifest_mtime
+                current = MemoryManifest().current()
+                if current != self.memory_id:
+                    self.memory_id = current
+                    self.memories.clear()
+
+    def refresh_users(self):
+        """Read the users file if it has changed, and the .usr files that have."""
+        path = User.get_users_path()
+        mtime = SessionManager.mtime(path)
+        if mtime is None:
+            return
+        if mtime != self.mtimes.get(path):
+            self.mtimes[path] = mtime
+            with open(path, encoding='utf8') as file:
+                self.usernames = [line.split(';')[0] for line in file if line.strip()]
+        # A .usr file can change, or become readable, when the users file doesn't.
+        for username in self.usernames:
+            userpath = User.get_path(username)
+            usermtime = SessionManager.mtime(userpath)
+            if usermtime is None or usermtime == self.mtimes.get(userpath):
+                continue
+            # If the file can't be read, it's tried again next time.
+            if User.from_file(username):
+                self.mtimes[userpath] = usermtime
+
+    def get_user(self, user, use_anon=True):
+        """The User for user (a User or username), or the anonymous one."""
+        self.refresh()
+        if isinstance(user, str):
+            user = User.get_user(user)
+        if use_anon and not user:
+            user = User.get_anon()
+        return user
+
+    def memory(self, username=''):
+        """The Memory for the current memory log, recording as username."""
+        self.refresh()
+        with self.lock:
+            memory = self.memories.get(username)
+            if memory and memory.id == self.memory_id and memory.running:
+                return memory
+            memory = Memory.recreate(user=username)
+            # recreate() may have started or rotated the log.
+            if memory.id != self.memory_id:
+                self.memory_id = memory.id
+                self.memories.clear()
+                self.manifest_mtime = SessionManager.mtime(MemoryManifest().path)
+            self.memories[username] = memory
+            return memory
+
+    def session(self, source, target, user, create_memory=False, use_anon=True):
+        """A Memory (if create_memory is True) or Session for user."""
+        user = self.get_user(user, use_anon=use_anon)
+        if create_memory:
+            return self.memory(user.username if user else '')
+        elif user:
+            return Session(source=source, target=target, user=user)
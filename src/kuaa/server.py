@@ -0,0 +1,201 @@
+#
+#   Mainumby: preforking server for production.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. The parent process loads the languages and the Text DB
+#    metadata, freezes its heap, and forks the workers, which share all of
+#    this copy-on-write.
+#    Each worker has its own GUIStore, so a browser's GUI state lives in
+#    the worker that created it; use few threaded workers (or a proxy with
+#    sticky sessions) rather than many single-threaded ones.
+# -- Children flush their RecordWriter before exiting on SIGTERM.
+# -- JOB_WORKERS processes translate the sentences of queued jobs.
+# -- Children write their metrics before exiting.
+# -- Workers create their translation pools before serving, and close them
+#    when they stop.
+# -- One threaded worker by default, since the GUI state of a browser is
+#    lost when its next request goes to another worker. More workers only
+#    behind a proxy with sticky sessions, or for the API alone.
+
+import gc, os, signal, socket, sys
+from sqlalchemy.orm import configure_mappers
+from werkzeug.serving import make_server
+
+from . import app, db, load, get_domains_texts, tm_index, Memory, WRITER, METRICS
+from .parallel import start_pools, close_pools
+from . import pretranslate as pretranslate_texts
+from .jobs import run_worker as run_jobs
+
+# Default number of worker processes; with more than one, a browser's GUI
+# state is only found by requests that reach the worker that created it.
+WORKERS = 1
+# Length of the queue of pending connections on the shared socket
+BACKLOG = 128
+# Seconds a stopping process waits for its queued records to be written
+FLUSH_TIMEOUT = 10
+
+def preload(source='spa', target='grn'):
+    """
+    Load everything that each worker would otherwise load on its own:
+    the language pair, the translation memory, and the Text DB mappers and
+    metadata. Returns the source and target languages.
+    """
+    print("Cargando {} y {}...".format(source, target))
+    languages = load(source, target)
+    tm_index.load()
+    configure_mappers()
+    with app.app_context():
+        get_domains_texts()
+        db.session.remove()
+    # DB connections must not be shared by processes.
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS', {})):
+        db.get_engine(app, bind=bind).dispose()
+    return languages
+
+def listen(host, port):
+    """Create the listening socket that all workers accept on."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+def serve(host='0.0.0.0', port=5000, workers=WORKERS, threaded=True,
+          pretranslate=False):
+    """
+    Load languages and data once, then fork the worker processes, each serving
+    the app on the same socket. Dead workers are replaced; SIGTERM or SIGINT
+    stops them all. Another process compacts closed Memories, app.config
+    ['JOB_WORKERS'] translate queued jobs, and if pretranslate is True,
+    another translates the stored Texts in advance.
+    """
+    # Objects created before the fork stay where they are; collecting them in
+    # the parent (or in the children) would write to their pages and undo
+    # the sharing.
+    gc.disable()
+    languages = preload()
+    sock = listen(host, port)
+    gc.freeze()
+    children = set()
+    tasks = set()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children | tasks:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print("Sirviendo en http://{}:{} con {} procesos".format(host, port, workers))
+    if workers > 1:
+        print("Advertencia: cada proceso tiene su propio estado de la interfaz; "
+              "use un proxy con sesiones persistentes (sticky sessions)")
+    for i in range(workers):
+        children.add(fork_worker(sock, host, port, threaded, languages))
+    # Other processes, which aren't replaced
+    tasks.add(fork_task('compactación', compact_memories))
+    for i in range(app.config.get('JOB_WORKERS', 0)):
+        tasks.add(fork_task('trabajos', run_jobs))
+    if pretranslate:
+        tasks.add(fork_task('pretraducción', pretranslate_texts))
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid not in children:
+            tasks.discard(pid)
+            continue
+        children.discard(pid)
+        if not stopping:
+            print("Proceso {} terminó ({}); reemplazándolo".format(pid, status))
+            children.add(fork_worker(sock, host, port, threaded, languages))
+    sock.close()
+
+def fork_worker(sock, host, port, threaded, languages):
+    """Fork a worker process serving on sock, returning its pid. Its pool
+    for translating documents between languages (a (source, target) pair)
+    is created before it serves any request, while it has only one thread."""
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        gc.enable()
+        start_pools(*languages, app.config.get('DOC_TRANS_PROCS', 0))
+        server = make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+        server.serve_forever()
+    except SystemExit:
+        pass
+    except Exception as e:
+        print("Error en proceso {}: {}".format(os.getpid(), e), file=sys.stderr)
+        status = 1
+    finally:
+        # os._exit() skips atexit, so the records are written and the pools
+        # stopped here.
+        close_pools(terminate=True)
+        WRITER.flush(FLUSH_TIMEOUT)
+        METRICS.dump()
+        os._exit(status)
+
+def terminate(signum, frame):
+    """SIGTERM handler for the children, so that they stop cleanly."""
+    raise SystemExit(0)
+
+def fork_task(name, func):
+    """Fork a process that runs func in the app context, returning its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, terminate)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        gc.enable()
+        with app.app_context():
+            func()
+    except SystemExit:
+        pass
+    except Exception as e:
+        print("Error en {}: {}".format(name, e), file=sys.stderr)
+        status = 1
+    finally:
+        WRITER.flush(FLUSH_TIMEOUT)
+        METRICS.dump()
+        os._exit(status)
+
+def compact_memories():
+    """Compact closed Memories periodically; runs until killed."""
+    Memory.start_compaction().join()
@@ -30,6 +30,16 @@
 # 2019.08.15
 # -- Added SerializerMixin, with to_dict() method inherited for all DB classes.
 # -- 'creation' datetimes for Human, Text, and Translation
+# 2026.10
+# -- TextSegTra: machine translations of TextSegs made in advance.
+# -- Human.username is unique and indexed (TextDB.migrate() adds the index
+#    to existing DBs).
+# -- Indexes on the foreign keys of TextSeg (with index), TextTok (with
+#    index), and TraSeg. Segments and tokens are ordered by index.
+# -- A TextSeg's tokens are stored in the TextSeg, as a JSON list, rather
+#    than as TextToks, which are only read in DBs not yet migrated.
+# -- Texts are read from files a paragraph at a time and segmented a chunk
+#    of paragraphs at a time (Text.segment_paragraphs()).
 
 #from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime
 #from sqlalchemy.ext.declarative import declarative_base
@@ -38,9 +48,8 @@ from flask_sqlalchemy import SQLAlchemy
 # from sqlalchemy import inspect
 from werkzeug.security import generate_password_hash, check_password_hash
 #from sqlalchemy_serializer import SerializerMixin
-import datetime, os
-import docx
-from .utils import get_time
+import datetime, json, os, zipfile
+from .utils import get_time, iter_paragraphs, iter_docx_paragraphs, split_paragraphs, iter_chunks, oradoc_html, PARA_SEP
 from mbojereha.sentence import Document
 from mbojereha.language import Language
 
@@ -61,7 +70,7 @@ class Human(db.Model):
     __bind_key__ = "text"
 
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String)
+    username = db.Column(db.String, unique=True, index=True)
     name = db.Column(db.String)
     email = db.Column(db.String)
     pw_hash = db.Column(db.String)
@@ -137,17 +146,46 @@ class Text(db.Model):
 
     ### Segmentation
     def segment(self):
-        # Let Document do the sentence tokenization work.
-        doc = Document(text=self.content, language=self.language)
-        # Set HTML from the Doc
-        doc.set_html()
-        self.html = doc.html
-        for index, (sentence, shtml) in enumerate(zip(doc, doc.html_list)):
+        self.segment_from(split_paragraphs(self.content))
+
+    def segment_from(self, paragraphs):
+        """Make TextSegs for the sentences in paragraphs, the Text's content."""
+        seghtml = []
+        for index, original, tokens, shtml in \
+                Text.segment_paragraphs(paragraphs, self.language):
             # Make a TextSeg for each Sentence in the Document
-            textseg = TextSeg(text=self, content=sentence.original, index=index, html=shtml)
-            for tokindex, token in enumerate(sentence.tokens):
-                # Make a TextTok for each token in the TextSeg
-                TextTok(string=token, textseg=textseg, index=tokindex)
+            TextSeg(text=self, content=original, index=index, html=shtml,
+                    tokens=tokens)
+            seghtml.append(shtml)
+        self.html = "<div id='doc'>" + ''.join(seghtml) + "</div>"
+
+    @staticmethod
+    def segment_paragraphs(paragraphs, language):
+        """
+        Generate (index, original, tokens, html) for each sentence in the
+        paragraphs (strings), letting Document do the sentence tokenization
+        work on a chunk of paragraphs at a time. When a chunk ends within a
+        paragraph, its last sentence may be incomplete, so it is segmented
+        again with the next chunk.
+        """
+        index = 0
+        carry = ''
+        for text, complete in iter_chunks(paragraphs):
+            if carry:
+                # The whitespace the chunk was split at is gone from the
+                # end of the carried sentence.
+                text = carry + ' ' + text
+            sentences = list(Document(text=text, language=language))
+            carry = ''
+            if not complete and sentences:
+                carry = sentences.pop().original
+            for sentence in sentences:
+                yield index, sentence.original, sentence.tokens, oradoc_html(index, sentence.original)
+                index += 1
+        if carry.strip():
+            for sentence in Document(text=carry, language=language):
+                yield index, sentence.original, sentence.tokens, oradoc_html(index, sentence.original)
+                index += 1
 
     def set_language(self):
         if not self.language:
@@ -177,22 +215,37 @@ class Text(db.Model):
     def read(name, domain="Miscelánea", title='', segment=True):
         """Read a file in the 'texts' directory and create a Text object
         from its contents."""
-        content = ''
         # Get all the files with this name and different extensions
         files = Text.get_files(name)
         # .txt files have priority over .docx
         if any([f.endswith(TEXT_EXT) for f in files]):
             path = Text.get_text_path(name)
-            try:
-                with open(path, encoding='utf8') as f:
-                    content = f.read()
-            except IOError:
-                print("No se pudo encontrar el archivo {}".format(path))
         elif any([f.endswith(DOCX_EXT) for f in files]):
-            content = Text.docx2txt(name)
-        if content:
-            return Text(name=name, domain=domain, content=content, title=title,
-                        segment=segment)
+            path = Text.get_text_path(name, ext=DOCX_EXT)
+        else:
+            path = None
+        if path:
+            text = Text(name=name, domain=domain, title=title)
+            # The paragraphs read so far, for the content
+            paragraphs = []
+            def read():
+                for paragraph in iter_paragraphs(path):
+                    paragraphs.append(paragraph)
+                    yield paragraph
+            try:
+                if segment:
+                    # Sentences are segmented as the file is read.
+                    text.segment_from(read())
+                else:
+                    for paragraph in read():
+                        pass
+            except (IOError, zipfile.BadZipFile, KeyError):
+                print("No se pudo leer el archivo {}".format(path))
+                paragraphs = []
+            content = PARA_SEP.join(paragraphs)
+            if content:
+                text.content = content
+                return text
         print("No existe un archivo con nombre {}".format(name))
 
     @staticmethod
@@ -201,12 +254,8 @@ class Text(db.Model):
         if not path:
             path = Text.get_text_path(name, ext='.docx')
         try:
-            doc = docx.Document(path)
-            text = [para.text for para in doc.paragraphs]
-            # Join paragraphs with something other than
-            text = '\n\n'.join(text)
-            return text
-        except docx.opc.exceptions.PackageNotFoundError:
+            return PARA_SEP.join(iter_docx_paragraphs(path))
+        except (IOError, zipfile.BadZipFile, KeyError):
             print("No se pudo encontrar el archivo {}".format(path))
 
 class TextSeg(db.Model):
@@ -219,23 +268,72 @@ class TextSeg(db.Model):
     content = db.Column(db.String)
     index = db.Column(db.Integer)
     text_id = db.Column(db.Integer, db.ForeignKey('texts.id'))
-    text = db.relationship("Text", backref=db.backref('segments', lazy=True),
+    text = db.relationship("Text", backref=db.backref('segments', lazy=True,
+                                                      order_by='TextSeg.index'),
                            cascade="all, delete")
     # HTML for the sentence
     html = db.Column(db.String)
+    # Token strings, as a JSON list
+    toks = db.Column(db.String)
+    # Also serves for finding the TextSegs of a Text
+    __table_args__ = (db.Index('ix_textsegs_text_id_index', 'text_id', 'index'),)
 
-    def __init__(self, text='', content='', index=0, html=''):
+    def __init__(self, text='', content='', index=0, html='', tokens=None):
         self.text = text
         self.content = content
         self.index = index
         self.html = html
+        if tokens is not None:
+            self.tokens = tokens
+
+    @property
+    def tokens(self):
+        """The list of token strings."""
+        if self.toks is None:
+            # Not migrated
+            return [tt.string for tt in self.texttoks]
+        return json.loads(self.toks)
+
+    @tokens.setter
+    def tokens(self, tokens):
+        self.toks = json.dumps(list(tokens), ensure_ascii=False)
 
     def __repr__(self):
         content = self.content[:25] + '...' if len(self.content) > 25 else self.content
         return "<TextSeg({}, {})>".format(self.id, content)
 
+class TextSegTra(db.Model):
+    """
+    The machine translation of a TextSeg, made in advance, both as a final
+    string and as segment HTML for offering options. version is the lexicon
+    version it was made with; other versions are ignored.
+    """
+
+    __tablename__ = 'textsegtras'
+    __bind_key__ = "text"
+
+    id = db.Column(db.Integer, primary_key=True)
+    textseg_id = db.Column(db.Integer, db.ForeignKey('textsegs.id'), index=True)
+    textseg = db.relationship("TextSeg",
+                              backref=db.backref('tras', lazy=True,
+                                                 cascade="all, delete-orphan"))
+    version = db.Column(db.String)
+    # Translation without options
+    final = db.Column(db.String)
+    # JSON list of segment HTML tuples, or None if they couldn't be stored
+    seg_html = db.Column(db.String)
+
+    def __init__(self, textseg=None, version='', final='', seg_html=None):
+        self.textseg = textseg
+        self.version = version
+        self.final = final
+        self.seg_html = seg_html
+
+    def __repr__(self):
+        return "<TextSegTra({}, {}, {})>".format(self.id, self.textseg_id, self.version)
+
 class TextTok(db.Model):
-    """A token within a TextSeg."""
+    """A token within a TextSeg, as they were stored before TextSeg.toks."""
 
     __tablename__ = 'texttoks'
     __bind_key__ = "text"
@@ -244,8 +342,10 @@ class TextTok(db.Model):
     string = db.Column(db.String)
     index = db.Column(db.Integer)
     textseg_id = db.Column(db.Integer, db.ForeignKey('textsegs.id'))
-    textseg = db.relationship("TextSeg", backref=db.backref('tokens', lazy=True),
+    textseg = db.relationship("TextSeg", backref=db.backref('texttoks', lazy=True,
+                                                            order_by='TextTok.index'),
                               cascade="all, delete")
+    __table_args__ = (db.Index('ix_texttoks_textseg_id_index', 'textseg_id', 'index'),)
 
     def __init__(self, string='', textseg='', index=0):
         self.textseg = textseg
@@ -298,7 +398,7 @@ class TraSeg(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String)
     index = db.Column(db.Integer)
-    translation_id = db.Column(db.Integer, db.ForeignKey('translations.id'))
+    translation_id = db.Column(db.Integer, db.ForeignKey('translations.id'), index=True)
     translation = db.relationship("Translation", backref=db.backref('trasegs', lazy=True), cascade="all, delete")
 
     def __init__(self, content='', translation=None, index=0):
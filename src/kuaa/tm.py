@@ -0,0 +1,253 @@
+#
+#   Mainumby: translation memory built from recorded Memory files.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+# 2026.10
+# -- Created. Exact lookup by normalized source sentence; fuzzy lookup by
+#    shared token n-grams, ranked by token edit distance.
+# -- Memory logs are read from the byte offset where the last read stopped,
+#    whenever their size has changed, at most every REFRESH_INTERVAL
+#    seconds, so translations recorded by other processes are found too.
+#    Only complete lines are read. n-grams in more than MAX_POSTINGS
+#    entries are dropped from the fuzzy index, since they select nothing.
+# -- Entries have the language pair of their record (records without one are
+#    from DEFAULT_PAIR), and lookups are for a pair. match_case() gives a
+#    translation the case of the sentence it's used for.
+
+import os, re, threading, time
+from collections import defaultdict, Counter
+
+from .record import Memory, SESSIONS_DIR
+
+# Token unigrams and bigrams are indexed
+NGRAM = 2
+# Minimum similarity (1 - normalized token edit distance) for fuzzy matches
+FUZZY_THRESHOLD = 0.7
+# Candidates sharing the most n-grams that are scored for fuzzy lookup
+CANDIDATES = 50
+# n-grams in more entries than this aren't used for fuzzy lookup
+MAX_POSTINGS = 1000
+# Seconds between checks of the Memory files for new records
+REFRESH_INTERVAL = 5.0
+# Language pair of records that don't have one, all made before pairs were recorded
+DEFAULT_PAIR = 'spa-grn'
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def normalize(sentence):
+    """Case-fold the sentence and collapse its whitespace."""
+    return ' '.join(sentence.split()).casefold()
+
+def tokenize(sentence):
+    return TOKEN_RE.findall(normalize(sentence))
+
+def language_pair(source, target):
+    """The pair of languages (Language objects) as it is recorded."""
+    return "{}-{}".format(source.abbrev, target.abbrev)
+
+def match_case(translation, sentence):
+    """translation with its first letter in the case of sentence's."""
+    first = next((c for c in sentence if c.isalpha()), '')
+    for index, c in enumerate(translation):
+        if c.isalpha():
+            c = c.upper() if first.isupper() else c.lower() if first.islower() else c
+            return translation[:index] + c + translation[index+1:]
+    return translation
+
+def ngrams(tokens, n=NGRAM):
+    """All token k-grams for k from 1 to n."""
+    return {tuple(tokens[i:i+k]) for k in range(1, n+1) for i in range(len(tokens)-k+1)}
+
+def edit_distance(seq1, seq2):
+    """Levenshtein distance between two sequences."""
+    if len(seq1) < len(seq2):
+        seq1, seq2 = seq2, seq1
+    previous = list(range(len(seq2) + 1))
+    for i, x in enumerate(seq1, 1):
+        current = [i]
+        for j, y in enumerate(seq2, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1,
+                               previous[j-1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+def similarity(tokens1, tokens2):
+    longer = max(len(tokens1), len(tokens2))
+    if not longer:
+        return 1.0
+    return 1.0 - edit_distance(tokens1, tokens2) / longer
+
+class TMEntry:
+    """A human translation of a source sentence."""
+
+    def __init__(self, source, target, user='', time='', pair=DEFAULT_PAIR):
+        self.source = source
+        self.target = target
+        self.user = user
+        self.time = time
+        self.pair = pair
+        self.tokens = tokenize(source)
+
+    def __repr__(self):
+        return "<TMEntry({} -> {})>".format(self.source, self.target)
+
+class TMIndex:
+    """
+    Index of the sentence translations in the Memory files. Records made by
+    this process are added as Memory.record() makes them; the files are read
+    again, from where the last read stopped, when they grow.
+    """
+
+    def __init__(self, directory=SESSIONS_DIR, refresh_interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.entries = []
+        # (source, target, user, time) of entries, so records read again
+        # (or added by the listener and then read) are only added once
+        self.keys = set()
+        # (language pair, normalized source): indices of entries
+        self.exact = defaultdict(list)
+        # n-gram: indices of entries
+        self.grams = defaultdict(list)
+        # n-grams with more than MAX_POSTINGS entries
+        self.frequent = set()
+        # Memory id: byte offset read up to in its log, or None if the
+        # Memory has been read completely (an archive or an old YAML file)
+        self.files = {}
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.lock = threading.RLock()
+        Memory.listeners.append(self.memory_recorded)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "<TMIndex({})>".format(len(self.entries))
+
+    def add(self, source, target, user='', time='', pair=DEFAULT_PAIR):
+        """Add the translation of source to the index, unless it's there already."""
+        with self.lock:
+            key = source, target, user, time, pair
+            if key in self.keys:
+                return
+            self.keys.add(key)
+            entry = TMEntry(source, target, user=user, time=time, pair=pair)
+            index = len(self.entries)
+            self.entries.append(entry)
+            self.exact[(pair, normalize(source))].append(index)
+            for gram in ngrams(entry.tokens):
+                if gram in self.frequent:
+                    continue
+                postings = self.grams[gram]
+                postings.append(index)
+                if len(postings) > MAX_POSTINGS:
+                    self.frequent.add(gram)
+                    del self.grams[gram]
+            return entry
+
+    def memory_recorded(self, memory, record):
+        """Called by Memory.record() with each new record."""
+        with self.lock:
+            # Before loading, the record will be read from the file.
+            if not self.loaded:
+                return
+            self.add_record(record)
+
+    def add_record(self, record):
+        """Add a SentRecord dict, as written to a Memory file."""
+        if not isinstance(record, dict) or not record.get('trg'):
+            return
+        source = record.get('src', {}).get('raw')
+        if source:
+            return self.add(source, record['trg'], user=record.get('user', ''),
+                            time=record.get('time', ''),
+                            pair=record.get('lang', DEFAULT_PAIR))
+
+    def load(self):
+        """Index the records in all Memory files not yet read."""
+        with self.lock:
+            for id in Memory.memory_ids():
+                if id in self.files and self.files[id] is None:
+                    continue
+                self.load_memory(id)
+            self.loaded = True
+            self.last_refresh = time.time()
+
+    def load_memory(self, id):
+        """Index the records in the Memory with id not yet read."""
+        log = Memory(id=id).get_log()
+        offset = self.files.get(id, 0)
+        try:
+            size = os.path.getsize(log.path)
+        except FileNotFoundError:
+            # Archived or old YAML; records already read from the log are
+            # recognized by their keys.
+            for record in Memory(id=id).iter_records():
+                self.add_record(record)
+            self.files[id] = None
+            return
+        if size == offset:
+            return
+        records, offset = log.read_from(offset)
+        for record in records:
+            self.add_record(record)
+        self.files[id] = offset
+
+    def ensure_loaded(self):
+        """Load the Memory files, or read what's been added to them if they
+        haven't been checked for refresh_interval seconds."""
+        if not self.loaded or time.time() - self.last_refresh >= self.refresh_interval:
+            self.load()
+
+    def lookup(self, sentence, pair=DEFAULT_PAIR):
+        """Exact matches for the sentence string, translated between the
+        language pair, most recent first. Case and spacing are ignored."""
+        self.ensure_loaded()
+        with self.lock:
+            return [self.entries[i] for i in
+                    reversed(self.exact.get((pair, normalize(sentence)), []))]
+
+    def fuzzy(self, sentence, threshold=FUZZY_THRESHOLD, n=5, pair=DEFAULT_PAIR):
+        """
+        Up to n (similarity, TMEntry) pairs for source sentences similar to the
+        sentence string, translated between the language pair, best first.
+        """
+        self.ensure_loaded()
+        tokens = tokenize(sentence)
+        with self.lock:
+            shared = Counter()
+            for gram in ngrams(tokens):
+                shared.update(self.grams.get(gram, ()))
+            scored = []
+            for index, count in shared.most_common(CANDIDATES):
+                entry = self.entries[index]
+                if entry.pair != pair:
+                    continue
+                score = similarity(tokens, entry.tokens)
+                if score >= threshold:
+                    scored.append((score, entry))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return scored[:n]
@@ -27,8 +27,16 @@
 
 # 2014.07.08
 # -- Created
+# 2026.10
+# -- Paragraph readers for .txt and .docx files that don't load the whole
+#    file (.docx XML is parsed as a stream), and iter_chunks() for
+#    segmenting a stream of paragraphs a piece at a time.
+# -- text_from_doc() reads .txt files a line at a time too and reports
+#    .docx files that can't be read; long paragraphs are split only at
+#    whitespace.
 
-import unicodedata, re, datetime, docx
+import unicodedata, re, datetime, zipfile
+import xml.etree.ElementTree as ET
 from sys import getsizeof, stderr
 from itertools import chain
 from collections import deque
@@ -56,19 +64,140 @@ CAP_RE = re.compile(r"^([-–¿¡(\"\'‶“‘$]*)(\w)")
 CLEAN_RE = re.compile(r"\s+([.,;:?!)”″’%¶])")
 
 ## Documents
+
+# Separates paragraphs in the text of a document
+PARA_SEP = '\n\n'
+# Characters of text segmented at a time
+CHUNK_CHARS = 20000
+# A paragraph: text not including blank lines
+PARA_RE = re.compile(r"\S(?:.|\n(?![ \t]*\n))*")
+# The last whitespace in a string, and the first
+LAST_SPACE_RE = re.compile(r"\s+(?=\S*\Z)")
+SPACE_RE = re.compile(r"\s+")
+
+DOCX_BODY = 'word/document.xml'
+DOCX_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# HTML for a sentence in a document
+ORADOC_HTML = "<div class='oradoc' id='ora{0}' onclick='seleccionarOra(\"ora{0}\", {0})'>{1}</div>"
+
+def oradoc_html(index, original):
+    """HTML for the sentence with original text at index in a document."""
+    return ORADOC_HTML.format(index, original)
+
+def split_paragraphs(text):
+    """Generate the paragraphs (separated by blank lines) in a string."""
+    for match in PARA_RE.finditer(text):
+        yield match.group()
+
+def iter_paragraphs(path):
+    """Generate the paragraphs in a .docx or text file."""
+    if path.endswith('.docx'):
+        return iter_docx_paragraphs(path)
+    return iter_txt_paragraphs(path)
+
+def iter_txt_paragraphs(path):
+    """Generate the paragraphs (separated by blank lines) in a text file,
+    reading a line at a time."""
+    with open(path, encoding='utf8') as file:
+        lines = []
+        for line in file:
+            if line.strip():
+                lines.append(line.rstrip('\n'))
+            elif lines:
+                yield '\n'.join(lines)
+                lines = []
+        if lines:
+            yield '\n'.join(lines)
+
+def iter_docx_paragraphs(path):
+    """
+    Generate the text of the paragraphs in the body of a .docx file, as
+    python-docx's Document.paragraphs does, parsing the XML incrementally
+    and discarding each paragraph (or table) once it's done.
+    """
+    with zipfile.ZipFile(path) as docx, docx.open(DOCX_BODY) as xml:
+        depth = 0
+        body = None
+        for event, elem in ET.iterparse(xml, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 2 and elem.tag == DOCX_NS + 'body':
+                    body = elem
+                continue
+            depth -= 1
+            # Children of the body are at depth 2 when they start.
+            if depth == 2 and body is not None:
+                if elem.tag == DOCX_NS + 'p':
+                    yield docx_paragraph_text(elem)
+                body.remove(elem)
+
+def docx_paragraph_text(para):
+    """The text in a w:p element."""
+    text = []
+    for elem in para.iter():
+        if elem.tag == DOCX_NS + 't':
+            text.append(elem.text or '')
+        elif elem.tag == DOCX_NS + 'tab':
+            text.append('\t')
+        elif elem.tag in (DOCX_NS + 'br', DOCX_NS + 'cr'):
+            text.append('\n')
+    return ''.join(text)
+
+def iter_chunks(paragraphs, size=CHUNK_CHARS):
+    """
+    Join paragraphs into pieces of text of about size characters, generating
+    (text, complete) pairs. Pieces followed by more paragraphs end in
+    PARA_SEP. A paragraph longer than size is split at whitespace, which
+    stays at the end of the earlier piece, so no word is split and the
+    pieces add up to the paragraph; complete is False for all but its last
+    piece, since a sentence may continue in the next one.
+    """
+    chunk = []
+    nchars = 0
+    for para in paragraphs:
+        if not para.strip():
+            continue
+        if chunk and nchars >= size:
+            yield PARA_SEP.join(chunk) + PARA_SEP, True
+            chunk = []
+            nchars = 0
+        while len(para) > size:
+            cut = split_point(para, size)
+            if not cut:
+                break
+            if chunk:
+                yield PARA_SEP.join(chunk) + PARA_SEP, True
+                chunk = []
+                nchars = 0
+            yield para[:cut], False
+            para = para[cut:]
+        chunk.append(para)
+        nchars += len(para)
+    if chunk:
+        yield PARA_SEP.join(chunk), True
+
+def split_point(text, size):
+    """
+    Where to split text so that the first part is at most size characters,
+    after the last whitespace in them; if there is none, after the first
+    whitespace. None if text can't be split at whitespace.
+    """
+    match = LAST_SPACE_RE.search(text, 0, size)
+    if not match or not text[:match.start()].strip():
+        match = SPACE_RE.search(text, size)
+    if match and match.end() < len(text):
+        return match.end()
+
 def text_from_doc(path):
+    """The text of a .docx or text file, with its paragraphs separated by
+    PARA_SEP, or None if it can't be read."""
     try:
-        if path.endswith('.docx'):
-            doc = docx.Document(path)
-            text = [para.text for para in doc.paragraphs]
-            # Join paragraphs with something other than
-            text = '\n\n'.join(text)
-            return text
-        else:
-            with open(path, encoding='utf8') as file:
-                return ''.join(file.readlines())
+        return PARA_SEP.join(iter_paragraphs(path))
     except IOError:
         print("¡Archivo no encontrado!")
+    except (zipfile.BadZipFile, KeyError):
+        print("¡{} no es un archivo .docx válido!".format(path))
 #    except docx.opc.exceptions.PackageNotFoundError:
 #        print("No se pudo encontrar el archivo {}".format(path))
 
@@ -45,48 +45,163 @@
 # 2019.03
 # -- GUI class holds variables that used to be global. The one
 #    global is the instance of GUI.
+# 2026.10
+# -- The global GUI is replaced by a GUIStore, with one GUI instance for
+#    each browser session.
+# -- tradtodo view streams the translations of a whole document as
+#    server-sent events.
+# -- Sentences in stored Texts use translations made in advance, if any.
+# -- Human translations of similar sentences from the translation memory
+#    are offered with the system's translation.
+# -- oradoc view: a sentence selected in a document is translated and only
+#    the changed parts of the page are returned, as JSON.
+# -- /api/translate and /api/translate/batch: JSON translation for other
+#    programs, without a GUI instance or templates.
+# -- /api/jobs: documents and Texts translated by the job workers, with
+#    status and results polled by the client.
+# -- Requests, template rendering, and translations in solve() are timed in
+#    METRICS; /metrics shows them in the Prometheus text format.
+# -- Sampled profiles of /tra requests (see profiling.py), tagged with the
+#    branch of tra() that was taken.
 
-from flask import request, session, g, redirect, url_for, abort, render_template, flash
-from kuaa import app, make_document, make_text, gui_trans, doc_trans, quit, start, get_human, create_human, sentence_from_textseg
-from . import gui
+import functools, json, time, uuid
+from flask import request, session, g, redirect, url_for, abort, render_template, flash, Response, stream_with_context, jsonify
+from flask import before_render_template, template_rendered
+from kuaa import app, make_document, make_text, gui_trans, doc_trans, doc_trans_iter, quit, start, get_human, create_human, sentence_from_textseg, get_pretranslation, tm_matches, api_trans, load, METRICS
+from kuaa.jobs import JOBS
+from . import gui, jobs
+from .profiling import RequestProfiler
 from docx import Document
 
-# Global variable and basic functions for the container holding all the gui-related variables that need to
-# persist between calls to render_template()
+# Container for the GUI instances holding all the gui-related variables that need to
+# persist between calls to render_template(), one for each browser session.
 
-GUI = None
+def end_gui(GUI):
+#    print("Ending GUI {}".format(GUI))
+    quit(GUI.session)
 
-def create_gui():
-    global GUI
-#    print("$$Creating new GUI")
-    GUI = gui.GUI(list_texts=True)
+def evict_gui(GUI):
+    """End an evicted GUI; called in GUIS's eviction thread, outside any request."""
+    with app.app_context():
+        end_gui(GUI)
 
-def end_gui():
-    global GUI
-#    print("Ending GUI {}".format(GUI))
+GUIS = gui.GUIStore(size=app.config.get('GUI_STORE_SIZE', gui.GUI_STORE_SIZE),
+                    timeout=app.config.get('GUI_STORE_TIMEOUT', gui.GUI_STORE_TIMEOUT),
+                    on_evict=evict_gui)
+
+def get_gui(create=True):
+    """The GUI instance for the current browser session."""
+    guiid = session.get('gui')
+    if not guiid:
+        if not create:
+            return
+        guiid = session['gui'] = uuid.uuid4().hex
+    return GUIS.get(guiid, create=create)
+
+def remove_gui():
+    """Remove the GUI instance for the current browser session, ending it."""
+    guiid = session.pop('gui', None)
+    GUI = guiid and GUIS.remove(guiid)
     if GUI:
-        quit(GUI.session)
-        GUI = None
+        with GUI.lock:
+            end_gui(GUI)
+
+def with_gui(view):
+    """
+    Decorator for views that need the current GUI instance, which is passed
+    as the first argument and locked for the duration of the request.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        GUI = get_gui()
+        with GUI.lock:
+            return view(GUI, *args, **kwargs)
+    return wrapper
+
+## Timing and profiling of requests and templates
+
+PROFILER = RequestProfiler(app.config['PROFILE_DIR'],
+                           sample=app.config['PROFILE_SAMPLE'],
+                           threshold=app.config['PROFILE_THRESHOLD'],
+                           keep=app.config['PROFILE_KEEP'])
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    if request.endpoint == 'tra':
+        g.profile = PROFILER.begin()
+
+@app.teardown_request
+def end_profile(exc):
+    # Called even if the view raised an exception, so the sampling stops.
+    token = g.pop('profile', None)
+    if token:
+        text = request.form.get('ofuente') or request.form.get('documento') or ''
+        PROFILER.end(token, branch=g.get('tra_branch', 'error' if exc else ''),
+                     words=len(text.split()), method=request.method)
+
+@app.after_request
+def stop_timer(response):
+    start = g.pop('request_start', None)
+    if start is not None and request.endpoint != 'metrics':
+        METRICS.observe('mainumby_request_seconds', time.perf_counter() - start,
+                        endpoint=request.endpoint or '', **g.get('metrics_labels', {}))
+    return response
+
+def template_started(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+def template_finished(sender, template, context, **extra):
+    start = g.pop('template_start', None)
+    if start is not None:
+        METRICS.observe('mainumby_template_seconds', time.perf_counter() - start,
+                        template=template.name or '')
+
+try:
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+except RuntimeError:
+    # Signals need blinker
+    print("Advertencia: sin blinker no se mide el tiempo de las plantillas")
 
-def trad_doc():
+def trad_doc(GUI):
     """Traducir todas las oraciones en el documento, devolviendo una lista
     de 'cadenas finales' de de cada oración."""
-    return doc_trans(doc=GUI.doc, textid=GUI.textid, gui=GUI)
+    return doc_trans(doc=GUI.doc, textid=GUI.textid, gui=GUI,
+                     nprocs=app.config.get('DOC_TRANS_PROCS', 0))
 
-def solve(isdoc=False, choose=False, index=0, source=''):
+def trad_doc_iter(GUI):
+    """Como trad_doc, pero genera la 'cadena final' de cada oración en cuanto
+    esté traducida."""
+    return doc_trans_iter(doc=GUI.doc, textid=GUI.textid, gui=GUI,
+                          nprocs=app.config.get('DOC_TRANS_PROCS', 0))
+
+def solve(GUI, isdoc=False, choose=False, index=0, source=''):
     """Attempt to translate the currently selected sentence, assigning segmentation
     and HTML for the translation segmentation visualization. If choose is True,
     present no options in the HTML."""
-    if choose:
-        segmentation = gui_trans(GUI, choose=True)
-        trans = segmentation.final
-        GUI.init_sent(index, choose=True, isdoc=isdoc, trans=trans, source=source)
-    else:
-        GUI.segs, GUI.tra_seg_html = gui_trans(GUI, choose=False)
+    with METRICS.context(kind='doc' if isdoc else 'sentence'):
+        pretrans = None
+        if GUI.has_text and GUI.textid >= 0:
+            # Use the translation made in advance if there is one
+            pretrans = get_pretranslation(GUI.textid, index, GUI.source, GUI.target)
+        if choose:
+            if pretrans:
+                trans = pretrans.final
+            else:
+                trans = gui_trans(GUI, choose=True, return_string=True)
+            GUI.init_sent(index, choose=True, isdoc=isdoc, trans=trans, source=source)
+        else:
+            if pretrans and pretrans.seg_html:
+                GUI.segs, GUI.tra_seg_html = [], json.loads(pretrans.seg_html)
+            else:
+                GUI.segs, GUI.tra_seg_html = gui_trans(GUI, choose=False)
 #    print("Solved segs: {}, html: {}".format(SEGS, SEG_HTML))
-        GUI.init_sent(index, choose=False, isdoc=isdoc)
-    if isdoc and not choose:
-        GUI.update_doc(index, choose=choose)
+            GUI.init_sent(index, choose=False, isdoc=isdoc)
+        if isdoc and not choose:
+            GUI.update_doc(index, choose=choose)
+        # Offer human translations of the same or similar sentences
+        GUI.tm_matches = tm_matches(GUI.sentence.original, GUI.source, GUI.target)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -111,9 +226,8 @@ def ayuda():
 #    return render_template('ayuda_doc.html')
 
 @app.route('/login', methods=['GET', 'POST'])
-def login():
-    if not GUI:
-        create_gui()
+@with_gui
+def login(GUI):
     form = request.form
     print("Form for login: {}".format(form))
 #    if not GUI.users_initialized:
@@ -142,7 +256,8 @@ def logged():
     return render_template('logged.html')
 
 @app.route('/reg', methods=['GET', 'POST'])
-def reg():
+@with_gui
+def reg(GUI):
     form = request.form
 #    print("Form for reg: {}".format(form))
     if request.method == 'POST' and 'username' in form:
@@ -166,12 +281,14 @@ def acct():
 #    print("In acct...")
     return render_template('acct.html')
 
+def tra_branch(name):
+    """Note that tra() took the branch name, for its profile."""
+    g.tra_branch = g.tra_branch + '+' + name if g.get('tra_branch') else name
+
 # View for the window that does all the work. Whew.
 @app.route('/tra', methods=['GET', 'POST'])
-def tra():
-    global GUI
-    if not GUI:
-        create_gui()
+@with_gui
+def tra(GUI):
     form = request.form
 #    print("Form {}".format(form))
     if not GUI.source:
@@ -194,11 +311,15 @@ def tra():
     choose = GUI.props.get('sinopciones', False)
     username = GUI.user.username if GUI.user else ''
     tradtodo = form.get('tradtodo') == 'true'
+    g.metrics_labels = {'kind': 'doc' if isdoc else 'sentence',
+                        'mode': 'choose' if choose or tradtodo else 'options'}
     abandonar_doc = form.get('abandonardoc') == 'true'
     if abandonar_doc:
 #        print("Abandonando actual documento...")
+        tra_branch('abandonar')
         GUI.clear(isdoc=True, abandonar=True)
     if 'ayuda' in form and form['ayuda'] == 'true':
+        tra_branch('ayuda')
         # Opened help window. Keep everything else as is.
         return render_template('tra.html', doc=isdoc, documento=GUI.doc_html,
                                props=GUI.props, user=username,
@@ -214,6 +335,7 @@ def tra():
         isdoc = form.get('modo') == 'doc'
         if 'documento' in form and form['documento']:
             # A document has been loaded, make it into a Document object
+            tra_branch('make_document')
             make_document(GUI, form['documento'], html=True)
 #            print("PROCESANDO TEXTO EN ARCHIVO {}".format(GUI.doc))
             # Re-render, using HTML for Document
@@ -226,12 +348,14 @@ def tra():
             textid = form.get('textid', '')
             if textid:
 #                print("Making text doc from text {}".format(textid))
+                tra_branch('make_text')
                 make_text(GUI, int(textid))
                 return render_template('tra.html', documento=GUI.doc_html,
                                        doc=True, props=GUI.props, user=username,
                                        text_html=GUI.text_select_html,
                                        choose=choose, tradtodo=tradtodo)
             else:
+                tra_branch('textos')
                 # Re-render, displaying domain/text dropdowns
 #                print("DISPLAY DOMAINS")
                 return render_template('tra.html', doc=True, props=GUI.props,
@@ -239,6 +363,7 @@ def tra():
                                        user=username, choose=choose,
                                        tradtodo=tradtodo)
         else:
+            tra_branch('clear')
             # Clear the GUI and re-render, keeping the mode setting
             GUI.clear(isdoc=isdoc)
             return render_template('tra.html', doc=isdoc, props=GUI.props,
@@ -247,6 +372,7 @@ def tra():
                                    text_html=GUI.text_select_html)
     if form.get('borrar') == 'true':
 #        print("Clearing text, isdoc? {}, tradtodo {}".format(isdoc, tradtodo))
+        tra_branch('clear')
         record = form.get('registrar') == 'true'
         if record:
             trans = form.get('ometa')
@@ -264,11 +390,13 @@ def tra():
                                choose=choose, tradtodo=tradtodo)
     GUI.props['isdoc'] = isdoc
     if not 'ofuente' in form:
+        tra_branch('sin_oracion')
         # No sentence entered or selected
 #        print("NO SENTENCE ENTERED")
         return render_template('tra.html', user=username, props=GUI.props,
                                doc=isdoc, choose=choose, tradtodo=tradtodo)
     if not GUI.doc and not GUI.has_text:
+        tra_branch('make_document')
         # Create a new document
         make_document(GUI, form['ofuente'], html=False)
         if len(GUI.doc) == 0:
@@ -283,6 +411,7 @@ def tra():
     if 'tacept' in form and form['tacept']:
         # A new translation to be added to the accepted sentence translations.
 #        print("ACCEPTING NEW TRANSLATION {}".format(form['tacept']))
+        tra_branch('accept_sent')
         GUI.accept_sent(oindex, form['tacept'])
         aceptado = GUI.doc_tra_acep_str
         return render_template('tra.html', oracion='', doc=True,
@@ -291,6 +420,7 @@ def tra():
                                user=username, props=GUI.props, choose=choose,
                                tradtodo=tradtodo)
     if GUI.doc_tra_acep and GUI.doc_tra_acep[oindex]:
+        tra_branch('aceptada')
         error = "¡Ya aceptaste una traducción para esta oración; por favor seleccioná otra oración para traducir!"
         return render_template('tra.html', oracion='', doc=True, error=error,
                                tra_seg_html='', tra='',
@@ -299,6 +429,7 @@ def tra():
                                documento=GUI.doc_html, user=username,
                                props=GUI.props, choose=choose, tradtodo=tradtodo)
     if GUI.doc_tra_html and GUI.doc_tra_html[oindex]:
+        tra_branch('repetida')
         # Find the previously generated translation
         tra_seg_html = GUI.doc_tra_html[oindex]
         tra = GUI.doc_tra[oindex]
@@ -316,10 +447,12 @@ def tra():
 
     # Here's where a sentence or a whole document gets translated
     if tradtodo:
+        tra_branch('trad_doc')
         print("TRADUCIENDO EL DOCUMENTO ENTERO, documento: {}".format(GUI.doc))
 #        sentences = doc_sentences(doc=GUI.doc, textid=GUI.textid, gui=GUI)
-        all_trans = trad_doc()
-        doctrans = '\n'.join(all_trans)
+        all_trans = trad_doc(GUI)
+        # Joined as the streamed translations are in tra.html.
+        doctrans = ''.join(gui.AcceptedText.sentence_string(t) for t in all_trans).strip()
 #        print("Traducciones: {}".format(doctrans[:100]))
         GUI.props['tfuente'] = '100%'
 #        translations = ''
@@ -341,23 +474,201 @@ def tra():
         else:
             GUI.sentence = GUI.doc[oindex]
 #        print("ORACIÓN ACTUAL {}".format(GUI.sentence))
+        tra_branch('solve')
         # Translate and segment the sentence, assigning GUI.segs
         source = form.get('ofuente', '')
-        solve(isdoc=isdoc, index=oindex, choose=choose, source=source)
+        solve(GUI, isdoc=isdoc, index=oindex, choose=choose, source=source)
         oracion = source if choose else GUI.fue_seg_html
         return render_template('tra.html', oracion=oracion,
                                tra_seg_html=GUI.tra_seg_html, tra=GUI.tra,
                                documento=GUI.doc_html, doc=isdoc, oindex=oindex,
                                aceptado=GUI.doc_tra_acep_str,
+                               memoria=GUI.tm_matches,
                                docscrolltop=docscrolltop, choose=choose,
                                user=username, props=GUI.props, tradtodo=False)
 
+# A sentence selected in a document. Only what changes in tra.html is sent:
+# the HTML of the newly selected and previously selected sentences and the
+# rendered translation panes (tra_panes.html).
+@app.route('/oradoc', methods=['POST'])
+@with_gui
+def oradoc(GUI):
+    form = request.form
+    if not GUI.source or not (GUI.doc or GUI.has_text):
+        abort(404)
+    GUI.set_props(form, ['ocultar', 'sinopciones', 'nocorr'], ['tfuente'])
+    GUI.props['isdoc'] = True
+    choose = GUI.props.get('sinopciones', False)
+    g.metrics_labels = {'kind': 'doc', 'mode': 'choose' if choose else 'options'}
+    oindex = int(form.get('oindex', 0))
+    if GUI.doc_tra_acep and GUI.doc_tra_acep[oindex]:
+        return jsonify(error="¡Ya aceptaste una traducción para esta oración; por favor seleccioná otra oración para traducir!")
+    # The sentence currently shown with its segments
+    previous = GUI.doc_selection[0] if GUI.doc_selection else None
+    memoria = None
+    if GUI.doc_tra_html and GUI.doc_tra_html[oindex]:
+        # Find the previously generated translation
+        tra_seg_html = GUI.doc_tra_html[oindex]
+        tra = GUI.doc_tra[oindex]
+        GUI.update_doc(oindex, repeat=True)
+    else:
+        if GUI.has_text and GUI.textid >= 0:
+            GUI.sentence = sentence_from_textseg(source=GUI.source,
+                                                 target=GUI.target,
+                                                 textid=GUI.textid, oindex=oindex)
+        else:
+            GUI.sentence = GUI.doc[oindex]
+        solve(GUI, isdoc=True, index=oindex, choose=choose,
+              source=form.get('ofuente', ''))
+        tra_seg_html = GUI.tra_seg_html
+        tra = GUI.tra
+        memoria = GUI.tm_matches
+    oraciones = {}
+    if previous is not None and previous != oindex:
+        oraciones[previous] = GUI.doc_html_list[previous]
+    if GUI.doc_selection:
+        oraciones[GUI.doc_selection[0]] = GUI.selected_sentence_html()
+    paneles = render_template('tra_panes.html', tra_seg_html=tra_seg_html,
+                              tra=tra, doc=True, memoria=memoria,
+                              choose=choose, tradtodo=False, props=GUI.props)
+    return jsonify(index=oindex, oraciones=oraciones, paneles=paneles,
+                   cap=bool(GUI.props.get('cap')),
+                   comentario=bool(tra_seg_html and not choose))
+
+# Translations of the sentences in the current document, as server-sent
+# events, each sent as soon as the sentence is translated.
+@app.route('/tradtodo', methods=['GET', 'POST'])
+def tradtodo():
+    GUI = get_gui(create=False)
+    if not GUI or not GUI.source or not (GUI.doc or GUI.has_text):
+        abort(404)
+
+    def generate():
+        # The document must not change while it's being translated.
+        with GUI.lock:
+            for index, trans in enumerate(trad_doc_iter(GUI)):
+                yield "data: {}\n\n".format(json.dumps({'index': index, 'tra': trans}))
+        yield "event: fin\ndata: {}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+## JSON API for other programs. No GUI instance is created and nothing is
+## rendered; requests are independent of each other and of browser sessions.
+## The body is a JSON object with 'source' and 'target' (default spa and grn),
+## 'segments' (whether to return segments), and 'text' (/api/translate) or
+## 'sentences', a list of strings (/api/translate/batch).
+
+def api_error(message, status=400):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
+
+def api_request():
+    """The request's JSON object and its languages."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("Se espera un objeto JSON")
+    try:
+        src, targ = load(data.get('source', 'spa'), data.get('target', 'grn'))
+    except Exception as e:
+        raise ValueError("Lenguas no disponibles: {}".format(e))
+    return data, src, targ
+
+@app.route('/api/translate', methods=['POST'])
+def api_translate():
+    try:
+        data, src, targ = api_request()
+    except ValueError as e:
+        return api_error(str(e))
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return api_error("'text' debe ser una oración")
+    result = api_trans([text], src=src, targ=targ,
+                       segments=bool(data.get('segments')))[0]
+    return jsonify(result)
+
+@app.route('/api/translate/batch', methods=['POST'])
+def api_translate_batch():
+    try:
+        data, src, targ = api_request()
+    except ValueError as e:
+        return api_error(str(e))
+    sentences = data.get('sentences')
+    if not isinstance(sentences, list) or not all(isinstance(s, str) for s in sentences):
+        return api_error("'sentences' debe ser una lista de oraciones")
+    if len(sentences) > app.config['API_BATCH_MAX']:
+        return api_error("Más de {} oraciones".format(app.config['API_BATCH_MAX']), 413)
+    t0 = time.time()
+    results = api_trans(sentences, src=src, targ=targ,
+                        segments=bool(data.get('segments')),
+                        nprocs=app.config.get('DOC_TRANS_PROCS', 0))
+    return jsonify(results=results, seconds=round(time.time() - t0, 3))
+
+## Translation jobs. POST a JSON object with 'text' (a document) or 'textid'
+## (a stored Text) and optionally 'source' and 'target'; the job's sentences
+## are translated by the job workers (see jobs.py), and its status and results
+## are at /api/jobs/<id> and /api/jobs/<id>/result.
+
+@app.route('/api/jobs', methods=['POST'])
+def api_jobs():
+    try:
+        data, src, targ = api_request()
+    except ValueError as e:
+        return api_error(str(e))
+    if isinstance(data.get('textid'), int):
+        id = JOBS.submit_textid(data['textid'], src, targ)
+        if not id:
+            return api_error("No hay texto {}".format(data['textid']), 404)
+    elif isinstance(data.get('text'), str) and data['text'].strip():
+        id = JOBS.submit_text(data['text'], src, targ)
+    else:
+        return api_error("Se necesita 'text' o 'textid'")
+    response = jsonify(JOBS.status(id))
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_job', id=id)
+    return response
+
+@app.route('/api/jobs/<id>', methods=['GET', 'DELETE'])
+def api_job(id):
+    if request.method == 'DELETE':
+        JOBS.cancel(id)
+    status = JOBS.status(id)
+    if not status:
+        return api_error("No hay trabajo {}".format(id), 404)
+    return jsonify(status)
+
+@app.route('/api/jobs/<id>/result')
+def api_job_result(id):
+    """The translations so far, as JSON (null for sentences not yet translated)
+    or, with ?formato=txt, as text once the job is done."""
+    status = JOBS.status(id)
+    if not status:
+        return api_error("No hay trabajo {}".format(id), 404)
+    results = JOBS.results(id)
+    if request.args.get('formato') == 'txt':
+        if status['status'] != jobs.DONE:
+            return api_error("El trabajo no está terminado", 409)
+        text = gui.AcceptedText([False] * len(results))
+        for index, final in enumerate(results):
+            text.accept(index, final)
+        return Response(str(text), mimetype='text/plain')
+    return jsonify(status=status['status'], results=results)
+
+# Metrics for Prometheus, only for requests from this machine unless
+# app.config['METRICS_PUBLIC'] is True.
+@app.route('/metrics')
+def metrics():
+    if not app.config.get('METRICS_PUBLIC') and request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/fin', methods=['GET', 'POST'])
 def fin():
     form = request.form
 #    print("Form for fin: {}".format(form))
     modo = form.get('modo')
-    end_gui()
+    remove_gui()
     return render_template('fin.html', modo=modo)
 
 @app.route('/contacto')
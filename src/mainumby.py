@@ -49,6 +49,8 @@
 # -- Database (sqlalchemy) classes added.
 # 2021
 # -- Included everything under src directory to enable setup
+# 2026
+# -- Commands: pretraducir, ingerir, medir
 
 __version__ = 2.3
 
@@ -124,6 +126,38 @@ def db_add_text(file='', title='', domain=''):
     text = kuaa.Text.read(file, title=title, domain=domain, segment=True)
     kuaa.db.session.add(text)
 
+def db_ingerir(path, domain='', procs=None):
+    """Agregar a la DB los archivos .txt y .docx en un directorio o en la
+    lista de un archivo manifiesto (líneas ruta;dominio;título)."""
+    from kuaa.ingest import ingest_path
+    with kuaa.app.app_context():
+        return ingest_path(path, domain=domain, nprocs=procs)
+
+def db_pretranslate(textids=None, force=False):
+    """Traducir de antemano todas las oraciones de los Texts en la DB."""
+    with kuaa.app.app_context():
+        return kuaa.pretranslate(textids=textids, force=force)
+
+def medir(textos=None, modo='doc', salida='', comparar='', umbral=None):
+    """Medir la velocidad de traducción de textos en kuaa/texts, guardando
+    los resultados en salida (JSON) y comparándolos con los de comparar.
+    Devuelve las regresiones encontradas."""
+    from kuaa import bench
+    with kuaa.app.app_context():
+        results = bench.run(names=textos, mode=modo)
+    if salida:
+        bench.save(results, salida)
+    if comparar:
+        return bench.compare(bench.read(comparar), results,
+                             threshold=bench.THRESHOLD if umbral is None else umbral)
+    return []
+
+def migrar_registros(directorio=None):
+    """Convertir los archivos YAML de memorias y sesiones en registros indexados."""
+    if directorio:
+        return kuaa.migrate_records(directorio)
+    return kuaa.migrate_records()
+
 def db_users():
     db_create_admin()
     db_create_anon()
@@ -265,6 +299,41 @@ def db_create_old_users():
 
 if __name__ == "__main__":
     print("Tereg̃uahẽporãite Mainumby-pe, versión {}\n".format(__version__))
+    import sys
+    if sys.argv[1:2] == ['pretraducir']:
+        db_pretranslate(force='--todo' in sys.argv)
+    elif sys.argv[1:2] == ['ingerir']:
+        import argparse
+        parser = argparse.ArgumentParser(prog="mainumby.py ingerir")
+        parser.add_argument('ruta', help="directorio o archivo manifiesto")
+        parser.add_argument('--dominio', default='')
+        parser.add_argument('--procesos', type=int, default=None)
+        args = parser.parse_args(sys.argv[2:])
+        db_ingerir(args.ruta, domain=args.dominio, procs=args.procesos)
+    elif sys.argv[1:2] == ['medir']:
+        import argparse
+        from kuaa.bench import MODES, all_texts
+        parser = argparse.ArgumentParser(prog="mainumby.py medir")
+        parser.add_argument('textos', nargs='*',
+                            help="nombres de textos en kuaa/texts (pajarito, abejas, chaco por defecto)")
+        parser.add_argument('--todos', action='store_true', help="todos los textos")
+        parser.add_argument('--modo', choices=MODES, default='doc')
+        parser.add_argument('--salida', default='', help="archivo JSON para los resultados")
+        parser.add_argument('--comparar', default='', help="archivo JSON de una medición anterior")
+        parser.add_argument('--umbral', type=float, default=None)
+        args = parser.parse_args(sys.argv[2:])
+        regresiones = medir(textos=all_texts() if args.todos else args.textos,
+                            modo=args.modo, salida=args.salida,
+                            comparar=args.comparar, umbral=args.umbral)
+        sys.exit(1 if regresiones else 0)
+    elif sys.argv[1:2] == ['migrar']:
+        import argparse
+        parser = argparse.ArgumentParser(prog="mainumby.py migrar")
+        parser.add_argument('--directorio', default=None,
+                            help="directorio de los archivos .mem y .sess (kuaa/sessions por defecto)")
+        args = parser.parse_args(sys.argv[2:])
+        n = migrar_registros(args.directorio)
+        print("{} archivos convertidos".format(n))
 #    kuaa.app.run(debug=True)
 
 
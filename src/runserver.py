@@ -1,4 +1,33 @@
-from kuaa import app
+import argparse
+from kuaa import app, start_pretranslation, Memory, load
+from kuaa.parallel import start_pools
+from kuaa.jobs import start_workers
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0')
+    parser = argparse.ArgumentParser(description="Servidor de Mainumby")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="procesos de producción (0: servidor de desarrollo de Flask); con más de 1, "
+                        "el estado de la interfaz requiere un proxy con sesiones persistentes")
+    parser.add_argument('--trabajos', type=int, default=None,
+                        help="procesos que traducen los trabajos de /api/jobs")
+    parser.add_argument('--pretraducir', action='store_true',
+                        help="traducir de antemano las oraciones de los textos almacenados")
+    args = parser.parse_args()
+    if args.trabajos is not None:
+        app.config['JOB_WORKERS'] = args.trabajos
+    if args.workers:
+        from kuaa.server import serve
+        serve(host=args.host, port=args.port, workers=args.workers,
+              pretranslate=args.pretraducir)
+    else:
+        languages = load()
+        # Job workers are forked before this process has pools or threads.
+        if app.config['JOB_WORKERS']:
+            start_workers(app.config['JOB_WORKERS'])
+        start_pools(*languages, app.config.get('DOC_TRANS_PROCS', 0))
+        Memory.start_compaction()
+        if args.pretraducir:
+            start_pretranslation()
+        app.run(host=args.host, port=args.port)
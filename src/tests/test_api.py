@@ -0,0 +1,92 @@
+#
+#   Mainumby: tests for the JSON translation API.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import unittest
+from unittest import mock
+
+import kuaa
+from kuaa import app, views
+
+def fake_api_trans(texts, src=None, targ=None, segments=False, nprocs=0, **kwargs):
+    return [{'final': text.upper()} for text in texts]
+
+class APITest(unittest.TestCase):
+
+    def setUp(self):
+        self.api_trans = mock.Mock(side_effect=fake_api_trans)
+        for patcher in [mock.patch.object(views, 'load', lambda source, target: (source, target)),
+                        mock.patch.object(views, 'api_trans', self.api_trans),
+                        mock.patch.dict(app.config, API_BATCH_MAX=3, DOC_TRANS_PROCS=2)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def test_translate(self):
+        response = self.client.post('/api/translate', json={'text': "El perro."})
+        self.assertEqual(response.get_json(), {'final': "EL PERRO."})
+        self.assertEqual(self.api_trans.call_args[1]['src'], 'spa')
+        self.assertEqual(self.client.post('/api/translate', json={'text': " "}).status_code, 400)
+        self.assertEqual(self.client.post('/api/translate', data="El perro.").status_code, 400)
+
+    def test_batch(self):
+        response = self.client.post('/api/translate/batch',
+                                    json={'sentences': ["Uno.", "Dos."], 'segments': True})
+        self.assertEqual(response.get_json()['results'], [{'final': "UNO."}, {'final': "DOS."}])
+        kwargs = self.api_trans.call_args[1]
+        self.assertEqual((kwargs['segments'], kwargs['nprocs']), (True, 2))
+
+    def test_batch_limit(self):
+        response = self.client.post('/api/translate/batch', json={'sentences': ["Oración."] * 4})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('3', response.get_json()['error'])
+        self.assertFalse(self.api_trans.called)
+        self.assertEqual(self.client.post('/api/translate/batch',
+                                          json={'sentences': ["Oración."] * 3}).status_code, 200)
+
+    def test_batch_not_sentences(self):
+        for data in [{'sentences': "Uno."}, {'sentences': ["Uno.", 2]}, {}]:
+            self.assertEqual(self.client.post('/api/translate/batch', json=data).status_code, 400)
+        self.assertFalse(self.api_trans.called)
+
+    def test_languages_not_available(self):
+        with mock.patch.object(views, 'load', mock.Mock(side_effect=OSError("xyz"))):
+            response = self.client.post('/api/translate', json={'text': "Uno.", 'source': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+class APITransTest(unittest.TestCase):
+
+    def test_sentences(self):
+        oración = mock.Mock(side_effect=lambda text, **kwargs: text.upper())
+        with mock.patch.object(kuaa, 'oración', oración), \
+             mock.patch.object(kuaa, 'make_session'):
+            results = kuaa.api_trans(["Uno.", " ", "Dos."], src='spa', targ='grn')
+        self.assertEqual(results, [{'final': "UNO."}, {'final': ''}, {'final': "DOS."}])
+        # Blank sentences aren't translated, and the memory isn't used.
+        self.assertEqual(oración.call_count, 2)
+        self.assertFalse(oración.call_args[1]['use_tm'])
+
+if __name__ == '__main__':
+    unittest.main()
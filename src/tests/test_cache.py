@@ -0,0 +1,129 @@
+#
+#   Mainumby: tests for the shared translation cache.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import os, shutil, sqlite3, tempfile, time, unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from kuaa import cache
+from kuaa.cache import TransCache, lexicon_version
+
+class FakeLanguage:
+    """Just what the cache uses of mbojereha.Language."""
+
+    def __init__(self, abbrev, directory):
+        self.abbrev = abbrev
+        self.directory = directory
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.languages = []
+        for abbrev in ('spa', 'grn'):
+            lexdir = os.path.join(self.directory, abbrev, 'lex')
+            os.makedirs(lexdir)
+            with open(os.path.join(lexdir, abbrev + '.lex'), 'w') as file:
+                file.write("perro\n")
+            self.languages.append(FakeLanguage(abbrev, os.path.join(self.directory, abbrev)))
+        cache.VERSIONS.clear()
+        self.path = os.path.join(self.directory, 'cache.db')
+
+    def tearDown(self):
+        cache.VERSIONS.clear()
+        shutil.rmtree(self.directory)
+
+    def test_version_changes(self):
+        version = lexicon_version(*self.languages)
+        lexfile = os.path.join(self.languages[1].directory, 'lex', 'grn.lex')
+        stat = os.stat(lexfile)
+        os.utime(lexfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        # Kept until it's recomputed
+        self.assertEqual(lexicon_version(*self.languages), version)
+        self.assertNotEqual(lexicon_version(*self.languages, recompute=True), version)
+
+    def test_no_files_warning(self):
+        empty = FakeLanguage('eng', os.path.join(self.directory, 'eng'))
+        out = StringIO()
+        with redirect_stdout(out):
+            lexicon_version(self.languages[0], empty)
+        self.assertIn('eng', out.getvalue())
+
+    def test_get_put(self):
+        source, target = self.languages
+        tc = TransCache(self.path)
+        key = TransCache.key("El  perro ", source, target, choose=True)
+        self.assertEqual(key, TransCache.key("El perro", source, target, choose=True))
+        self.assertNotEqual(key, TransCache.key("El perro", source, target, choose=False))
+        self.assertIsNone(tc.get(key))
+        tc.put(key, ["Jagua", {'html': "<b>Jagua</b>"}], source, target)
+        # Another process finds it in the SQLite file.
+        other = TransCache(self.path)
+        self.assertEqual(other.get(key), ["Jagua", {'html': "<b>Jagua</b>"}])
+        self.assertEqual((tc.misses, other.hits), (1, 1))
+        with self.assertRaises(TypeError):
+            tc.put(key, object(), source, target)
+
+    def test_memory_size(self):
+        source, target = self.languages
+        tc = TransCache(None, size=2)
+        for i in range(3):
+            tc.put(str(i), i, source, target)
+        self.assertEqual(list(tc.memory), ['1', '2'])
+        self.assertIsNone(tc.get('0'))
+
+    def test_purge_old_version(self):
+        source, target = self.languages
+        tc = TransCache(self.path)
+        old = TransCache.key("El perro", source, target)
+        tc.put(old, "Jagua", source, target)
+        time.sleep(0.01)
+        cache.VERSIONS.clear()
+        lexfile = os.path.join(source.directory, 'lex', 'spa.lex')
+        with open(lexfile, 'a') as file:
+            file.write("gato\n")
+        # A new process stores a value with the new lexicons.
+        other = TransCache(self.path)
+        new = TransCache.key("El perro", source, target)
+        self.assertNotEqual(old, new)
+        with redirect_stdout(StringIO()):
+            other.put(new, "Jagua", source, target)
+        self.assertIsNone(other.get(old))
+        self.assertEqual(other.get(new), "Jagua")
+
+    def test_old_table_dropped(self):
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.execute("CREATE TABLE trans (key TEXT PRIMARY KEY, value BLOB)")
+            conn.execute("INSERT INTO trans VALUES ('k', 'v')")
+        conn.close()
+        tc = TransCache(self.path)
+        self.assertIsNone(tc.get('k'))
+        columns = [row[1] for row in tc.connection().execute("PRAGMA table_info(trans)")]
+        self.assertEqual(columns, cache.COLUMNS)
+
+if __name__ == '__main__':
+    unittest.main()
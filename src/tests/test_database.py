@@ -0,0 +1,286 @@
+#
+#   Mainumby: tests for the text DB.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import json, os, shutil, tempfile, unittest
+from unittest import mock
+
+import kuaa
+from kuaa import app, db, cache, ingest, Human, Text, TextSeg, TextSegTra, TextDB
+
+# Tables of the text DB before TextDB.migrate() (columns that aren't used left out)
+OLD_SCHEMA = [
+    "CREATE TABLE humans (id INTEGER NOT NULL, username VARCHAR, name VARCHAR, email VARCHAR, "
+    "pw_hash VARCHAR, level INTEGER, creation VARCHAR, PRIMARY KEY (id))",
+    "CREATE TABLE texts (id INTEGER NOT NULL, name VARCHAR, title VARCHAR, content VARCHAR, "
+    "domain VARCHAR, description VARCHAR, creation VARCHAR, PRIMARY KEY (id))",
+    'CREATE TABLE textsegs (id INTEGER NOT NULL, content VARCHAR, "index" INTEGER, '
+    'text_id INTEGER, html VARCHAR, PRIMARY KEY (id))',
+    'CREATE TABLE texttoks (id INTEGER NOT NULL, string VARCHAR, "index" INTEGER, '
+    'textseg_id INTEGER, PRIMARY KEY (id))',
+    'CREATE TABLE trasegs (id INTEGER NOT NULL, content VARCHAR, "index" INTEGER, '
+    'translation_id INTEGER, PRIMARY KEY (id))',
+]
+
+class FakeLanguage:
+    """Just what lexicon_version() uses of mbojereha.Language."""
+
+    def __init__(self, abbrev, directory):
+        self.abbrev = abbrev
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'lex'), exist_ok=True)
+        with open(os.path.join(directory, 'lex', abbrev + '.lex'), 'a') as file:
+            file.write("perro\n")
+
+class TextDBTest(unittest.TestCase):
+    """Runs with the text DB in a new SQLite file."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.binds = app.config['SQLALCHEMY_BINDS']
+        app.config['SQLALCHEMY_BINDS'] = dict(self.binds,
+                                              text='sqlite:///' + os.path.join(self.directory, 'text.db'))
+        self.context = app.app_context()
+        self.context.push()
+        self.create()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(bind='text').dispose()
+        self.context.pop()
+        app.config['SQLALCHEMY_BINDS'] = self.binds
+        shutil.rmtree(self.directory)
+
+    def create(self):
+        db.create_all(bind='text')
+
+    @staticmethod
+    def sql(statement, **params):
+        """Execute statement on the text DB outside the session, returning
+        any rows."""
+        with TextDB.get_engine().begin() as conn:
+            result = conn.execute(db.text(statement), params)
+            return result.fetchall() if result.returns_rows else []
+
+    @staticmethod
+    def add_text(sentences, title="Prueba"):
+        # A language, so that Text doesn't load one
+        text = Text(title=title, content=' '.join(sentences), language=True)
+        for index, sentence in enumerate(sentences):
+            TextSeg(text=text, content=sentence, index=index, tokens=sentence.split())
+        db.session.add(text)
+        db.session.commit()
+        return text
+
+def fake_oración(sentence=None, choose=False, **kwargs):
+    if choose:
+        return sentence.upper()
+    return None, [[sentence, "<span>{}</span>".format(sentence)]]
+
+class PretranslateTest(TextDBTest):
+
+    def setUp(self):
+        TextDBTest.setUp(self)
+        cache.VERSIONS.clear()
+        self.src = FakeLanguage('spa', os.path.join(self.directory, 'spa'))
+        self.targ = FakeLanguage('grn', os.path.join(self.directory, 'grn'))
+        for name, value in [('oración', mock.Mock(side_effect=fake_oración)),
+                            ('make_session', mock.Mock()),
+                            # The fake oración gets the TextSeg's content.
+                            ('sentence_from_textseg', lambda textseg, src, targ: textseg.content)]:
+            patcher = mock.patch.object(kuaa, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.VERSIONS.clear()
+        TextDBTest.tearDown(self)
+
+    def pretranslate(self, **kwargs):
+        with mock.patch('sys.stdout'):
+            return kuaa.pretranslate(src=self.src, targ=self.targ, **kwargs)
+
+    def test_pretranslate(self):
+        text = self.add_text(["El perro ladra.", "El gato duerme."])
+        self.assertEqual(self.pretranslate(), 2)
+        tra = kuaa.get_pretranslation(text.id, 1, self.src, self.targ)
+        self.assertEqual(tra.final, "EL GATO DUERME.")
+        self.assertEqual(json.loads(tra.seg_html), [["El gato duerme.", "<span>El gato duerme.</span>"]])
+        # Already translated, unless forced
+        self.assertEqual(self.pretranslate(), 0)
+        self.assertEqual(self.pretranslate(textids=[text.id], force=True), 2)
+        self.assertEqual(db.session.query(TextSegTra).count(), 2)
+
+    def test_new_version(self):
+        text = self.add_text(["El perro ladra."])
+        self.pretranslate()
+        # The lexicons change.
+        FakeLanguage('grn', self.targ.directory)
+        cache.VERSIONS.clear()
+        self.assertIsNone(kuaa.get_pretranslation(text.id, 0, self.src, self.targ))
+        self.assertEqual(self.pretranslate(), 1)
+        self.assertIsNotNone(kuaa.get_pretranslation(text.id, 0, self.src, self.targ))
+        self.assertEqual(db.session.query(TextSegTra).count(), 1)
+
+class HumanTest(TextDBTest):
+
+    def setUp(self):
+        TextDBTest.setUp(self)
+        patcher = mock.patch.object(kuaa, 'HUMANS', kuaa.OrderedDict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for username in ('ana', 'bea'):
+            db.session.add(Human(username=username, email=username + '@x.py', pw_hash='x'))
+        db.session.commit()
+
+    def test_cached(self):
+        human = kuaa.get_human('ana')
+        self.assertEqual(human.email, 'ana@x.py')
+        self.assertIn(human, db.session)
+        self.sql("DELETE FROM humans WHERE username = 'ana'")
+        # Still cached
+        self.assertEqual(kuaa.get_human('ana').email, 'ana@x.py')
+        kuaa.forget_human('ana')
+        self.assertIsNone(kuaa.get_human('ana'))
+        self.assertIsNone(kuaa.get_human('nadie'))
+
+    def test_size(self):
+        with mock.patch.object(kuaa, 'HUMANS_SIZE', 1):
+            kuaa.get_human('ana')
+            kuaa.get_human('bea')
+        self.assertEqual(list(kuaa.HUMANS), ['bea'])
+
+    def test_other_session(self):
+        kuaa.get_human('ana')
+        # A request in another thread gets its own copy.
+        db.session.remove()
+        human = kuaa.get_human('ana')
+        self.assertIn(human, db.session)
+        self.assertIsNot(human, kuaa.HUMANS['ana'])
+
+    def test_username_index(self):
+        indexes = {row[1]: row[2] for row in self.sql("PRAGMA index_list(humans)")}
+        self.assertEqual(indexes.get('ix_humans_username'), 1)
+
+class MigrateTest(TextDBTest):
+
+    def create(self):
+        for statement in OLD_SCHEMA:
+            self.sql(statement)
+        self.sql("INSERT INTO texts (id, title) VALUES (1, 'Prueba')")
+        for id, index, content in [(1, 0, "El perro ladra."), (2, 1, "Ñandu.")]:
+            self.sql('INSERT INTO textsegs (id, "index", text_id, content) VALUES (:id, :index, 1, :content)',
+                     id=id, index=index, content=content)
+        # Not in order
+        for textseg_id, index, string in [(1, 2, "ladra"), (1, 0, "el"), (2, 0, "Ñandu"),
+                                          (1, 3, "."), (1, 1, "perro"), (2, 1, ".")]:
+            self.sql('INSERT INTO texttoks (textseg_id, "index", string) VALUES (:id, :index, :string)',
+                     id=textseg_id, index=index, string=string)
+
+    def indexes(self, table):
+        return {row[1] for row in self.sql("PRAGMA index_list({})".format(table))}
+
+    def test_migrate(self):
+        with mock.patch('sys.stdout'):
+            TextDB.migrate()
+        self.assertIn('ix_humans_username', self.indexes('humans'))
+        self.assertIn('ix_textsegs_text_id_index', self.indexes('textsegs'))
+        self.assertIn('ix_texttoks_textseg_id_index', self.indexes('texttoks'))
+        self.assertIn('ix_trasegs_translation_id', self.indexes('trasegs'))
+        self.assertEqual(self.sql("SELECT count(*) FROM texttoks"), [(0,)])
+        tokens = [["el", "perro", "ladra", "."], ["Ñandu", "."]]
+        self.assertEqual([seg.tokens for seg in TextDB.get_segments(1)], tokens)
+        # Nothing happens the second time.
+        db.session.remove()
+        TextDB.migrate()
+        self.assertEqual([seg.tokens for seg in TextDB.get_segments(1)], tokens)
+
+    def test_repeated_usernames(self):
+        for i in range(2):
+            self.sql("INSERT INTO humans (username) VALUES ('ana')")
+        with mock.patch('sys.stdout'):
+            TextDB.migrate()
+        self.assertNotIn('ix_humans_username', self.indexes('humans'))
+        # The other migrations are made anyway.
+        self.assertEqual(TextDB.get_textseg(1, 1).tokens, ["Ñandu", "."])
+
+def fake_segment_paragraphs(paragraphs, language):
+    """Each paragraph as a sentence."""
+    for index, paragraph in enumerate(paragraphs):
+        yield index, paragraph, paragraph.split(), "<span>{}</span>".format(paragraph)
+
+class IngestTest(TextDBTest):
+
+    def setUp(self):
+        TextDBTest.setUp(self)
+        self.corpus = os.path.join(self.directory, 'corpus')
+        os.makedirs(self.corpus)
+        self.write('perro.txt', "El perro ladra.\n\nEl gato duerme.\n")
+        self.write('gato.txt', "Ñandu.\n")
+        # The .txt file is used for a name that has both.
+        self.write('gato.docx', "")
+        self.write('vacío.txt', "")
+        # The workers are forked, so they have these too.
+        for patcher in [mock.patch.object(ingest, 'init_worker', lambda language: None),
+                        mock.patch.object(Text, 'segment_paragraphs', fake_segment_paragraphs),
+                        mock.patch('sys.stdout')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.corpus, filename), 'w', encoding='utf8') as file:
+            file.write(content)
+
+    def test_read_directory(self):
+        entries = ingest.read_directory(self.corpus, domain='Cuentos')
+        self.assertEqual(sorted(os.path.basename(p) for p, d, t in entries),
+                         ['gato.txt', 'perro.txt', 'vacío.txt'])
+        self.assertEqual({d for p, d, t in entries}, {'Cuentos'})
+
+    def test_read_manifest(self):
+        path = os.path.join(self.corpus, 'lista')
+        with open(path, 'w', encoding='utf8') as file:
+            file.write("# Textos\nperro.txt;Cuentos;El perro\n\ngato.txt\n")
+        self.assertEqual(ingest.read_manifest(path),
+                         [(os.path.join(self.corpus, 'perro.txt'), 'Cuentos', "El perro"),
+                          (os.path.join(self.corpus, 'gato.txt'), '', '')])
+
+    def test_ingest(self):
+        ntexts, nsegs, seconds = ingest.ingest_path(self.corpus, nprocs=2, chunk_size=1)
+        self.assertEqual((ntexts, nsegs), (2, 3))
+        text = db.session.query(Text).filter_by(name='perro').one()
+        self.assertEqual(text.title, 'perro')
+        self.assertEqual([(s.index, s.content, s.tokens) for s in TextDB.get_segments(text.id)],
+                         [(0, "El perro ladra.", ["El", "perro", "ladra."]),
+                          (1, "El gato duerme.", ["El", "gato", "duerme."])])
+        # Texts already in the DB are skipped.
+        self.assertEqual(ingest.ingest_path(self.corpus, nprocs=1)[:2], (0, 0))
+
+    def test_unreadable(self):
+        self.write('roto.docx', "no es un zip")
+        self.assertIsNone(ingest.segment_file((os.path.join(self.corpus, 'roto.docx'), '', '')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#
+#   Mainumby: tests comparing lazy and eagerly processed documents.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+
+import unittest
+import mbojereha
+
+from kuaa import load
+from kuaa.document import LazyDocument
+from kuaa.bench import text_path, TEXTS
+from kuaa.utils import iter_paragraphs, PARA_SEP
+
+class LazyDocumentTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.source, cls.target = load('spa', 'grn')
+
+    def test_same_as_document(self):
+        """Each sentence of a LazyDocument, once processed, is the one that
+        Document(proc=True) makes, for the texts in the benchmark."""
+        for name in TEXTS:
+            path = text_path(name)
+            if not path:
+                continue
+            text = PARA_SEP.join(iter_paragraphs(path))
+            eager = mbojereha.Document(self.source, self.target, text, proc=True)
+            lazy = LazyDocument(self.source, self.target, text)
+            self.assertEqual(len(lazy), len(eager), name)
+            for index, sentence in enumerate(eager):
+                processed = lazy[index]
+                self.assertEqual(processed.original, sentence.original, name)
+                self.assertEqual(processed.tokens, sentence.tokens, name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#
+#   Mainumby: tests for GUI state.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import random, threading, time, unittest
+from unittest import mock
+
+from kuaa import app, views
+from kuaa.gui import GUI, GUIStore, AcceptedText, SELECTED_HTML, PARA_MARK, ACCEPTED_BLOCK
+
+class GUIStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.evicted = []
+        self.called = threading.Event()
+        self.store = GUIStore(size=2, timeout=60, on_evict=self.on_evict,
+                              list_texts=False, interval=60)
+
+    def on_evict(self, gui):
+        self.evicted.append(gui)
+        self.called.set()
+
+    def test_lru(self):
+        first = self.store.get('a')
+        self.store.get('b')
+        self.assertIs(self.store.get('a'), first)
+        self.store.get('c')
+        # 'b' was used least recently; on_evict is called in the store's thread.
+        self.assertTrue(self.called.wait(5))
+        self.assertEqual(len(self.evicted), 1)
+        self.assertEqual(list(self.store.guis), ['a', 'c'])
+        self.assertIsNone(self.store.get('b', create=False))
+
+    def test_idle(self):
+        gui = self.store.get('a')
+        self.store.get('b')
+        self.store.guis['a'][1] -= 61
+        self.assertEqual(self.store.evict_idle(), 1)
+        self.assertEqual(self.evicted, [gui])
+        self.assertEqual(list(self.store.guis), ['b'])
+        self.assertEqual(self.store.evict_idle(), 0)
+
+    def test_waits_for_request(self):
+        gui = self.store.get('a')
+        self.store.guis['a'][1] -= 61
+        # A request is still using the instance.
+        with gui.lock:
+            thread = threading.Thread(target=self.store.evict_idle)
+            thread.start()
+            time.sleep(0.1)
+            self.assertEqual(self.evicted, [])
+        thread.join(5)
+        self.assertEqual(self.evicted, [gui])
+
+class DocumentViewTest(unittest.TestCase):
+    """Selecting sentences of a stored Text that have already been translated."""
+
+    HTML_LIST = ["<span id='{0}'>Oración {0}.</span>".format(i) for i in range(3)]
+
+    def setUp(self):
+        self.gui = GUI()
+        self.gui.source = self.gui.target = True
+        self.gui.init_text(1, 3, "<div id='doc'>" + ''.join(self.HTML_LIST) + "</div>", self.HTML_LIST)
+        for index in range(3):
+            self.gui.doc_tra_html[index] = "<b>Ñe'ẽ {}.</b>".format(index)
+            self.gui.doc_tra[index] = "Ñe'ẽ {}.".format(index)
+            self.gui.doc_select_html[index] = "<span>Oración</span> <span>{}.</span>".format(index)
+        views.GUIS.guis['prueba'] = [self.gui, time.time()]
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['gui'] = 'prueba'
+
+    def tearDown(self):
+        views.GUIS.remove('prueba')
+
+    def select(self, index):
+        response = self.client.post('/oradoc', data={'oindex': index})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_update_doc(self):
+        self.gui.update_doc(1, repeat=True)
+        selected = SELECTED_HTML.format(1, self.gui.doc_select_html[1])
+        self.assertEqual(self.gui.selected_sentence_html(), selected)
+        self.assertEqual(self.gui.doc_html, "<div id='doc'>" + self.HTML_LIST[0] + selected +
+                         self.HTML_LIST[2] + "</div>")
+        # Setting the document's HTML unselects the sentence.
+        self.gui.doc_unselect_sent()
+        self.assertIsNone(self.gui.selected_sentence_html())
+        self.assertEqual(self.gui.doc_html, self.gui.text_html)
+
+    def test_only_changes_sent(self):
+        d = self.select(1)
+        self.assertEqual(d['oraciones'], {'1': SELECTED_HTML.format(1, self.gui.doc_select_html[1])})
+        self.assertIn("Ñe'ẽ 1.", d['paneles'])
+        d = self.select(2)
+        # The previous sentence goes back to how it was.
+        self.assertEqual(d['oraciones'], {'1': self.HTML_LIST[1],
+                                          '2': SELECTED_HTML.format(2, self.gui.doc_select_html[2])})
+        self.assertEqual(self.gui.sindex, 2)
+
+    def test_accepted(self):
+        self.gui.doc_tra_acep[0] = "Ñe'ẽ 0."
+        self.assertIn('error', self.select(0))
+
+def join_all(accepted):
+    """The accepted translations joined all at once, as GUI did before AcceptedText."""
+    return ''.join(AcceptedText.sentence_string(t) for t in accepted).strip()
+
+class AcceptedTextTest(unittest.TestCase):
+
+    def check(self, para_ends, translations):
+        text = AcceptedText(para_ends)
+        accepted = [''] * len(para_ends)
+        order = list(range(len(para_ends)))
+        random.Random(len(para_ends)).shuffle(order)
+        for index in order:
+            accepted[index] = translations[index]
+            text.accept(index, translations[index])
+            self.assertEqual(str(text), join_all(accepted))
+
+    def test_paragraphs(self):
+        para_ends = [False, True, False, False, True, True, False]
+        translations = ["Ñe'ẽ {}.".format(i) + (PARA_MARK if end else '')
+                        for i, end in enumerate(para_ends)]
+        self.check(para_ends, translations)
+        self.assertEqual(len(AcceptedText(para_ends).paras), 4)
+
+    def test_no_paragraphs(self):
+        n = ACCEPTED_BLOCK * 2 + 3
+        self.check([False] * n, ["Ñe'ẽ {}.".format(i) for i in range(n)])
+        self.assertEqual(len(AcceptedText([False] * n).paras), 3)
+
+    def test_accept_again(self):
+        text = AcceptedText([False, True, False])
+        text.accept(0, "Peteĩ.")
+        text.accept(2, "Mbohapy.")
+        text.accept(0, "Peteĩha.")
+        self.assertEqual(str(text), "Peteĩha. Mbohapy.")
+
+    def test_gui(self):
+        gui = GUI()
+        html_list = ["<span>{}</span>".format(s) for s in ("Uno.", "Dos." + PARA_MARK, "Tres.")]
+        gui.init_text(1, 3, ''.join(html_list), html_list)
+        with mock.patch('sys.stdout'):
+            gui.accept_sent(2, "Mbohapy.")
+            gui.accept_sent(1, "Mokõi." + PARA_MARK)
+        self.assertEqual(gui.doc_tra_acep_str, "Mokõi.\nMbohapy.")
+        # Made again from all the accepted translations
+        self.assertEqual(gui.stringify_doc_tra(), "Mokõi.\nMbohapy.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#
+#   Mainumby: tests for the queue of translation jobs.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import os, shutil, subprocess, sys, tempfile, threading, time, unittest
+
+from kuaa.jobs import JobQueue, PENDING, RUNNING, DONE, CANCELLED
+
+class Language:
+    def __init__(self, abbrev):
+        self.abbrev = abbrev
+
+SPA, GRN = Language('spa'), Language('grn')
+
+def sentences(n):
+    return [("Oración {}.".format(i), ["Oración", str(i), "."]) for i in range(n)]
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.directory, 'jobs.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_job(self):
+        id = self.queue.submit(sentences(3), SPA, GRN, finals={1: "Ñe'ẽ 1."})
+        self.assertEqual(self.queue.status(id)['status'], PENDING)
+        tasks = self.queue.claim(101, n=5)
+        self.assertEqual([(t[1], t[3], t[4], t[5]) for t in tasks],
+                         [(0, ["Oración", "0", "."], 'spa', 'grn'),
+                          (2, ["Oración", "2", "."], 'spa', 'grn')])
+        self.assertEqual(self.queue.status(id)['status'], RUNNING)
+        self.assertEqual(self.queue.claim(102), [])
+        self.queue.finish(id, 0, final="Ñe'ẽ 0.")
+        self.assertEqual(self.queue.results(id), ["Ñe'ẽ 0.", "Ñe'ẽ 1.", None])
+        self.queue.finish(id, 2, error="ValueError")
+        status = self.queue.status(id)
+        self.assertEqual((status['status'], status['ndone'], status['nfailed']), (DONE, 2, 1))
+        # The original stands in for a sentence that failed.
+        self.assertEqual(self.queue.results(id), ["Ñe'ẽ 0.", "Ñe'ẽ 1.", "Oración 2."])
+
+    def test_all_pretranslated(self):
+        id = self.queue.submit(sentences(1), SPA, GRN, finals={0: "Ñe'ẽ 0."})
+        self.assertEqual(self.queue.status(id)['status'], DONE)
+        self.assertEqual(self.queue.claim(101), [])
+
+    def test_oldest_first(self):
+        first = self.queue.submit(sentences(2), SPA, GRN)
+        second = self.queue.submit(sentences(2), SPA, GRN)
+        self.assertEqual([t[0] for t in self.queue.claim(101, n=3)], [first, first, second])
+
+    def test_cancel(self):
+        id = self.queue.submit(sentences(3), SPA, GRN)
+        job_id, index = self.queue.claim(101, n=1)[0][:2]
+        self.assertTrue(self.queue.cancel(id))
+        self.assertFalse(self.queue.cancel(id))
+        self.assertEqual(self.queue.claim(102), [])
+        # A worker finishing a task it had claimed doesn't change anything.
+        self.queue.finish(job_id, index, final="Ñe'ẽ 0.")
+        status = self.queue.status(id)
+        self.assertEqual((status['status'], status['ndone']), (CANCELLED, 0))
+        self.assertEqual(self.queue.results(id), [None, None, None])
+
+    def test_claims_dont_overlap(self):
+        self.queue.submit(sentences(40), SPA, GRN)
+        claimed = []
+        def claim(worker):
+            # Each thread has its own connection, like a worker process.
+            while True:
+                tasks = self.queue.claim(worker, n=3)
+                if not tasks:
+                    return
+                claimed.extend(t[1] for t in tasks)
+        threads = [threading.Thread(target=claim, args=(101 + i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(sorted(claimed), list(range(40)))
+
+    def test_requeue(self):
+        self.queue.submit(sentences(2), SPA, GRN)
+        # A worker that has died
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        dead = process.pid
+        self.queue.claim(dead, n=1)
+        self.queue.claim(os.getpid(), n=1)
+        self.assertEqual(self.queue.requeue(), 1)
+        self.assertEqual([t[1] for t in self.queue.claim(os.getpid())], [0])
+        # Claimed too long ago
+        self.assertEqual(self.queue.requeue(lease=-1), 2)
+
+    def test_purge(self):
+        done = self.queue.submit(sentences(1), SPA, GRN, finals={0: "Ñe'ẽ 0."})
+        pending = self.queue.submit(sentences(1), SPA, GRN)
+        self.assertEqual(self.queue.purge(), 0)
+        time.sleep(0.01)
+        self.assertEqual(self.queue.purge(max_age=0), 1)
+        self.assertIsNone(self.queue.status(done))
+        self.assertEqual(self.queue.results(done), [])
+        self.assertIsNotNone(self.queue.status(pending))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#
+#   Mainumby: tests for timing metrics.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import json, os, shutil, tempfile, unittest
+from unittest import mock
+
+from kuaa import app
+from kuaa.metrics import Metrics
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = Metrics(buckets=(0.1, 1.0))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render(self):
+        self.metrics.observe('mainumby_stage_seconds', 0.05, stage='solve')
+        self.metrics.observe('mainumby_stage_seconds', 0.5, stage='solve')
+        self.metrics.observe('mainumby_stage_seconds', 3.0, stage='solve')
+        self.metrics.inc('mainumby_sentences_total', kind='doc')
+        self.metrics.inc('mainumby_sentences_total', 2, kind='doc')
+        self.assertEqual(self.metrics.render().splitlines(), [
+            '# HELP mainumby_stage_seconds Seconds in each stage of translating a sentence',
+            '# TYPE mainumby_stage_seconds histogram',
+            'mainumby_stage_seconds_bucket{stage="solve",le="0.1"} 1',
+            'mainumby_stage_seconds_bucket{stage="solve",le="1.0"} 2',
+            'mainumby_stage_seconds_bucket{stage="solve",le="+Inf"} 3',
+            'mainumby_stage_seconds_sum{stage="solve"} 3.550000',
+            'mainumby_stage_seconds_count{stage="solve"} 3',
+            '# HELP mainumby_sentences_total Sentences translated',
+            '# TYPE mainumby_sentences_total counter',
+            'mainumby_sentences_total{kind="doc"} 3'])
+
+    def test_context(self):
+        with self.metrics.context(kind='api'):
+            with self.metrics.context(mode='choose'):
+                with self.metrics.timer('mainumby_stage_seconds', stage='solve'):
+                    pass
+            self.metrics.inc('mainumby_cache_total', result='hit')
+        self.metrics.inc('mainumby_cache_total', result='hit')
+        self.assertEqual(set(self.metrics.histograms),
+                         {('mainumby_stage_seconds', (('kind', 'api'), ('mode', 'choose'), ('stage', 'solve')))})
+        self.assertEqual(self.metrics.counters,
+                         {('mainumby_cache_total', (('kind', 'api'), ('result', 'hit'))): 1,
+                          ('mainumby_cache_total', (('result', 'hit'),)): 1})
+
+    def test_escaped(self):
+        self.metrics.inc('prueba', path='a"b\\c\nd')
+        self.assertIn('prueba{path="a\\"b\\\\c\\nd"} 1', self.metrics.render())
+
+    def test_processes(self):
+        # Another process, maybe no longer running
+        other = Metrics(self.directory, buckets=(0.1, 1.0))
+        other.observe('mainumby_stage_seconds', 0.5, stage='solve')
+        other.inc('mainumby_sentences_total', kind='doc')
+        other.dump()
+        os.rename(os.path.join(self.directory, '{}.json'.format(os.getpid())),
+                  os.path.join(self.directory, '1.json'))
+        # A file being written
+        with open(os.path.join(self.directory, '2.json'), 'w') as file:
+            file.write('{"histo')
+        metrics = Metrics(self.directory, buckets=(0.1, 1.0))
+        metrics.observe('mainumby_stage_seconds', 0.05, stage='solve')
+        metrics.inc('mainumby_sentences_total', kind='doc')
+        metrics.dump()
+        histograms, counters = metrics.merged()
+        self.assertEqual(histograms, {('mainumby_stage_seconds', (('stage', 'solve'),)): [[1, 1], 0.55, 2]})
+        self.assertEqual(counters, {('mainumby_sentences_total', (('kind', 'doc'),)): 2})
+        with open(os.path.join(self.directory, '{}.json'.format(os.getpid()))) as file:
+            self.assertEqual(len(json.load(file)['counters']), 1)
+
+    def test_reset(self):
+        self.metrics.inc('mainumby_sentences_total')
+        self.metrics.reset()
+        self.assertEqual(self.metrics.render(), '\n')
+
+class MetricsViewTest(unittest.TestCase):
+
+    def test_local_only(self):
+        client = app.test_client()
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertEqual(client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code, 403)
+        with mock.patch.dict(app.config, METRICS_PUBLIC=True):
+            self.assertEqual(client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#
+#   Mainumby: tests for append-only record logs.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import os, shutil, tempfile, unittest
+
+from kuaa.reclog import RecordLog, RecordWriter, INDEX_ENTRY
+
+class RecordLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = RecordLog(os.path.join(self.directory, 'prueba.log'))
+        self.log.create()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_after_torn_record(self):
+        self.log.append([{'i': 0}, {'i': 1}])
+        # A process died in the middle of writing a record.
+        with open(self.log.path, 'ab') as log:
+            log.write(b'{"i": 1')
+        self.log.append([{'i': 101}])
+        self.assertEqual(list(self.log), [{'i': 0}, {'i': 1}, {'i': 101}])
+        self.assertEqual(len(self.log), 3)
+        with open(self.log.path, 'rb') as log:
+            self.assertEqual(log.read().count(b'\n'), 3)
+
+    def test_unindexed_record(self):
+        self.log.append([{'i': 0}])
+        # Written to the log but not to the index
+        with open(self.log.path, 'ab') as log:
+            log.write(RecordLog.encode({'i': 1}))
+        self.log.repair()
+        self.assertEqual(list(self.log), [{'i': 0}, {'i': 1}])
+
+    def test_index_past_end(self):
+        self.log.append([{'i': 0}, {'i': 1}])
+        with open(self.log.path, 'rb+') as log:
+            log.truncate(len(RecordLog.encode({'i': 0})) + 3)
+        # And a partly written index entry
+        with open(self.log.index_path, 'ab') as index:
+            index.write(b'\x01\x02')
+        self.log.repair()
+        self.assertEqual(len(self.log), 1)
+        self.assertEqual(os.path.getsize(self.log.index_path), INDEX_ENTRY.size)
+        self.log.append([{'i': 2}])
+        self.assertEqual(list(self.log), [{'i': 0}, {'i': 2}])
+
+    def test_bad_line_skipped(self):
+        self.log.append([{'i': 0}, {'i': 1}, {'i': 2}])
+        with open(self.log.path, 'rb+') as log:
+            line = log.readline()
+            # Corrupt the second record in place
+            log.seek(len(line))
+            log.write(b'#')
+        self.assertEqual(list(self.log), [{'i': 0}, {'i': 2}])
+
+    def test_read_from(self):
+        self.log.append([{'i': 0}, {'i': 1}])
+        records, offset = self.log.read_from()
+        self.assertEqual(records, [{'i': 0}, {'i': 1}])
+        # A record still being written isn't read until it's complete.
+        line = RecordLog.encode({'i': 2})
+        with open(self.log.path, 'ab') as log:
+            log.write(line[:3])
+        self.assertEqual(self.log.read_from(offset), ([], offset))
+        with open(self.log.path, 'ab') as log:
+            log.write(line[3:])
+        self.assertEqual(self.log.read_from(offset), ([{'i': 2}], offset + len(line)))
+
+class RecordWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = RecordWriter()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_text(self):
+        path = os.path.join(self.directory, 'prueba.usr')
+        self.writer.write_text(path, "uno\n")
+        self.writer.write_text(path, "dos\n")
+        self.assertTrue(self.writer.flush(5))
+        with open(path, encoding='utf8') as file:
+            self.assertEqual(file.read(), "uno\ndos\n")
+        # Replaced through a new file, which isn't left behind
+        self.writer.write_text(path, "tres\n", mode='w')
+        self.assertTrue(self.writer.flush(5))
+        with open(path, encoding='utf8') as file:
+            self.assertEqual(file.read(), "tres\n")
+        self.assertEqual(os.listdir(self.directory), ['prueba.usr'])
+
+    def test_records(self):
+        path = os.path.join(self.directory, 'prueba.log')
+        for i in range(3):
+            self.writer.append(path, {'i': i})
+        self.assertTrue(self.writer.flush(5))
+        self.assertEqual(list(RecordLog(path)), [{'i': 0}, {'i': 1}, {'i': 2}])
+
+if __name__ == '__main__':
+    unittest.main()
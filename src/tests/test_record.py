@@ -0,0 +1,204 @@
+#
+#   Mainumby: tests for Memory and Session records.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import datetime, os, shutil, tempfile, unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+import yaml
+
+from kuaa import record
+from kuaa.record import Memory, MemoryManifest, SessionManager, User, WRITER, migrate_records, \
+     time2str, time2shortstr, MEMLOG_EXT, SESSLOG_EXT
+from kuaa.reclog import RecordLog
+
+class MigrateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        start = datetime.datetime(2019, 5, 2, 10, 0, 0)
+        self.times = [start + datetime.timedelta(minutes=i) for i in range(3)]
+        # An old memory: its id, sentence records, and the end time
+        self.sentences = [{'src': {'raw': "El perro.", 'tok': "el perro ."},
+                           'trg': "Jagua.", 'time': time2str(self.times[0])},
+                          {'src': {'raw': "El gato.", 'tok': "el gato ."},
+                           'trg': "Mbarakaja.", 'time': time2str(self.times[1])}]
+        memory = ['20190502100000'] + self.sentences + [time2str(self.times[2])]
+        self.write('20190502100000.mem', memory)
+        self.sessions = [{'start': time2shortstr(t), 'user': 'anon'} for t in self.times[:2]]
+        self.write('anon.sess', self.sessions)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, items):
+        with open(os.path.join(self.directory, filename), 'w', encoding='utf8') as file:
+            yaml.dump(items, file, allow_unicode=True)
+
+    def log(self, name):
+        return RecordLog(os.path.join(self.directory, name))
+
+    def test_migrate(self):
+        with redirect_stdout(StringIO()):
+            self.assertEqual(migrate_records(self.directory), 2)
+        memory = self.log('20190502100000' + MEMLOG_EXT)
+        self.assertEqual(list(memory), self.sentences + [{'end': time2str(self.times[2])}])
+        # Records are indexed by their own times.
+        self.assertEqual(list(memory.between(self.times[1], self.times[2])), self.sentences[1:])
+        sessions = self.log('anon' + SESSLOG_EXT)
+        self.assertEqual(list(sessions), self.sessions)
+        self.assertEqual(list(sessions.between(self.times[1])), self.sessions[1:])
+        # The old files are left, and converted only once.
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'anon.sess')))
+        self.assertEqual(migrate_records(self.directory), 0)
+        self.assertEqual(len(memory), 3)
+
+class MemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.object(record, 'SESSIONS_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with redirect_stdout(StringIO()):
+            self.memory = Memory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add(self, memory, source, target, user='anon'):
+        WRITER.append(memory.get_log_path(), {'src': {'raw': source}, 'trg': target, 'user': user})
+
+    def test_rotate(self):
+        first = self.memory.id
+        self.add(self.memory, "El perro.", "Jagua.")
+        # Another handle on the same log, as in another process
+        other = Memory(id=first)
+        with redirect_stdout(StringIO()):
+            self.memory.rotate()
+        second = self.memory.id
+        self.assertNotEqual(first, second)
+        manifest = MemoryManifest().read()
+        self.assertEqual((manifest['current'], manifest['closed']), (second, [first]))
+        self.assertIn('end', list(RecordLog(Memory.log_path(first)))[-1])
+        # The other handle switches to the new log instead of rotating again.
+        self.assertTrue(other.manifest_changed())
+        with redirect_stdout(StringIO()):
+            other.rotate()
+        self.assertEqual(other.id, second)
+        self.assertEqual(MemoryManifest().ids(), [first, second])
+
+    def test_needs_rotation(self):
+        self.assertFalse(self.memory.needs_rotation())
+        self.add(self.memory, "El perro.", "Jagua.")
+        self.assertTrue(WRITER.flush(5))
+        with mock.patch.object(record, 'MEM_MAX_BYTES', 10):
+            self.assertTrue(self.memory.needs_rotation())
+        with mock.patch.object(record, 'MEM_MAX_AGE', datetime.timedelta()):
+            self.assertTrue(self.memory.needs_rotation())
+
+    def test_compact(self):
+        first = self.memory.id
+        self.add(self.memory, "El perro.", "Jagua.")
+        self.add(self.memory, "El perro.", "Jagua.")
+        self.add(self.memory, "El perro.", "Jagua.", user='otro')
+        with redirect_stdout(StringIO()):
+            self.memory.rotate()
+            # Too recently modified to compact yet
+            self.assertEqual(Memory.compact_all(), 0)
+            with mock.patch.object(record, 'COMPACT_GRACE', -1):
+                self.assertEqual(Memory.compact_all(), 1)
+        self.assertFalse(os.path.exists(Memory.log_path(first)))
+        self.assertTrue(os.path.exists(Memory.archive_path(first)))
+        records = Memory(id=first).read()
+        self.assertEqual([r.get('user') for r in records if 'src' in r], ['anon', 'otro'])
+        self.assertIn('end', records[-1])
+        manifest = MemoryManifest().read()
+        self.assertEqual((manifest['closed'], manifest['archived']), ([], [first]))
+
+class SessionManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for patcher in [mock.patch.object(record, 'SESSIONS_DIR', self.directory),
+                        mock.patch.dict(User.users, clear=True),
+                        mock.patch.dict(User.new_users, clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = SessionManager(check_interval=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_user(self, username, level=1):
+        """Write the user's file and line as another process would."""
+        User(username=username, pw_hash='x', level=level, new=True)
+        with redirect_stdout(StringIO()):
+            User.write_new()
+        self.assertTrue(WRITER.flush(5))
+        User.new_users.clear()
+        del User.users[username]
+        # A later modification time than any earlier version of the file
+        path = User.get_path(username)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + level * 1000000000))
+
+    def test_users_read_when_changed(self):
+        self.write_user('ana')
+        with mock.patch.object(User, 'from_file', wraps=User.from_file) as from_file:
+            self.assertEqual(self.manager.get_user('ana').level, 1)
+            self.assertIs(self.manager.get_user('ana', use_anon=False), User.users['ana'])
+            self.assertEqual(from_file.call_count, 1)
+            # Changed by another process
+            self.write_user('ana', level=2)
+            self.assertEqual(self.manager.get_user('ana').level, 2)
+            self.assertEqual(from_file.call_count, 2)
+
+    def test_unreadable_user_file(self):
+        self.write_user('ana')
+        path = User.get_path('ana')
+        os.rename(path, path + '.bak')
+        # Being replaced
+        open(path, 'w').close()
+        with redirect_stdout(StringIO()):
+            self.assertIsNone(self.manager.get_user('ana', use_anon=False))
+        os.replace(path + '.bak', path)
+        self.assertEqual(self.manager.get_user('ana', use_anon=False).username, 'ana')
+
+    def test_memory(self):
+        with redirect_stdout(StringIO()):
+            memory = self.manager.memory('ana')
+        self.assertIs(self.manager.memory('ana'), memory)
+        self.assertEqual(self.manager.memory('bea').id, memory.id)
+        # Another process rotates the log.
+        with redirect_stdout(StringIO()):
+            Memory(id=memory.id).rotate()
+        current = MemoryManifest().current()
+        self.assertNotEqual(current, memory.id)
+        self.assertEqual(self.manager.memory('ana').id, current)
+
+if __name__ == '__main__':
+    unittest.main()
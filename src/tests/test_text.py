@@ -0,0 +1,104 @@
+#
+#   Mainumby: tests for the HTML of the sentences in stored Texts.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+
+import os, shutil, sqlite3, tempfile, unittest, zipfile
+
+from kuaa.utils import oradoc_html, iter_txt_paragraphs, iter_docx_paragraphs, \
+     iter_chunks, text_from_doc, DOCX_BODY
+
+TEXT_DB = os.path.join(os.path.dirname(__file__), os.pardir, 'kuaa', 'text.db')
+
+DOCX_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:body>
+<w:p><w:r><w:t>El perro llegó </w:t></w:r><w:r><w:t>a su casa.</w:t></w:r></w:p>
+<w:tbl><w:tr><w:tc><w:p><w:r><w:t>En una tabla</w:t></w:r></w:p></w:tc></w:tr></w:tbl>
+<w:p><w:r><w:t>Uno</w:t><w:tab/><w:t>dos</w:t><w:br/><w:t>tres</w:t></w:r></w:p>
+<w:p/>
+</w:body>
+</w:document>
+"""
+
+class TextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_segment_html_same_as_document(self):
+        """
+        The HTML of each TextSeg in text.db was made by mbojereha's
+        Document.set_html(); oradoc_html(), which replaced it in
+        Text.segment_paragraphs(), must make the same HTML.
+        """
+        db = self.path('text.db')
+        shutil.copy(TEXT_DB, db)
+        conn = sqlite3.connect(db)
+        try:
+            rows = conn.execute('SELECT "index", content, html FROM textsegs').fetchall()
+        finally:
+            conn.close()
+        self.assertTrue(rows)
+        for index, content, html in rows:
+            self.assertEqual(oradoc_html(index, content), html)
+
+    def test_txt_paragraphs(self):
+        with open(self.path('a.txt'), 'w', encoding='utf8') as file:
+            file.write("\nUno\ndos\n\n\n  \ntres\n")
+        self.assertEqual(list(iter_txt_paragraphs(self.path('a.txt'))),
+                         ["Uno\ndos", "tres"])
+
+    def test_docx_paragraphs(self):
+        with zipfile.ZipFile(self.path('a.docx'), 'w') as docx:
+            docx.writestr(DOCX_BODY, DOCX_XML)
+        # Paragraphs in tables aren't in the body, as in python-docx
+        self.assertEqual(list(iter_docx_paragraphs(self.path('a.docx'))),
+                         ["El perro llegó a su casa.", "Uno\tdos\ntres", ""])
+
+    def test_bad_docx(self):
+        with open(self.path('a.docx'), 'w') as file:
+            file.write("no es un zip")
+        self.assertIsNone(text_from_doc(self.path('a.docx')))
+
+    def test_chunks(self):
+        paragraphs = ["Una oración corta.", "Otra oración un poco más larga que la primera."]
+        chunks = list(iter_chunks(paragraphs, size=20))
+        self.assertEqual(chunks, [("Una oración corta.\n\n", True),
+                                  ("Otra oración un ", False),
+                                  ("poco más larga que ", False),
+                                  ("la primera.", True)])
+        # A word longer than size isn't split.
+        self.assertEqual(list(iter_chunks(["palabralarguísima fin"], size=5)),
+                         [("palabralarguísima ", False), ("fin", True)])
+
+if __name__ == '__main__':
+    unittest.main()
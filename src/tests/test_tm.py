@@ -0,0 +1,103 @@
+#
+#   Mainumby: tests for the translation memory index.
+#
+########################################################################
+#
+#   This file is part of the PLoGS project
+#   for parsing, generation, translation, and computer-assisted
+#   human translation.
+#
+#   Copyleft 2026 PLoGS <gasser@indiana.edu>
+#
+#   This program is free software: you can redistribute it and/or
+#   modify it under the terms of the GNU General Public License as
+#   published by the Free Software Foundation, either version 3 of
+#   the License, or (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# =========================================================================
+
+import os, shutil, tempfile, unittest
+from unittest import mock
+
+from kuaa import record
+from kuaa.reclog import RecordLog
+from kuaa.tm import TMIndex, match_case, MAX_POSTINGS
+
+MEMORY_ID = '20261001120000'
+
+def sentence_record(source, target, pair=None, user='anon'):
+    """A record as SentRecord.to_dict() makes it."""
+    d = {'src': {'raw': source}, 'trg': target, 'user': user}
+    if pair:
+        d['lang'] = pair
+    return d
+
+class TMIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.object(record, 'SESSIONS_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.log = RecordLog(os.path.join(self.directory, MEMORY_ID + record.MEMLOG_EXT))
+        self.log.create()
+        self.log.append([sentence_record("El perro ladra.", "Jagua hei."),
+                         # From before records had a language pair
+                         sentence_record("El gato duerme.", "Mbarakaja oke.")])
+        self.index = TMIndex(self.directory, refresh_interval=0)
+
+    def tearDown(self):
+        record.Memory.listeners.remove(self.index.memory_recorded)
+        shutil.rmtree(self.directory)
+
+    def test_lookup(self):
+        self.assertEqual([e.target for e in self.index.lookup("el  perro ladra.")], ["Jagua hei."])
+        self.assertEqual([e.target for e in self.index.lookup("El gato duerme.", pair='spa-grn')],
+                         ["Mbarakaja oke."])
+        self.assertEqual(self.index.lookup("El gato duerme.", pair='grn-spa'), [])
+
+    def test_new_records_read(self):
+        self.index.load()
+        self.assertEqual(len(self.index), 2)
+        # Another process adds records, a new translation and one for another pair.
+        self.log.append([sentence_record("El perro ladra.", "Jagua hesapukái.", pair='spa-grn'),
+                         sentence_record("Jagua hei.", "El perro ladra.", pair='grn-spa')])
+        self.assertEqual([e.target for e in self.index.lookup("El perro ladra.")],
+                         ["Jagua hesapukái.", "Jagua hei."])
+        self.assertEqual([e.target for e in self.index.lookup("Jagua hei.", pair='grn-spa')],
+                         ["El perro ladra."])
+        # Nothing is added twice when the log is read again.
+        self.index.files.clear()
+        self.index.load()
+        self.assertEqual(len(self.index), 4)
+
+    def test_fuzzy(self):
+        self.index.add("El perro negro ladra mucho.", "Jagua hũ hei heta.")
+        matches = self.index.fuzzy("El perro blanco ladra mucho.")
+        self.assertEqual([e.target for s, e in matches], ["Jagua hũ hei heta."])
+        self.assertGreaterEqual(matches[0][0], 0.7)
+        self.assertEqual(self.index.fuzzy("El perro blanco ladra mucho.", pair='grn-spa'), [])
+
+    def test_frequent_grams(self):
+        for i in range(MAX_POSTINGS + 1):
+            self.index.add("La oración {}.".format(i), "Ñe'ẽ {}.".format(i))
+        self.assertIn(('la',), self.index.frequent)
+        self.assertNotIn(('la',), self.index.grams)
+        self.assertEqual([e.target for s, e in self.index.fuzzy("La oración 7.")][0], "Ñe'ẽ 7.")
+
+    def test_match_case(self):
+        self.assertEqual(match_case("jagua hei.", "El perro ladra."), "Jagua hei.")
+        self.assertEqual(match_case("Jagua hei.", "el perro ladra."), "jagua hei.")
+        self.assertEqual(match_case("¡Jagua hei!", "¡el perro ladra!"), "¡jagua hei!")
+        self.assertEqual(match_case("123", "El perro."), "123")
+
+if __name__ == '__main__':
+    unittest.main()